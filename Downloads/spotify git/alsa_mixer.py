@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import threading
+import subprocess
+import logging
+from typing import Optional
+
+from request_timing import span
+
+# Importa pyalsaaudio solo se disponibile (Raspberry Pi / Linux con ALSA)
+try:
+    import alsaaudio
+    ALSA_AVAILABLE = True
+except ImportError:
+    ALSA_AVAILABLE = False
+    alsaaudio = None
+
+
+class AlsaMixer:
+    """Controllo del mixer ALSA locale
+
+    Mantiene aperto un handle del mixer tramite pyalsaaudio, evitando un
+    fork/exec di amixer ad ogni variazione; il comando amixer resta come
+    fallback. Supporta rampe di volume (fade-in/fade-out).
+    """
+
+    def __init__(self):
+        self.control = os.getenv('ALSA_MIXER_CONTROL', 'Master')
+        self.card_index = int(os.getenv('ALSA_CARD_INDEX', -1))
+        self.device = os.getenv('ALSA_MIXER_DEVICE', 'default')
+        self.ramp_step_ms = int(os.getenv('VOLUME_RAMP_STEP_MS', 20))
+        self.alsa_available = ALSA_AVAILABLE
+
+        self._mixer = None
+        self._lock = threading.Lock()
+        # Ogni nuova rampa o impostazione diretta annulla quella in corso
+        self._ramp_generation = 0
+
+    def _get_mixer(self):
+        """Apre (una sola volta) l'handle del mixer ALSA"""
+        if not self.alsa_available:
+            return None
+        if self._mixer is None:
+            try:
+                if self.card_index >= 0:
+                    self._mixer = alsaaudio.Mixer(control=self.control, cardindex=self.card_index)
+                else:
+                    self._mixer = alsaaudio.Mixer(control=self.control, device=self.device)
+                logging.info(f"Mixer ALSA '{self.control}' aperto")
+            except Exception as e:
+                logging.warning(f"Mixer ALSA non disponibile, uso amixer: {e}")
+                self.alsa_available = False
+        return self._mixer
+
+    def set_volume(self, volume: int) -> bool:
+        """Imposta il volume (0-100) annullando eventuali rampe in corso"""
+        return self._apply(volume, self._next_generation())
+
+    def _next_generation(self) -> int:
+        with self._lock:
+            self._ramp_generation += 1
+            return self._ramp_generation
+
+    def _apply(self, volume: int, generation: int) -> bool:
+        """Scrive il volume se nel frattempo non è iniziata un'impostazione più recente"""
+        volume = max(0, min(100, int(volume)))
+        with self._lock:
+            # Verificato sotto lock: un passo di rampa superato non sovrascrive il nuovo valore
+            if generation != self._ramp_generation:
+                return False
+            mixer = self._get_mixer()
+            if mixer:
+                try:
+                    mixer.setvolume(volume)
+                    return True
+                except Exception as e:
+                    # Handle non più valido (es. scheda riavviata): riapre alla prossima chiamata
+                    logging.error(f"Errore nel mixer ALSA: {e}")
+                    self._mixer = None
+
+            return self._set_volume_subprocess(volume)
+
+    def get_volume(self) -> Optional[int]:
+        """Restituisce il volume corrente (0-100)"""
+        with self._lock:
+            mixer = self._get_mixer()
+            if mixer:
+                try:
+                    return int(mixer.getvolume()[0])
+                except Exception as e:
+                    logging.error(f"Errore nella lettura mixer ALSA: {e}")
+                    self._mixer = None
+
+        try:
+            with span('subprocess.amixer'):
+                result = subprocess.run(self._amixer_args('get'), capture_output=True, text=True, check=True)
+            match = re.search(r'\[(\d+)%\]', result.stdout)
+            return int(match.group(1)) if match else None
+        except Exception as e:
+            logging.error(f"Errore nella lettura volume locale: {e}")
+            return None
+
+    def ramp(self, target: int, duration_ms: int, start: Optional[int] = None, blocking: bool = False) -> bool:
+        """Porta il volume a target in duration_ms con passi lineari (fade)"""
+        generation = self._next_generation()
+
+        if start is None:
+            start = self.get_volume()
+        if start is None or duration_ms <= 0:
+            return self._apply(target, generation)
+
+        if blocking:
+            with span('volume_ramp'):
+                return self._run_ramp(generation, start, target, duration_ms)
+
+        threading.Thread(
+            target=self._run_ramp, args=(generation, start, target, duration_ms), daemon=True
+        ).start()
+        return True
+
+    def _run_ramp(self, generation: int, start: int, target: int, duration_ms: int) -> bool:
+        steps = max(1, duration_ms // self.ramp_step_ms)
+        interval = duration_ms / 1000 / steps
+        for step in range(1, steps + 1):
+            if generation != self._ramp_generation:
+                logging.debug("Rampa volume annullata")
+                return False
+            if not self._apply(round(start + (target - start) * step / steps), generation):
+                return False
+            if step < steps:
+                time.sleep(interval)
+        logging.info(f"Rampa volume completata: {start}% -> {target}% in {duration_ms} ms")
+        return True
+
+    def _amixer_args(self, command: str, *values: str) -> list:
+        args = ['amixer']
+        if self.card_index >= 0:
+            args += ['-c', str(self.card_index)]
+        return args + [command, self.control, *values]
+
+    def _set_volume_subprocess(self, volume: int) -> bool:
+        """Fallback: imposta il volume con amixer"""
+        try:
+            with span('subprocess.amixer'):
+                subprocess.run(self._amixer_args('set', f'{volume}%'), capture_output=True, check=True)
+            return True
+        except (subprocess.CalledProcessError, OSError) as e:
+            logging.error(f"Errore nel controllo volume locale: {e}")
+            return False
+
+    def close(self):
+        """Chiude l'handle del mixer"""
+        with self._lock:
+            if self._mixer:
+                try:
+                    self._mixer.close()
+                except Exception:
+                    pass
+                self._mixer = None
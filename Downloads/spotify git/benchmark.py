@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end di Spotify Raspberry Pi Controller
+
+Avvia l'applicazione completa (SpotifyManager, GPIOManager, interfaccia web
+su waitress) contro il server finto delle API Spotify e misura:
+- latenza pressione GPIO -> comando Spotify completato (p50/p95/p99), con
+  pressioni generate dal driver GPIO simulato (rimbalzi inclusi)
+- correttezza del debounce e throughput dei fronti (sequenze programmate)
+- latenza dei comandi HTTP (POST /api/toggle fino all'esito del comando)
+- richieste/secondo e latenza di N client che interrogano /api/status
+- chiamate Spotify per azione utente
+- CPU e memoria (RSS) del processo
+
+I risultati vengono salvati in JSON con la versione di version.py, così le
+regressioni tra versioni si confrontano con --compare.
+
+Uso:
+    python benchmark.py --presses 50 --commands 50 --pollers 20 --duration 10
+    python benchmark.py --compare benchmarks/benchmark-1.2.1-20250804-120000.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# CPU e memoria del processo: psutil se disponibile, altrimenti resource (solo POSIX)
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+    import resource
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_PASSWORD = 'benchmark'
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentile con interpolazione lineare (None senza campioni)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(samples: List[float]) -> Dict[str, Any]:
+    """Riepilogo in millisecondi di una lista di durate in secondi"""
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        'count': len(samples),
+        'p50_ms': ms(percentile(samples, 50)),
+        'p95_ms': ms(percentile(samples, 95)),
+        'p99_ms': ms(percentile(samples, 99)),
+        'max_ms': ms(max(samples) if samples else None),
+        'mean_ms': ms(sum(samples) / len(samples) if samples else None)
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ProcessSampler:
+    """Misura CPU e RSS del processo durante uno scenario"""
+
+    def __init__(self):
+        self.process = psutil.Process() if PSUTIL_AVAILABLE else None
+
+    def _cpu_seconds(self) -> float:
+        if self.process:
+            times = self.process.cpu_times()
+            return times.user + times.system
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def _memory(self) -> Dict[str, float]:
+        if self.process:
+            return {'rss_mb': round(self.process.memory_info().rss / 1024 / 1024, 1)}
+        # Senza psutil è disponibile solo il picco (ru_maxrss, KB su Linux)
+        return {'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+    def start(self):
+        self._cpu_start = self._cpu_seconds()
+        self._wall_start = time.perf_counter()
+
+    def stop(self) -> Dict[str, Any]:
+        wall = time.perf_counter() - self._wall_start
+        cpu = self._cpu_seconds() - self._cpu_start
+        return {
+            'cpu_seconds': round(cpu, 3),
+            'cpu_percent': round(cpu / wall * 100, 1) if wall > 0 else None,
+            **self._memory()
+        }
+
+
+class Benchmark:
+    """Scenari di benchmark sull'applicazione completa"""
+
+    def __init__(self, args):
+        self.args = args
+        self.results: Dict[str, Any] = {}
+        self.sampler = ProcessSampler()
+
+    def setup(self):
+        """Avvia il server Spotify finto e l'applicazione in una cartella temporanea"""
+        from fake_spotify_server import FakeSpotifyServer, write_token_cache
+
+        self.workdir = tempfile.mkdtemp(prefix='spotify-benchmark-')
+        os.chdir(self.workdir)
+
+        self.fake = FakeSpotifyServer(
+            port=0, latency_ms=self.args.latency, jitter_ms=self.args.jitter,
+            error_rate=self.args.error_rate, rate_limit_rate=self.args.rate_limit_rate,
+            seed=self.args.seed
+        ).start()
+        write_token_cache('.spotify_cache')
+
+        self.web_port = free_port()
+        os.environ.update({
+            'DEMO_MODE': 'False',
+            'SPOTIFY_API_BASE_URL': self.fake.base_url,
+            'SPOTIFY_CLIENT_ID': 'benchmark',
+            'SPOTIFY_CLIENT_SECRET': 'benchmark',
+            'SPOTIFY_REDIRECT_URI': 'http://127.0.0.1/callback',
+            'DEFAULT_DEVICE_NAME': 'SistemaPalestra',
+            'WEB_PASSWORD': BENCHMARK_PASSWORD,
+            'WEB_HOST': '127.0.0.1',
+            'WEB_PORT': str(self.web_port),
+            'WEB_THREADS': str(self.args.web_threads),
+            'PREWARM_ENABLED': 'False',
+            'GPIO_BACKEND': 'simulated',
+            'SLOW_REQUEST_THRESHOLD_MS': '60000'
+        })
+
+        sys.path.insert(0, APP_DIR)
+        import web_interface
+        from web_server import WebServer
+
+        self.web_interface = web_interface
+        web_interface.init_managers()
+        self.web_server = WebServer(web_interface.app)
+        self.web_server.start()
+        self.base_url = f'http://127.0.0.1:{self.web_port}'
+        self._wait_for_web()
+
+        self.session = requests.Session()
+        self.session.post(f'{self.base_url}/login', data={'password': BENCHMARK_PASSWORD})
+
+        # Attende la sincronizzazione del catalogo, che altrimenti si somma al primo scenario
+        catalog = web_interface.spotify_manager.playlist_catalog
+        deadline = time.time() + 60
+        while time.time() < deadline and (catalog.get_status()['syncing'] or not catalog.get_status()['last_sync']):
+            time.sleep(0.1)
+        time.sleep(self.args.warmup)
+
+    def _wait_for_web(self, timeout: float = 10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                requests.get(f'{self.base_url}/login', timeout=1)
+                return
+            except requests.ConnectionError:
+                time.sleep(0.05)
+        raise RuntimeError("Interfaccia web non raggiungibile")
+
+    def teardown(self):
+        from service_registry import services
+        self.web_interface.status_events.close()
+        self.web_server.stop(timeout=2)
+        services.shutdown()
+        self.fake.stop()
+        os.chdir(APP_DIR)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _spotify_calls(self) -> Dict[str, Any]:
+        return self.fake.get_stats()
+
+    def _measure_idle_rate(self, seconds: float = 2.0) -> float:
+        """Chiamate Spotify al secondo senza azioni utente (polling in background)"""
+        before = self._spotify_calls()['total']
+        time.sleep(seconds)
+        return (self._spotify_calls()['total'] - before) / seconds
+
+    def _calls_per_action(self, before: Dict[str, Any], after: Dict[str, Any], elapsed: float,
+                          actions: int) -> Dict[str, Any]:
+        routes = {
+            route: count - before['routes'].get(route, 0)
+            for route, count in after['routes'].items()
+            if count - before['routes'].get(route, 0) > 0
+        }
+        total = after['total'] - before['total']
+        # Sottrae il traffico di fondo (poller) misurato a riposo
+        attributable = max(0.0, total - self.idle_rate * elapsed)
+        return {
+            'total_calls': total,
+            'background_calls_estimate': round(self.idle_rate * elapsed, 1),
+            'per_action': round(attributable / actions, 2) if actions else None,
+            'routes': routes
+        }
+
+    def run_gpio(self):
+        """Pressioni simulate del pulsante, con rimbalzi, tramite il driver GPIO simulato"""
+        gpio_manager = self.web_interface.gpio_manager
+        if gpio_manager is None:
+            self.results['gpio'] = {'error': 'GPIO manager non disponibile'}
+            return
+        if not gpio_manager.is_monitoring:
+            gpio_manager.start_monitoring()
+
+        # Il manager conserva solo le ultime 100 latenze: durante lo scenario le
+        # raccoglie tutte in una deque senza limite, ripristinata alla fine
+        recent_latencies = gpio_manager.action_latencies
+        gpio_manager.action_latencies = deque()
+        interval = max(self.args.press_interval, gpio_manager.debounce_time + 0.01)
+        before = self._spotify_calls()
+        self.sampler.start()
+        started_at = time.perf_counter()
+
+        for _ in range(self.args.presses):
+            pressed_at = time.monotonic()
+            gpio_manager.backend.press(gpio_manager.gpio_pin, hold=self.args.hold, bounce=self.args.bounce,
+                                       bounce_interval=self.args.bounce_interval)
+            time.sleep(max(0.0, interval - (time.monotonic() - pressed_at)))
+        # Attende lo svuotamento della coda azioni
+        deadline = time.time() + 30
+        while gpio_manager.action_queue.qsize() and time.time() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.2)
+
+        elapsed = time.perf_counter() - started_at
+        latencies = list(gpio_manager.action_latencies)
+        recent_latencies.clear()
+        recent_latencies.extend(latencies)
+        gpio_manager.action_latencies = recent_latencies
+        self.results['gpio'] = {
+            'presses': self.args.presses,
+            'press_to_command': latency_summary(latencies),
+            'stats': gpio_manager.get_action_stats(),
+            'spotify_calls': self._calls_per_action(before, self._spotify_calls(), elapsed, len(latencies)),
+            'process': self.sampler.stop()
+        }
+
+    def run_debounce(self):
+        """Sequenze programmate con rimbalzi: trigger attesi contro trigger accettati
+
+        Non usa Spotify né il tempo reale: i fronti hanno timestamp sintetici, quindi
+        il risultato è deterministico e misura anche il throughput del filtro.
+        """
+        from gpio_backends import SimulatedBackend
+        from gpio_manager import GPIOManager
+
+        backend = SimulatedBackend(socket_path='')
+        manager = GPIOManager(None, backend=backend)
+        triggers = []
+        # Conta i trigger che superano il debounce senza eseguire azioni
+        manager.enqueue_trigger = triggers.append
+        manager.start_monitoring()
+
+        presses = self.args.debounce_presses
+        spacing = max(self.args.press_interval, manager.debounce_time + self.args.hold)
+        script = []
+        for i in range(presses):
+            script.extend(backend.press_script(i * spacing, self.args.hold, self.args.bounce,
+                                               self.args.bounce_interval))
+
+        started_at = time.perf_counter()
+        rising = backend.play_script(manager.gpio_pin, script, realtime=False, start=1000.0)
+        elapsed = time.perf_counter() - started_at
+        manager.cleanup()
+
+        self.results['debounce'] = {
+            'presses': presses,
+            'bounce': self.args.bounce,
+            'bounce_interval_ms': self.args.bounce_interval * 1000,
+            'debounce_time': manager.debounce_time,
+            'rising_edges': rising,
+            'triggers': len(triggers),
+            'missed': max(0, presses - len(triggers)),
+            'spurious': max(0, len(triggers) - presses),
+            'correct': len(triggers) == presses,
+            'edges_per_second': round(rising / elapsed) if elapsed else None
+        }
+
+    def run_commands(self):
+        """Comandi HTTP: POST /api/toggle e attesa dell'esito tramite Location"""
+        latencies, failures = [], 0
+        before = self._spotify_calls()
+        self.sampler.start()
+        started_at = time.perf_counter()
+
+        for _ in range(self.args.commands):
+            sent_at = time.perf_counter()
+            response = self.session.post(f'{self.base_url}/api/toggle', json={})
+            if response.status_code != 202:
+                failures += 1
+                continue
+            location = response.headers['Location']
+            while True:
+                job = self.session.get(f'{self.base_url}{location}' if location.startswith('/') else location).json()
+                if job.get('status') in ('succeeded', 'failed'):
+                    break
+                time.sleep(0.005)
+            latencies.append(time.perf_counter() - sent_at)
+            if job['status'] == 'failed':
+                failures += 1
+
+        elapsed = time.perf_counter() - started_at
+        self.results['http_commands'] = {
+            'commands': self.args.commands,
+            'failures': failures,
+            'command_latency': latency_summary(latencies),
+            'spotify_calls': self._calls_per_action(before, self._spotify_calls(), elapsed, len(latencies)),
+            'process': self.sampler.stop()
+        }
+
+    def run_status_pollers(self):
+        """N client che interrogano /api/status in parallelo (con ETag come il browser)"""
+        cookies = self.session.cookies.get_dict()
+        stop_at = time.perf_counter() + self.args.duration
+        latencies: List[float] = []
+        statuses: Dict[int, int] = {}
+        lock = threading.Lock()
+
+        def poller():
+            session = requests.Session()
+            session.cookies.update(cookies)
+            etag = None
+            local_latencies, local_statuses = [], {}
+            while time.perf_counter() < stop_at:
+                headers = {'If-None-Match': etag} if etag else {}
+                sent_at = time.perf_counter()
+                response = session.get(f'{self.base_url}/api/status', headers=headers)
+                local_latencies.append(time.perf_counter() - sent_at)
+                local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+                etag = response.headers.get('ETag', etag)
+                if self.args.poll_interval:
+                    time.sleep(self.args.poll_interval)
+            with lock:
+                latencies.extend(local_latencies)
+                for status, count in local_statuses.items():
+                    statuses[status] = statuses.get(status, 0) + count
+
+        before = self._spotify_calls()
+        self.sampler.start()
+        started_at = time.perf_counter()
+        threads = [threading.Thread(target=poller, daemon=True) for _ in range(self.args.pollers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+        after = self._spotify_calls()
+
+        self.results['status_fanout'] = {
+            'pollers': self.args.pollers,
+            'duration_s': round(elapsed, 2),
+            'requests': len(latencies),
+            'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+            'latency': latency_summary(latencies),
+            'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+            # Con la fan-out condivisa le chiamate Spotify non crescono con i client
+            'spotify_calls_per_second': round((after['total'] - before['total']) / elapsed, 2),
+            'idle_spotify_calls_per_second': round(self.idle_rate, 2),
+            'process': self.sampler.stop()
+        }
+
+    def run(self) -> Dict[str, Any]:
+        self.setup()
+        try:
+            self.idle_rate = self._measure_idle_rate()
+            if self.args.debounce_presses:
+                print(f"[INFO] Debounce: {self.args.debounce_presses} pressioni programmate...")
+                self.run_debounce()
+            if self.args.presses:
+                print(f"[INFO] GPIO: {self.args.presses} pressioni...")
+                self.run_gpio()
+            if self.args.commands:
+                print(f"[INFO] HTTP: {self.args.commands} comandi...")
+                self.run_commands()
+            if self.args.pollers:
+                print(f"[INFO] Stato: {self.args.pollers} client per {self.args.duration}s...")
+                self.run_status_pollers()
+        finally:
+            self.teardown()
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        from version import get_version, get_build_date
+        return {
+            'version': get_version(),
+            'build_date': get_build_date(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'platform': {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'system': platform.platform()
+            },
+            'parameters': {
+                key: value for key, value in vars(self.args).items() if key not in ('output', 'compare')
+            },
+            'results': self.results
+        }
+
+
+# Metriche confrontate tra due esecuzioni (percorso nel JSON)
+COMPARED_METRICS = [
+    ('gpio', 'press_to_command', 'p50_ms'),
+    ('gpio', 'press_to_command', 'p95_ms'),
+    ('gpio', 'press_to_command', 'p99_ms'),
+    ('gpio', 'spotify_calls', 'per_action'),
+    ('debounce', 'spurious'),
+    ('debounce', 'missed'),
+    ('debounce', 'edges_per_second'),
+    ('http_commands', 'command_latency', 'p50_ms'),
+    ('http_commands', 'command_latency', 'p95_ms'),
+    ('http_commands', 'spotify_calls', 'per_action'),
+    ('status_fanout', 'requests_per_second'),
+    ('status_fanout', 'latency', 'p95_ms'),
+    ('status_fanout', 'spotify_calls_per_second'),
+    ('status_fanout', 'process', 'rss_mb'),
+    ('status_fanout', 'process', 'peak_rss_mb'),
+]
+
+
+def _lookup(data: Dict[str, Any], path) -> Optional[float]:
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]):
+    """Stampa le differenze tra due risultati"""
+    print(f"\nConfronto v{previous.get('version')} ({previous.get('timestamp')}) "
+          f"-> v{current.get('version')} ({current.get('timestamp')})")
+    for path in COMPARED_METRICS:
+        old = _lookup(previous.get('results', {}), path)
+        new = _lookup(current.get('results', {}), path)
+        if old is None or new is None:
+            continue
+        delta = f"{(new - old) / old * 100:+.1f}%" if old else 'n/d'
+        print(f"  {'.'.join(path):45} {old:>10} -> {new:>10}  ({delta})")
+
+
+def print_summary(report: Dict[str, Any]):
+    results = report['results']
+    print(f"\n=== Benchmark v{report['version']} ===")
+    if 'gpio' in results and 'press_to_command' in results['gpio']:
+        gpio = results['gpio']
+        latency = gpio['press_to_command']
+        print(f"GPIO pressione->comando: p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, "
+              f"p99 {latency['p99_ms']} ms, chiamate Spotify/azione {gpio['spotify_calls']['per_action']}")
+    if 'debounce' in results:
+        debounce = results['debounce']
+        print(f"Debounce: {debounce['triggers']}/{debounce['presses']} trigger da {debounce['rising_edges']} fronti "
+              f"({'corretto' if debounce['correct'] else 'ERRATO'}), {debounce['edges_per_second']} fronti/s")
+    if 'http_commands' in results:
+        commands = results['http_commands']
+        latency = commands['command_latency']
+        print(f"Comandi HTTP: p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, "
+              f"p99 {latency['p99_ms']} ms, errori {commands['failures']}, "
+              f"chiamate Spotify/azione {commands['spotify_calls']['per_action']}")
+    if 'status_fanout' in results:
+        fanout = results['status_fanout']
+        process = fanout['process']
+        memory = f"RSS {process['rss_mb']} MB" if 'rss_mb' in process else f"RSS picco {process['peak_rss_mb']} MB"
+        print(f"/api/status x{fanout['pollers']}: {fanout['requests_per_second']} req/s, "
+              f"p95 {fanout['latency']['p95_ms']} ms, Spotify {fanout['spotify_calls_per_second']} chiamate/s, "
+              f"CPU {process['cpu_percent']}%, {memory}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark end-to-end contro il server Spotify finto')
+    parser.add_argument('--presses', type=int, default=30, help='Pressioni GPIO simulate')
+    parser.add_argument('--press-interval', type=float, default=0.6, help='Secondi tra le pressioni')
+    parser.add_argument('--hold', type=float, default=0.1, help='Durata di una pressione (s)')
+    parser.add_argument('--bounce', type=int, default=5, help='Rimbalzi per fronte del pulsante simulato')
+    parser.add_argument('--bounce-interval', type=float, default=0.001, help='Intervallo tra i rimbalzi (s)')
+    parser.add_argument('--debounce-presses', type=int, default=1000,
+                        help='Pressioni della sequenza programmata di verifica del debounce')
+    parser.add_argument('--commands', type=int, default=30, help='Comandi HTTP (toggle)')
+    parser.add_argument('--pollers', type=int, default=20, help='Client concorrenti su /api/status')
+    parser.add_argument('--duration', type=float, default=10, help='Durata dello scenario di polling (s)')
+    parser.add_argument('--poll-interval', type=float, default=0.0, help='Pausa tra le richieste di un client (s)')
+    parser.add_argument('--web-threads', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=50, help='Latenza API Spotify simulata (ms)')
+    parser.add_argument('--jitter', type=float, default=10, help='Jitter API Spotify simulato (ms)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--warmup', type=float, default=2.0, help='Attesa iniziale (s)')
+    parser.add_argument('--output', default=os.path.join(APP_DIR, 'benchmarks'), help='Cartella dei risultati JSON')
+    parser.add_argument('--compare', metavar='FILE', help='Risultato precedente da confrontare')
+    args = parser.parse_args()
+
+    report = Benchmark(args).run()
+    print_summary(report)
+
+    os.makedirs(args.output, exist_ok=True)
+    filename = f"benchmark-{report['version']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    path = os.path.join(args.output, filename)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[INFO] Risultati salvati in {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import os
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import request_timing
+
+# Stati di un comando
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+
+class CommandQueue:
+    """Coda dei comandi di riproduzione eseguiti in background
+
+    Gli endpoint di controllo accodano il comando e rispondono subito con un
+    ID; un pool di worker (uno solo di default, così l'ordine dei comandi è
+    preservato) li esegue e ne registra l'esito, consultabile per ID.
+    """
+
+    def __init__(self, on_update: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_update = on_update
+        self.workers = int(os.getenv('COMMAND_WORKERS', 1))
+        self.history_size = int(os.getenv('COMMAND_HISTORY', 100))
+
+        self._jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='command')
+
+    def submit(self, command: str, func: Callable[..., Any], *args,
+               success_message: str = '', error_message: str = '') -> Dict[str, Any]:
+        """Accoda un comando; restituisce il suo record"""
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'command': command,
+            'status': STATUS_QUEUED,
+            'success': None,
+            'message': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'timing': None
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            while len(self._jobs) > self.history_size:
+                self._jobs.popitem(last=False)
+            queued = dict(job)
+
+        self._notify(queued)
+        self._executor.submit(self._run, job['id'], func, args, success_message, error_message)
+        return queued
+
+    def get(self, command_id: str) -> Optional[Dict[str, Any]]:
+        """Restituisce una copia del record del comando"""
+        with self._lock:
+            job = self._jobs.get(command_id)
+            return dict(job) if job else None
+
+    def _update(self, command_id: str, **changes) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(command_id)
+            if job is None:
+                return None
+            job.update(changes)
+            job = dict(job)
+        self._notify(job)
+        return job
+
+    def _notify(self, job: Dict[str, Any]):
+        if self.on_update:
+            try:
+                self.on_update(dict(job))
+            except Exception as e:
+                logging.error(f"Errore nella notifica stato comando: {e}")
+
+    def _run(self, command_id: str, func: Callable[..., Any], args: tuple,
+             success_message: str, error_message: str):
+        """Esegue il comando nel worker e registra l'esito"""
+        job = self._update(command_id, status=STATUS_RUNNING, started_at=time.time())
+        trace = request_timing.start_trace(f"command {job['command'] if job else command_id}")
+        try:
+            result = func(*args)
+            # I metodi del manager che non restituiscono nulla sono considerati riusciti
+            success = result is not False
+        except Exception as e:
+            logging.error(f"Errore nell'esecuzione del comando {command_id}: {e}")
+            success = False
+        finally:
+            request_timing.end_trace()
+
+        job = self._update(
+            command_id,
+            status=STATUS_SUCCEEDED if success else STATUS_FAILED,
+            success=success,
+            message=success_message if success else error_message,
+            finished_at=time.time(),
+            # Fasi del comando (le stesse dell'header Server-Timing delle richieste)
+            timing={name: round(entry['ms'], 1) for name, entry in trace.totals().items()}
+        )
+        request_timing.log_if_slow(trace, command_id=command_id, success=success)
+        if job:
+            logging.info(f"Comando {job['command']} ({command_id}) completato in "
+                         f"{(job['finished_at'] - job['created_at']) * 1000:.0f} ms: {job['status']}")
+
+    def shutdown(self, wait: bool = True):
+        """Ferma i worker (attende i comandi già accodati se wait=True)"""
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
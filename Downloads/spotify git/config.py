@@ -21,6 +21,7 @@ class Config:
     GPIO_PIN = int(os.getenv('GPIO_PIN', 18))
     GPIO_DEBOUNCE_TIME = float(os.getenv('GPIO_DEBOUNCE_TIME', 0.5))
     GPIO_PULL_UP_DOWN = 'PUD_DOWN'  # PUD_UP, PUD_DOWN, PUD_OFF
+    GPIO_BACKEND = os.getenv('GPIO_BACKEND', 'auto')  # auto, rpi, gpiod, simulated
     
     # Configurazione Web
     WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
@@ -87,7 +88,8 @@ class Config:
         return {
             'pin': cls.GPIO_PIN,
             'debounce_time': cls.GPIO_DEBOUNCE_TIME,
-            'pull_up_down': cls.GPIO_PULL_UP_DOWN
+            'pull_up_down': cls.GPIO_PULL_UP_DOWN,
+            'backend': cls.GPIO_BACKEND
         }
     
     @classmethod
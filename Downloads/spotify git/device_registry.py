@@ -0,0 +1,93 @@
+import os
+import time
+import threading
+import logging
+from typing import Callable, Optional, Dict, Any, List
+
+import request_timing
+
+# Nome con cui librespot si presenta su Spotify Connect
+LOCAL_DEVICE_NAME = 'SistemaPalestra'
+LOCAL_DEVICE_NAMES = ['RaspberryPi', 'SistemaPalestra']
+LOCAL_DEVICE_ID = 'local_librespot'
+
+
+class DeviceRegistry:
+    """Cache con TTL dei dispositivi Spotify Connect
+
+    Mantiene indici per ID e per nome, così i comandi risolvono il dispositivo
+    senza una chiamata sp.devices() a ogni pressione di pulsante.
+    """
+
+    def __init__(self, fetch_devices: Callable[[], List[Dict[str, Any]]]):
+        self.fetch_devices = fetch_devices
+        self.ttl = float(os.getenv('DEVICE_CACHE_TTL', 60))
+
+        self.fetched_at = 0.0
+        self._devices = []
+        self._by_id = {}
+        self._by_name = {}
+        self._lock = threading.Lock()
+
+    def _is_fresh(self) -> bool:
+        return bool(self.fetched_at) and time.time() - self.fetched_at < self.ttl
+
+    def refresh(self) -> List[Dict[str, Any]]:
+        """Ricarica i dispositivi da Spotify e ricostruisce gli indici"""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        devices = self.fetch_devices() or []
+        self._devices = devices
+        self._by_id = {device['id']: device for device in devices}
+        self._by_name = {device['name'].lower(): device for device in devices}
+        self.fetched_at = time.time()
+        logging.debug(f"Cache dispositivi aggiornata: {len(devices)} dispositivi")
+        return devices
+
+    def get_devices(self, force: bool = False) -> List[Dict[str, Any]]:
+        """Restituisce i dispositivi, dalla cache se ancora valida"""
+        with self._lock:
+            # Il lock fa sì che chiamanti concorrenti condividano un solo refresh
+            if force or not self._is_fresh():
+                self._refresh()
+            return list(self._devices)
+
+    def get_by_id(self, device_id: str, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Cerca un dispositivo per ID"""
+        self.get_devices(force)
+        return self._by_id.get(device_id)
+
+    def find_by_name(self, name: str, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Cerca un dispositivo per nome (esatto, poi per sottostringa)"""
+        devices = self.get_devices(force)
+        name = name.lower()
+
+        device = self._by_name.get(name)
+        if device:
+            return device
+
+        for device in devices:
+            if name in device['name'].lower():
+                return device
+        return None
+
+    def find_local_device(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Cerca il dispositivo librespot locale tra quelli Spotify"""
+        return self.find_by_name(LOCAL_DEVICE_NAME, force)
+
+    def wait_for_local_device(self, timeout: float, interval: float = 0.5) -> Optional[Dict[str, Any]]:
+        """Attende che il dispositivo locale compaia su Spotify, ricaricando la lista"""
+        deadline = time.time() + timeout
+        while True:
+            device = self.find_local_device(force=True)
+            if device or time.time() >= deadline:
+                return device
+            request_timing.sleep(min(interval, max(0.0, deadline - time.time())), 'wait_local_device')
+
+    def invalidate(self):
+        """Invalida la cache (es. dopo un errore 404 'device not found')"""
+        with self._lock:
+            self.fetched_at = 0.0
+        logging.info("Cache dispositivi invalidata")
@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+"""
+Server finto della Spotify Web API per test offline di carico e latenza
+
+Espone i sottoinsiemi dell'API usati dall'applicazione (dispositivi, stato
+riproduzione, comandi, volume, ricerca, playlist, endpoint token) con
+latenza e jitter configurabili, iniezione di errori 429/5xx e dispositivi
+che compaiono e scompaiono. Tutta la casualità deriva da un seed: latenza
+ed errori dipendono solo dal seed, dalla route e dal numero di chiamata su
+quella route, quindi due esecuzioni con gli stessi parametri producono le
+stesse risposte anche con richieste concorrenti su route diverse.
+
+Uso:
+    python fake_spotify_server.py --port 8900 --latency 80 --jitter 20 --write-cache .spotify_cache
+    SPOTIFY_API_BASE_URL=http://127.0.0.1:8900 python main.py
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, urlencode
+
+LOCAL_DEVICE = {'id': 'fake-device-local', 'name': 'SistemaPalestra', 'type': 'Speaker'}
+OTHER_DEVICES = [
+    {'id': 'fake-device-raspberrypi', 'name': 'raspberrypi', 'type': 'Computer'},
+    {'id': 'fake-device-phone', 'name': 'Telefono', 'type': 'Smartphone'}
+]
+
+
+class FakeSpotify:
+    """Stato simulato dell'account: catalogo, dispositivi e riproduzione"""
+
+    def __init__(self, seed: int = 42, playlists: int = 40, tracks_per_playlist: int = 60,
+                 flap_interval: float = 0.0):
+        self.random = random.Random(seed)
+        self.flap_interval = flap_interval
+        self.started_at = time.time()
+        # URL base del server, per i link di paginazione assoluti
+        self.base_url = ''
+        self.lock = threading.Lock()
+
+        self.tracks = [self._make_track(i) for i in range(max(tracks_per_playlist * 4, 200))]
+        self.playlists = []
+        for i in range(playlists):
+            tracks = self.random.sample(self.tracks, min(tracks_per_playlist, len(self.tracks)))
+            self.playlists.append({
+                'id': f'fakeplaylist{i:04d}',
+                'name': f'Playlist {i + 1}',
+                'uri': f'spotify:playlist:fakeplaylist{i:04d}',
+                'owner': {'id': 'fakeuser', 'display_name': 'Utente di test'},
+                'images': [{'url': f'https://example.invalid/playlist/{i}.jpg', 'width': 300, 'height': 300}],
+                'snapshot_id': f'snapshot-{i}-1',
+                'tracks': tracks
+            })
+
+        self.volume = 70
+        self.is_playing = False
+        self.device_id: Optional[str] = None
+        self.context_uri: Optional[str] = None
+        self.queue: List[Dict[str, Any]] = []
+        self.position = 0
+        self.progress_at = time.time()
+        self.progress_ms = 0
+
+    def _make_track(self, i: int) -> Dict[str, Any]:
+        return {
+            'id': f'faketrack{i:05d}',
+            'name': f'Brano {i + 1}',
+            'uri': f'spotify:track:faketrack{i:05d}',
+            'duration_ms': self.random.randint(120000, 300000),
+            'artists': [{'name': f'Artista {i % 37 + 1}'}],
+            'album': {
+                'name': f'Album {i % 53 + 1}',
+                'images': [{'url': f'https://example.invalid/album/{i % 53}.jpg', 'width': 300, 'height': 300}]
+            }
+        }
+
+    def devices(self) -> List[Dict[str, Any]]:
+        """Dispositivi visibili: quello locale scompare a intervalli se il flapping è attivo"""
+        devices = [dict(device) for device in OTHER_DEVICES]
+        local_visible = True
+        if self.flap_interval > 0:
+            local_visible = int((time.time() - self.started_at) / self.flap_interval) % 2 == 0
+        if local_visible:
+            devices.insert(0, dict(LOCAL_DEVICE))
+        for device in devices:
+            device.update({
+                'is_active': device['id'] == self.device_id,
+                'is_restricted': False,
+                'volume_percent': self.volume
+            })
+        return devices
+
+    def find_device(self, device_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        devices = self.devices()
+        if device_id is None:
+            return next((device for device in devices if device['id'] == self.device_id), None)
+        return next((device for device in devices if device['id'] == device_id), None)
+
+    def current_item(self) -> Optional[Dict[str, Any]]:
+        if not self.queue:
+            return None
+        return self.queue[self.position % len(self.queue)]
+
+    def current_progress(self) -> int:
+        progress = self.progress_ms
+        if self.is_playing:
+            progress += int((time.time() - self.progress_at) * 1000)
+        item = self.current_item()
+        return min(progress, item['duration_ms']) if item else 0
+
+    def set_progress(self, progress_ms: int):
+        self.progress_ms = progress_ms
+        self.progress_at = time.time()
+
+    def playback(self) -> Optional[Dict[str, Any]]:
+        device = self.find_device(None)
+        item = self.current_item()
+        if device is None or item is None:
+            return None
+        return {
+            'device': device,
+            'is_playing': self.is_playing,
+            'progress_ms': self.current_progress(),
+            'item': item,
+            'context': {'uri': self.context_uri, 'type': 'playlist'} if self.context_uri else None,
+            'shuffle_state': False,
+            'repeat_state': 'off',
+            'currently_playing_type': 'track'
+        }
+
+    def playlist_summary(self, playlist: Dict[str, Any]) -> Dict[str, Any]:
+        summary = {key: value for key, value in playlist.items() if key != 'tracks'}
+        summary['tracks'] = {'total': len(playlist['tracks'])}
+        return summary
+
+    def get_playlist(self, playlist_id: str) -> Optional[Dict[str, Any]]:
+        return next((playlist for playlist in self.playlists if playlist['id'] == playlist_id), None)
+
+
+def paginate(items: List[Any], query: Dict[str, List[str]], href: str) -> Dict[str, Any]:
+    limit = int(query.get('limit', ['20'])[0])
+    offset = int(query.get('offset', ['0'])[0])
+    page = items[offset:offset + limit]
+    # Il link alla pagina successiva conserva gli altri parametri (es. q e type della ricerca)
+    next_query = {key: values for key, values in query.items() if key not in ('offset', 'limit')}
+    next_query.update(offset=[str(offset + limit)], limit=[str(limit)])
+    return {
+        'href': href,
+        'items': page,
+        'limit': limit,
+        'offset': offset,
+        'total': len(items),
+        'next': f'{href}?{urlencode(next_query, doseq=True)}' if offset + limit < len(items) else None,
+        'previous': None
+    }
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """Gestore HTTP: instrada le richieste sul FakeSpotify del server"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            sys.stderr.write("[FAKE] %s - %s\n" % (self.address_string(), format % args))
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status: int, payload: Any = None, headers: Optional[Dict[str, str]] = None):
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        if body:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send(status, {'error': {'status': status, 'message': message}}, headers)
+
+    def _dispatch(self, method: str):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self._read_body()
+
+        # Statistiche e reset non subiscono latenza né errori iniettati
+        if url.path == '/__stats':
+            return self._send(200, server.get_stats())
+        if url.path == '/__reset' and method == 'POST':
+            server.reset_stats()
+            return self._send(204)
+
+        route, handler, params = server.match(method, url.path)
+        server.count(route or f'{method} {url.path}')
+
+        delay, fault = server.next_fault(route or f'{method} {url.path}')
+        if delay > 0:
+            time.sleep(delay)
+        if fault == 429:
+            return self._error(429, 'API rate limit exceeded', {'Retry-After': str(server.retry_after)})
+        if fault:
+            return self._error(fault, 'Errore simulato del server')
+
+        if handler is None:
+            return self._error(404, 'Service not found')
+
+        if 'application/x-www-form-urlencoded' in (self.headers.get('Content-Type') or ''):
+            data = {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+        else:
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                return self._error(400, 'Malformed json')
+
+        with server.spotify.lock:
+            status, payload = handler(server.spotify, query, data, *params)
+        self._send(status, payload)
+
+
+# Route: (metodo, regex del path) -> funzione(spotify, query, body, *gruppi) -> (status, payload)
+
+def _token(spotify, query, data):
+    # L'endpoint token restituisce sempre un token valido per un'ora
+    return 200, {
+        'access_token': f'fake-access-token-{int(time.time())}',
+        'token_type': 'Bearer',
+        'expires_in': 3600,
+        'scope': 'user-read-playback-state user-modify-playback-state'
+    }
+
+
+def _me(spotify, query, data):
+    return 200, {'id': 'fakeuser', 'display_name': 'Utente di test', 'product': 'premium'}
+
+
+def _devices(spotify, query, data):
+    return 200, {'devices': spotify.devices()}
+
+
+def _playback(spotify, query, data):
+    playback = spotify.playback()
+    return (200, playback) if playback else (204, None)
+
+
+def _transfer(spotify, query, data):
+    device_ids = data.get('device_ids') or []
+    if not device_ids or not spotify.find_device(device_ids[0]):
+        return 404, {'error': {'status': 404, 'message': 'Device not found'}}
+    spotify.device_id = device_ids[0]
+    if data.get('play'):
+        spotify.is_playing = True
+    return 204, None
+
+
+def _resolve_device(spotify, query):
+    device_id = query.get('device_id', [None])[0]
+    if device_id:
+        if not spotify.find_device(device_id):
+            return False
+        spotify.device_id = device_id
+    return spotify.find_device(None) is not None
+
+
+def _play(spotify, query, data):
+    if not _resolve_device(spotify, query):
+        return 404, {'error': {'status': 404, 'message': 'Device not found', 'reason': 'NO_ACTIVE_DEVICE'}}
+    context_uri = data.get('context_uri')
+    if context_uri:
+        playlist = spotify.get_playlist(context_uri.rsplit(':', 1)[-1])
+        if playlist is None:
+            return 404, {'error': {'status': 404, 'message': 'Context not found'}}
+        spotify.context_uri = context_uri
+        spotify.queue = playlist['tracks']
+        spotify.position = 0
+        spotify.set_progress(0)
+    elif data.get('uris'):
+        spotify.context_uri = None
+        spotify.queue = [track for track in spotify.tracks if track['uri'] in data['uris']]
+        spotify.position = 0
+        spotify.set_progress(0)
+    elif not spotify.queue:
+        spotify.queue = spotify.playlists[0]['tracks'] if spotify.playlists else spotify.tracks
+        spotify.context_uri = spotify.playlists[0]['uri'] if spotify.playlists else None
+    else:
+        spotify.set_progress(spotify.current_progress())
+    spotify.is_playing = True
+    return 204, None
+
+
+def _pause(spotify, query, data):
+    if not _resolve_device(spotify, query):
+        return 404, {'error': {'status': 404, 'message': 'Device not found', 'reason': 'NO_ACTIVE_DEVICE'}}
+    spotify.set_progress(spotify.current_progress())
+    spotify.is_playing = False
+    return 204, None
+
+
+def _skip(step):
+    def handler(spotify, query, data):
+        if not _resolve_device(spotify, query):
+            return 404, {'error': {'status': 404, 'message': 'Device not found', 'reason': 'NO_ACTIVE_DEVICE'}}
+        spotify.position += step
+        spotify.set_progress(0)
+        return 204, None
+    return handler
+
+
+def _volume(spotify, query, data):
+    if not _resolve_device(spotify, query):
+        return 404, {'error': {'status': 404, 'message': 'Device not found', 'reason': 'NO_ACTIVE_DEVICE'}}
+    spotify.volume = max(0, min(100, int(query.get('volume_percent', [spotify.volume])[0])))
+    return 204, None
+
+
+def _search(spotify, query, data):
+    terms = query.get('q', [''])[0].lower().split()
+    matches = [
+        track for track in spotify.tracks
+        if all(term in f"{track['name']} {track['artists'][0]['name']} {track['album']['name']}".lower()
+               for term in terms)
+    ]
+    return 200, {'tracks': paginate(matches, query, f'{spotify.base_url}/v1/search')}
+
+
+def _my_playlists(spotify, query, data):
+    summaries = [spotify.playlist_summary(playlist) for playlist in spotify.playlists]
+    return 200, paginate(summaries, query, f'{spotify.base_url}/v1/me/playlists')
+
+
+def _playlist(spotify, query, data, playlist_id):
+    playlist = spotify.get_playlist(playlist_id)
+    if playlist is None:
+        return 404, {'error': {'status': 404, 'message': 'Not found'}}
+    return 200, spotify.playlist_summary(playlist)
+
+
+def _playlist_tracks(spotify, query, data, playlist_id):
+    playlist = spotify.get_playlist(playlist_id)
+    if playlist is None:
+        return 404, {'error': {'status': 404, 'message': 'Not found'}}
+    items = [{'track': track, 'added_at': '2024-01-01T00:00:00Z'} for track in playlist['tracks']]
+    return 200, paginate(items, query, f'{spotify.base_url}/v1/playlists/{playlist_id}/tracks')
+
+
+ROUTES = [
+    ('POST', r'/api/token', _token),
+    ('GET', r'/v1/me', _me),
+    ('GET', r'/v1/me/player/devices', _devices),
+    ('GET', r'/v1/me/player', _playback),
+    ('GET', r'/v1/me/player/currently-playing', _playback),
+    ('PUT', r'/v1/me/player', _transfer),
+    ('PUT', r'/v1/me/player/play', _play),
+    ('PUT', r'/v1/me/player/pause', _pause),
+    ('POST', r'/v1/me/player/next', _skip(1)),
+    ('POST', r'/v1/me/player/previous', _skip(-1)),
+    ('PUT', r'/v1/me/player/volume', _volume),
+    ('GET', r'/v1/search', _search),
+    ('GET', r'/v1/me/playlists', _my_playlists),
+    ('GET', r'/v1/playlists/([^/]+)', _playlist),
+    # Le versioni recenti di spotipy usano /items al posto di /tracks
+    ('GET', r'/v1/playlists/([^/]+)/(?:tracks|items)', _playlist_tracks),
+]
+
+
+class FakeSpotifyServer(ThreadingHTTPServer):
+    """Server HTTP multi-thread con latenza ed errori deterministici"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8900, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: int = 1, seed: int = 42, flap_interval: float = 0.0,
+                 playlists: int = 40, verbose: bool = False):
+        super().__init__((host, port), FakeSpotifyHandler)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.verbose = verbose
+        self.spotify = FakeSpotify(seed=seed, playlists=playlists, flap_interval=flap_interval)
+        self.spotify.base_url = self.base_url
+
+        self.seed = seed
+        self._fault_calls = Counter()
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._routes = [(method, re.compile(pattern + '$'), handler) for method, pattern, handler in ROUTES]
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def match(self, method: str, path: str) -> Tuple[Optional[str], Any, tuple]:
+        for route_method, pattern, handler in self._routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                return f'{method} {pattern.pattern[:-1]}', handler, match.groups()
+        return None, None, ()
+
+    def next_fault(self, route: str) -> Tuple[float, Optional[int]]:
+        """Latenza ed eventuale errore della prossima richiesta sulla route
+
+        Il generatore è derivato da seed, route e indice della chiamata, così
+        l'ordine in cui i thread concorrenti servono route diverse non cambia
+        l'esito; sulla stessa route la sequenza degli esiti resta fissa.
+        """
+        with self._stats_lock:
+            index = self._fault_calls[route]
+            self._fault_calls[route] += 1
+        rng = random.Random(f'{self.seed}:{route}:{index}')
+        delay = max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+        roll = rng.random()
+        fault_status = rng.choice((500, 502, 503))
+        if roll < self.rate_limit_rate:
+            return delay, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, fault_status
+        return delay, None
+
+    def count(self, route: str):
+        with self._stats_lock:
+            self._stats[route] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {'total': sum(self._stats.values()), 'routes': dict(self._stats)}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+    def start(self):
+        """Avvia il server in un thread (uso da benchmark e test)"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def write_token_cache(path: str):
+    """Scrive un token finto, così l'applicazione parte senza autorizzazione OAuth"""
+    token = {
+        'access_token': 'fake-access-token',
+        'token_type': 'Bearer',
+        'expires_in': 3600,
+        'expires_at': int(time.time()) + 3600,
+        'refresh_token': 'fake-refresh-token',
+        'scope': 'user-read-playback-state user-modify-playback-state user-read-currently-playing '
+                 'playlist-read-private playlist-read-collaborative'
+    }
+    with open(path, 'w') as f:
+        json.dump(token, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Server finto della Spotify Web API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='Latenza media in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Jitter massimo in ms (+/-)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Frazione di risposte 5xx')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Frazione di risposte 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After delle risposte 429 (s)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--flap-interval', type=float, default=0.0,
+                        help='Secondi tra comparsa e scomparsa del dispositivo locale (0 = mai)')
+    parser.add_argument('--playlists', type=int, default=40)
+    parser.add_argument('--write-cache', metavar='PATH', help='Scrive un token finto nel file cache indicato')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.write_cache:
+        write_token_cache(args.write_cache)
+        print(f"[INFO] Token finto scritto in {args.write_cache}")
+
+    server = FakeSpotifyServer(
+        host=args.host, port=args.port, latency_ms=args.latency, jitter_ms=args.jitter,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        seed=args.seed, flap_interval=args.flap_interval, playlists=args.playlists, verbose=args.verbose
+    )
+    print(f"[INFO] Fake Spotify API su {server.base_url} (imposta SPOTIFY_API_BASE_URL={server.base_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Arresto server")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
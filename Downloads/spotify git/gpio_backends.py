@@ -0,0 +1,334 @@
+import os
+import json
+import stat
+import time
+import socket
+import threading
+import logging
+import socketserver
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Driver disponibili solo su Raspberry Pi / Linux con GPIO
+try:
+    import RPi.GPIO as GPIO
+    RPI_GPIO_AVAILABLE = True
+except ImportError:
+    RPI_GPIO_AVAILABLE = False
+    GPIO = None
+
+try:
+    import gpiod
+    from gpiod.line import Bias, Direction, Edge, Value
+    GPIOD_AVAILABLE = hasattr(gpiod, 'request_lines')  # API libgpiod v2
+except ImportError:
+    GPIOD_AVAILABLE = False
+    gpiod = None
+
+# Callback dei fronti di salita: riceve il timestamp (time.monotonic) del fronte
+EdgeCallback = Callable[[float], None]
+
+
+class GPIOBackend(ABC):
+    """Interfaccia dei driver GPIO usati da GPIOManager"""
+
+    name = ''
+    # False per il driver simulato (nessun pin fisico)
+    hardware = True
+
+    @abstractmethod
+    def setup_input(self, pin: int):
+        """Configura il pin come input con pull-down"""
+
+    @abstractmethod
+    def read(self, pin: int) -> bool:
+        """Livello attuale del pin"""
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback) -> bool:
+        """Registra la callback sui fronti di salita (False se non supportato)"""
+        return False
+
+    def remove_edge_callback(self, pin: int):
+        pass
+
+    def release(self, pin: int):
+        """Rilascia un singolo pin"""
+        pass
+
+    def cleanup(self):
+        """Rilascia tutte le risorse del driver"""
+        pass
+
+
+class RPiGPIOBackend(GPIOBackend):
+    """Driver RPi.GPIO (interrupt sui fronti, polling come fallback)"""
+
+    name = 'rpi'
+
+    def __init__(self):
+        GPIO.setmode(GPIO.BCM)
+
+    def setup_input(self, pin: int):
+        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+
+    def read(self, pin: int) -> bool:
+        return GPIO.input(pin) == GPIO.HIGH
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback) -> bool:
+        GPIO.add_event_detect(pin, GPIO.RISING, callback=lambda channel: callback(time.monotonic()))
+        return True
+
+    def remove_edge_callback(self, pin: int):
+        GPIO.remove_event_detect(pin)
+
+    def release(self, pin: int):
+        GPIO.cleanup(pin)
+
+    def cleanup(self):
+        GPIO.cleanup()
+
+
+class GpiodBackend(GPIOBackend):
+    """Driver libgpiod v2 (character device): timestamp dei fronti dal kernel"""
+
+    name = 'gpiod'
+
+    def __init__(self, chip: Optional[str] = None):
+        self.chip = chip or os.getenv('GPIO_CHIP', '/dev/gpiochip0')
+        self._requests = {}
+        self._threads: Dict[int, threading.Thread] = {}
+        self._stop: Dict[int, threading.Event] = {}
+
+    def setup_input(self, pin: int):
+        self.release(pin)
+        self._requests[pin] = gpiod.request_lines(
+            self.chip,
+            consumer='spotify-pi',
+            config={pin: gpiod.LineSettings(
+                direction=Direction.INPUT,
+                bias=Bias.PULL_DOWN,
+                edge_detection=Edge.RISING
+            )}
+        )
+
+    def read(self, pin: int) -> bool:
+        return self._requests[pin].get_value(pin) == Value.ACTIVE
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback) -> bool:
+        request = self._requests[pin]
+        stop = threading.Event()
+
+        def read_events():
+            while not stop.is_set():
+                if not request.wait_edge_events(0.2):
+                    continue
+                for event in request.read_edge_events():
+                    # timestamp_ns è su CLOCK_MONOTONIC, lo stesso orologio di time.monotonic()
+                    callback(event.timestamp_ns / 1e9)
+
+        self._stop[pin] = stop
+        self._threads[pin] = threading.Thread(target=read_events, daemon=True)
+        self._threads[pin].start()
+        return True
+
+    def remove_edge_callback(self, pin: int):
+        stop = self._stop.pop(pin, None)
+        if stop:
+            stop.set()
+        thread = self._threads.pop(pin, None)
+        if thread:
+            thread.join(timeout=1)
+
+    def release(self, pin: int):
+        self.remove_edge_callback(pin)
+        request = self._requests.pop(pin, None)
+        if request:
+            request.release()
+
+    def cleanup(self):
+        for pin in list(self._requests):
+            self.release(pin)
+
+
+class SimulatedBackend(GPIOBackend):
+    """Driver simulato: livelli in memoria e sequenze di fronti programmate
+
+    I fronti si generano da codice (set_level, press, play_script) o da un
+    socket (GPIO_SIM_SOCKET, righe JSON), con timestamp esatti e rumore di
+    rimbalzo, così debounce e throughput si misurano su qualsiasi macchina.
+    """
+
+    name = 'simulated'
+    hardware = False
+
+    def __init__(self, socket_path: Optional[str] = None):
+        self._levels: Dict[int, bool] = {}
+        self._callbacks: Dict[int, EdgeCallback] = {}
+        self._lock = threading.Lock()
+        self.edges = 0
+        self.server = None
+
+        socket_path = socket_path if socket_path is not None else os.getenv('GPIO_SIM_SOCKET', '')
+        if socket_path:
+            self.start_socket(socket_path)
+
+    def setup_input(self, pin: int):
+        with self._lock:
+            self._levels.setdefault(pin, False)
+
+    def read(self, pin: int) -> bool:
+        return self._levels.get(pin, False)
+
+    def add_edge_callback(self, pin: int, callback: EdgeCallback) -> bool:
+        self._callbacks[pin] = callback
+        return True
+
+    def remove_edge_callback(self, pin: int):
+        self._callbacks.pop(pin, None)
+
+    def release(self, pin: int):
+        self.remove_edge_callback(pin)
+        with self._lock:
+            self._levels.pop(pin, None)
+
+    def cleanup(self):
+        self._callbacks.clear()
+        self.stop_socket()
+
+    def set_level(self, pin: int, level: bool, timestamp: Optional[float] = None) -> bool:
+        """Imposta il livello del pin; restituisce True se ha generato un fronte di salita"""
+        with self._lock:
+            previous = self._levels.get(pin, False)
+            self._levels[pin] = bool(level)
+        if level and not previous:
+            self.edges += 1
+            callback = self._callbacks.get(pin)
+            if callback:
+                callback(timestamp if timestamp is not None else time.monotonic())
+            return True
+        return False
+
+    def play_script(self, pin: int, script: Sequence[Tuple[float, int]], realtime: bool = True,
+                    start: Optional[float] = None) -> int:
+        """Esegue una sequenza di (offset in secondi, livello)
+
+        In tempo reale attende ogni offset; altrimenti applica subito i livelli
+        con timestamp sintetici start + offset. Restituisce i fronti di salita.
+        """
+        start = time.monotonic() if start is None else start
+        rising = 0
+        for offset, level in script:
+            if realtime:
+                delay = start + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if self.set_level(pin, bool(level), start + offset):
+                rising += 1
+        return rising
+
+    @staticmethod
+    def press_script(at: float = 0.0, hold: float = 0.1, bounce: int = 0,
+                     bounce_interval: float = 0.001) -> List[Tuple[float, int]]:
+        """Sequenza di una pressione con rimbalzi alla chiusura e al rilascio"""
+        script = []
+        for edge_at, level in ((at, 1), (at + hold, 0)):
+            # Ogni rimbalzo è un'oscillazione completa prima del livello stabile
+            for i in range(bounce):
+                script.append((edge_at + 2 * i * bounce_interval, level))
+                script.append((edge_at + (2 * i + 1) * bounce_interval, 1 - level))
+            script.append((edge_at + 2 * bounce * bounce_interval, level))
+        return script
+
+    def press(self, pin: int, hold: float = 0.1, bounce: int = 0, bounce_interval: float = 0.001,
+              realtime: bool = True, start: Optional[float] = None) -> int:
+        """Simula una pressione del pulsante"""
+        return self.play_script(pin, self.press_script(0.0, hold, bounce, bounce_interval), realtime, start)
+
+    def start_socket(self, path: str):
+        """Accetta comandi JSON, uno per riga, su un socket Unix"""
+        backend = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        reply = backend._handle_command(json.loads(line))
+                    except Exception as e:
+                        reply = {'ok': False, 'error': str(e)}
+                    self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+        # Rimuove solo un socket rimasto da un'esecuzione precedente, mai altri file
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f"{path} esiste e non è un socket: GPIO_SIM_SOCKET non valido")
+            os.unlink(path)
+        self.server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logging.info(f"GPIO simulato in ascolto su {path}")
+
+    def stop_socket(self):
+        if self.server:
+            path = self.server.server_address
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            if isinstance(path, str) and os.path.exists(path):
+                os.unlink(path)
+
+    def _handle_command(self, command: Dict) -> Dict:
+        """Comandi: {"pin", "level"} | {"pin", "script": [[offset, livello], ...]} | {"pin", "press": {...}}"""
+        pin = int(command.get('pin', os.getenv('GPIO_PIN', 18)))
+        realtime = command.get('realtime', True)
+        if 'level' in command:
+            rising = int(self.set_level(pin, bool(command['level'])))
+        elif 'script' in command:
+            rising = self.play_script(pin, [tuple(step) for step in command['script']], realtime)
+        elif 'press' in command:
+            rising = self.press(pin, realtime=realtime, **command['press'])
+        else:
+            raise ValueError("Comando non riconosciuto")
+        return {'ok': True, 'rising_edges': rising, 'level': self.read(pin)}
+
+
+BACKENDS = {
+    'rpi': RPiGPIOBackend,
+    'gpiod': GpiodBackend,
+    'simulated': SimulatedBackend
+}
+
+
+def create_backend(name: Optional[str] = None) -> GPIOBackend:
+    """Crea il driver indicato da GPIO_BACKEND (auto: RPi.GPIO, poi libgpiod, poi simulato)"""
+    name = (name or os.getenv('GPIO_BACKEND', 'auto')).lower()
+    if name == 'auto':
+        if RPI_GPIO_AVAILABLE:
+            name = 'rpi'
+        elif GPIOD_AVAILABLE:
+            name = 'gpiod'
+        else:
+            name = 'simulated'
+
+    if name == 'rpi' and not RPI_GPIO_AVAILABLE:
+        logging.warning("RPi.GPIO non installato, uso il driver simulato")
+        name = 'simulated'
+    elif name == 'gpiod' and not GPIOD_AVAILABLE:
+        logging.warning("libgpiod v2 non installato, uso il driver simulato")
+        name = 'simulated'
+
+    if name not in BACKENDS:
+        raise ValueError(f"GPIO_BACKEND non valido: {name}")
+    return BACKENDS[name]()
+
+
+def send_sim_command(path: str, command: Dict, timeout: float = 30) -> Dict:
+    """Invia un comando al driver simulato tramite il suo socket"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(command) + '\n').encode('utf-8'))
+        return json.loads(sock.makefile().readline())
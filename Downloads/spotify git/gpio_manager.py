@@ -1,38 +1,46 @@
+import math
 import time
+import queue
 import threading
 import logging
-from typing import Callable, Optional
+from collections import deque
+from typing import Callable, Optional, Dict, Any
 import os
 
-# Importa RPi.GPIO solo se disponibile (Raspberry Pi)
-try:
-    import RPi.GPIO as GPIO
-    GPIO_AVAILABLE = True
-except ImportError:
-    GPIO_AVAILABLE = False
-    GPIO = None
+from spotify_scheduler import PRIORITY_GPIO
+from metrics import GPIO_ACTION_LATENCY, GPIO_TRIGGERS
+from gpio_backends import GPIOBackend, create_backend
 
 class GPIOManager:
-    def __init__(self, spotify_manager):
+    def __init__(self, spotify_manager, schedule_engine=None, backend: Optional[GPIOBackend] = None):
         self.spotify_manager = spotify_manager
+        self.schedule_engine = schedule_engine  # Fasce orarie delle playlist
+        self.backend = backend or create_backend()  # Driver GPIO (GPIO_BACKEND)
         self.gpio_pin = int(os.getenv('GPIO_PIN', 18))
         self.is_monitoring = False
         self.monitor_thread = None
         self.last_trigger_time = 0
         self.debounce_time = float(os.getenv('GPIO_DEBOUNCE_TIME', 0.5))  # Tempo di debounce in secondi
-        self.gpio_available = GPIO_AVAILABLE
+        self.gpio_available = self.backend.hardware
+        self.edge_detection = False  # True se il rilevamento fronti è a interrupt
         
-        if self.gpio_available:
-            self._setup_gpio()
-        else:
+        # Coda delle azioni: il rilevamento dei fronti non attende mai Spotify
+        self.action_queue = queue.Queue(maxsize=int(os.getenv('GPIO_ACTION_QUEUE_SIZE', 16)))
+        self.action_thread = None
+        self._action_lock = threading.Lock()  # Un solo worker anche con trigger concorrenti
+        self.action_latencies = deque(maxlen=100)
+        self.dropped_triggers = 0
+        self.coalesced_triggers = 0
+        
+        if not self.gpio_available:
             logging.warning("GPIO non disponibile - modalità simulazione attiva")
+        self._setup_gpio()
         
     def _setup_gpio(self):
         """Configura il pin GPIO"""
         try:
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setup(self.gpio_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-            logging.info(f"GPIO pin {self.gpio_pin} configurato come input")
+            self.backend.setup_input(self.gpio_pin)
+            logging.info(f"GPIO pin {self.gpio_pin} configurato come input (driver {self.backend.name})")
         except Exception as e:
             logging.error(f"Errore nella configurazione GPIO: {e}")
             
@@ -42,48 +50,139 @@ class GPIOManager:
             logging.warning("Monitoraggio GPIO già attivo")
             return
             
-        if not self.gpio_available:
-            logging.info("GPIO non disponibile - monitoraggio simulato")
-            self.is_monitoring = True
+        self.is_monitoring = True
+        
+        # Preferisce il rilevamento dei fronti a interrupt, il polling resta come fallback
+        if self._start_edge_detection():
+            logging.info("Monitoraggio GPIO avviato (rilevamento fronti a interrupt)")
             return
             
-        self.is_monitoring = True
         self.monitor_thread = threading.Thread(target=self._monitor_gpio, daemon=True)
         self.monitor_thread.start()
-        logging.info("Monitoraggio GPIO avviato")
+        logging.info("Monitoraggio GPIO avviato (polling)")
         
     def stop_monitoring(self):
         """Ferma il monitoraggio del pin GPIO"""
         self.is_monitoring = False
+        if self.edge_detection:
+            try:
+                self.backend.remove_edge_callback(self.gpio_pin)
+            except Exception as e:
+                logging.error(f"Errore nella rimozione rilevamento fronti: {e}")
+            self.edge_detection = False
         if self.monitor_thread:
             self.monitor_thread.join(timeout=1)
+            self.monitor_thread = None
         logging.info("Monitoraggio GPIO fermato")
         
+    def _start_edge_detection(self) -> bool:
+        """Registra una callback sul fronte di salita del pin"""
+        try:
+            self.edge_detection = self.backend.add_edge_callback(self.gpio_pin, self._on_edge)
+            return self.edge_detection
+        except Exception as e:
+            logging.warning(f"Rilevamento fronti non disponibile, uso il polling: {e}")
+            return False
+            
+    def _on_edge(self, timestamp: float):
+        """Callback del fronte di salita (eseguita dal thread eventi del driver)"""
+        self._process_edge(timestamp)
+        
+    def _process_edge(self, timestamp: float):
+        """Applica il debounce al timestamp del fronte e gestisce il trigger"""
+        if timestamp - self.last_trigger_time <= self.debounce_time:
+            return
+            
+        self.last_trigger_time = timestamp
+        self.enqueue_trigger(timestamp)
+        
+    def enqueue_trigger(self, timestamp: Optional[float] = None):
+        """Accoda un trigger per il worker delle azioni (non bloccante)"""
+        self._ensure_action_worker()
+        try:
+            self.action_queue.put_nowait(timestamp if timestamp is not None else time.monotonic())
+        except queue.Full:
+            self.dropped_triggers += 1
+            GPIO_TRIGGERS.inc(outcome='dropped')
+            logging.warning("Coda azioni GPIO piena, trigger scartato")
+            
+    def _ensure_action_worker(self):
+        """Avvia il worker delle azioni se non è già attivo"""
+        with self._action_lock:
+            if self.action_thread and self.action_thread.is_alive():
+                return
+            self.action_thread = threading.Thread(target=self._action_worker, daemon=True)
+            self.action_thread.start()
+        
+    def _action_worker(self):
+        """Esegue i trigger accodati, unendo le pressioni ridondanti"""
+        while True:
+            timestamp = self.action_queue.get()
+            if timestamp is None:
+                break
+                
+            # Raccoglie tutte le pressioni arrivate nel frattempo
+            pending = [timestamp]
+            while True:
+                try:
+                    pending.append(self.action_queue.get_nowait())
+                except queue.Empty:
+                    break
+                    
+            stop = None in pending
+            pending = [t for t in pending if t is not None]
+            
+            # Ogni pressione è un toggle: un numero pari di toggle si annulla
+            if len(pending) % 2 == 0:
+                self.coalesced_triggers += len(pending)
+                GPIO_TRIGGERS.inc(len(pending), outcome='coalesced')
+                logging.info(f"{len(pending)} pressioni GPIO in coda si annullano, nessuna azione")
+            elif pending:
+                self.coalesced_triggers += len(pending) - 1
+                GPIO_TRIGGERS.inc(len(pending) - 1, outcome='coalesced')
+                GPIO_TRIGGERS.inc(outcome='executed')
+                with self.spotify_manager.scheduler.priority(PRIORITY_GPIO):
+                    self._handle_gpio_trigger()
+                latency = time.monotonic() - pending[0]
+                self.action_latencies.append(latency)
+                GPIO_ACTION_LATENCY.observe(latency)
+                logging.info(f"Azione GPIO completata in {latency * 1000:.0f} ms")
+                
+            if stop:
+                break
+                
+    def get_action_stats(self) -> Dict[str, Any]:
+        """Statistiche di latenza delle azioni GPIO (pressione -> comando eseguito)"""
+        latencies = sorted(self.action_latencies)
+        stats = {
+            'count': len(latencies),
+            'pending': self.action_queue.qsize(),
+            'dropped': self.dropped_triggers,
+            'coalesced': self.coalesced_triggers
+        }
+        if latencies:
+            stats.update({
+                'last_ms': round(self.action_latencies[-1] * 1000, 1),
+                'avg_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                'p95_ms': round(latencies[math.ceil(len(latencies) * 0.95) - 1] * 1000, 1),
+                'max_ms': round(latencies[-1] * 1000, 1)
+            })
+        return stats
+        
     def _monitor_gpio(self):
-        """Loop principale per il monitoraggio del GPIO"""
-        if self.gpio_available:
-            previous_state = GPIO.input(self.gpio_pin)
-        else:
-            previous_state = False
+        """Loop di polling del GPIO (fallback se il rilevamento fronti non è disponibile)"""
+        previous_state = self.backend.read(self.gpio_pin)
         
         while self.is_monitoring:
             try:
-                if self.gpio_available:
-                    current_state = GPIO.input(self.gpio_pin)
-                    current_time = time.time()
+                current_state = self.backend.read(self.gpio_pin)
+                
+                # Rileva il fronte di salita (da LOW a HIGH)
+                if current_state and not previous_state:
+                    self._process_edge(time.monotonic())
                     
-                    # Rileva il fronte di salita (da LOW a HIGH)
-                    if current_state == GPIO.HIGH and previous_state == GPIO.LOW:
-                        # Controllo debounce
-                        if current_time - self.last_trigger_time > self.debounce_time:
-                            self.last_trigger_time = current_time
-                            self._handle_gpio_trigger()
-                            
-                    previous_state = current_state
-                    time.sleep(0.01)  # Polling ogni 10ms
-                else:
-                    # Modalità simulazione - non fa nulla
-                    time.sleep(0.1)
+                previous_state = current_state
+                time.sleep(0.01)  # Polling ogni 10ms
                 
             except Exception as e:
                 logging.error(f"Errore nel monitoraggio GPIO: {e}")
@@ -102,20 +201,40 @@ class GPIOManager:
                 self.spotify_manager.pause_music()
                 logging.info("Musica messa in pausa tramite GPIO")
             else:
-                # Se non sta suonando, avvia la riproduzione
-                self.spotify_manager.play_music()
+                # Se non sta suonando, avvia la playlist della fascia oraria corrente
+                self.spotify_manager.play_music(self._get_current_playlist())
                 logging.info("Musica avviata tramite GPIO")
                 
         except Exception as e:
             logging.error(f"Errore nella gestione trigger GPIO: {e}")
             
+    def _load_time_periods(self):
+        """Ricarica le fasce orarie dopo una modifica della configurazione"""
+        if self.schedule_engine:
+            self.schedule_engine.reload()
+            
+    def _get_current_time_period_index(self) -> Optional[int]:
+        """Indice della fascia oraria corrente"""
+        if self.schedule_engine:
+            return self.schedule_engine.current_index()
+        return None
+        
+    def _get_current_playlist(self) -> Optional[str]:
+        """Playlist della fascia oraria corrente (None per la playlist di default)"""
+        if self.schedule_engine:
+            return self.schedule_engine.current_playlist()
+        return None
+            
     def set_pin(self, pin_number: int):
         """Cambia il pin GPIO da monitorare"""
         if self.is_monitoring:
             self.stop_monitoring()
             
         # Pulisce il pin precedente
-        GPIO.cleanup(self.gpio_pin)
+        try:
+            self.backend.release(self.gpio_pin)
+        except Exception as e:
+            logging.error(f"Errore nel rilascio pin GPIO: {e}")
         
         # Configura il nuovo pin
         self.gpio_pin = pin_number
@@ -126,7 +245,7 @@ class GPIOManager:
     def get_pin_state(self) -> bool:
         """Restituisce lo stato attuale del pin"""
         try:
-            return bool(GPIO.input(self.gpio_pin))
+            return bool(self.backend.read(self.gpio_pin))
         except Exception as e:
             logging.error(f"Errore nella lettura pin GPIO: {e}")
             return False
@@ -139,14 +258,16 @@ class GPIOManager:
     def cleanup(self):
         """Pulisce le risorse GPIO"""
         self.stop_monitoring()
-        if self.gpio_available:
+        if self.action_thread and self.action_thread.is_alive():
             try:
-                GPIO.cleanup()
-                self.logger.info("GPIO cleanup completato")
-            except Exception as e:
-                self.logger.error(f"Errore nel cleanup GPIO: {e}")
-        else:
-            self.logger.info("GPIO cleanup simulato")
+                self.action_queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+        try:
+            self.backend.cleanup()
+            logging.info(f"GPIO cleanup completato (driver {self.backend.name})")
+        except Exception as e:
+            logging.error(f"Errore nel cleanup GPIO: {e}")
             
     def __del__(self):
         """Destructor per cleanup automatico"""
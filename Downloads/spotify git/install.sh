@@ -63,6 +63,7 @@ install_system_dependencies() {
         git \
         curl \
         alsa-utils \
+        libasound2-dev \
         pulseaudio \
         pulseaudio-utils
     
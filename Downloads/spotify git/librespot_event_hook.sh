@@ -0,0 +1,22 @@
+#!/bin/bash
+
+# Hook --onevent di librespot
+# librespot lo esegue ad ogni evento del player (playing, paused, track_changed,
+# volume_set, ...) passando i dettagli in variabili d'ambiente: lo script le
+# inoltra all'interfaccia web locale, che aggiorna subito lo stato di riproduzione.
+
+EVENT_URL="${LIBRESPOT_EVENT_URL:-http://127.0.0.1:${WEB_PORT:-5000}/api/librespot/event}"
+
+curl -s -o /dev/null -m 1 -X POST "$EVENT_URL" \
+    --data-urlencode "event=${PLAYER_EVENT}" \
+    --data-urlencode "track_id=${TRACK_ID}" \
+    --data-urlencode "old_track_id=${OLD_TRACK_ID}" \
+    --data-urlencode "position_ms=${POSITION_MS}" \
+    --data-urlencode "duration_ms=${DURATION_MS}" \
+    --data-urlencode "volume=${VOLUME}" \
+    --data-urlencode "name=${NAME}" \
+    --data-urlencode "artists=${ARTISTS}" \
+    --data-urlencode "album=${ALBUM}" \
+    --data-urlencode "covers=${COVERS}" &
+
+exit 0
@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+import subprocess
+import logging
+from typing import List, Optional
+
+from metrics import LIBRESPOT_RESTARTS
+from request_timing import span
+
+# Righe di log di librespot che indicano che il dispositivo è pronto
+READY_MARKERS = (
+    'Published zeroconf service',
+    'Authenticated as',
+    'Using Alsa sink',
+)
+
+
+class LibrespotSupervisor:
+    """Supervisore del processo librespot
+
+    Possiede il Popen del processo figlio, lo riavvia con backoff esponenziale
+    se termina e rileva quando il dispositivo è pronto leggendo il suo output,
+    senza attese fisse.
+    """
+
+    def __init__(self):
+        self.binary = os.getenv('LIBRESPOT_BINARY', 'librespot')
+        self.name = os.getenv('LIBRESPOT_NAME', 'RaspberryPi')
+        self.bitrate = os.getenv('LIBRESPOT_BITRATE', '320')
+        self.device_type = os.getenv('LIBRESPOT_DEVICE_TYPE', 'speaker')
+        self.backend = os.getenv('LIBRESPOT_BACKEND', 'alsa')
+        self.initial_volume = os.getenv('LIBRESPOT_INITIAL_VOLUME', '70')
+        self.cache_dir = os.getenv('LIBRESPOT_CACHE', '/tmp/librespot-cache')
+        self.ready_timeout = float(os.getenv('LIBRESPOT_READY_TIMEOUT', 10))
+        self.onevent_hook = os.getenv(
+            'LIBRESPOT_ONEVENT',
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'librespot_event_hook.sh')
+        )
+
+        self.min_backoff = 1.0
+        self.max_backoff = float(os.getenv('LIBRESPOT_MAX_BACKOFF', 60))
+        # Un processo che resta attivo più di così azzera il backoff
+        self.stable_after = 30.0
+        # Intervallo minimo tra due controlli di un librespot avviato esternamente
+        self.external_check_interval = 30.0
+
+        self.process = None
+        self.supervise_thread = None
+        self.is_supervising = False
+        self.restart_count = 0
+        self.ready_event = threading.Event()
+
+        self._stop_event = threading.Event()
+        self._external_running = False
+        self._external_checked_at = 0.0
+
+    def build_args(self) -> List[str]:
+        """Argomenti della riga di comando di librespot"""
+        args = [
+            self.binary,
+            '--name', self.name,
+            '--bitrate', self.bitrate,
+            '--device-type', self.device_type,
+            '--backend', self.backend,
+            '--mixer', 'softvol',
+            '--initial-volume', self.initial_volume,
+            '--volume-ctrl', 'linear',
+            '--cache', self.cache_dir,
+            '--enable-volume-normalisation',
+            '--normalisation-pregain', '-10'
+        ]
+
+        # Hook eventi del player: aggiorna lo stato di riproduzione in push
+        if self.onevent_hook and os.path.exists(self.onevent_hook):
+            args += ['--onevent', self.onevent_hook]
+        return args
+
+    def start(self):
+        """Avvia librespot sotto supervisione (se non già in esecuzione)"""
+        if self.is_supervising:
+            return
+
+        if self._check_external(force=True):
+            logging.info("Librespot già in esecuzione esternamente, supervisione non necessaria")
+            self.ready_event.set()
+            return
+
+        self.is_supervising = True
+        self._stop_event.clear()
+        self.supervise_thread = threading.Thread(target=self._supervise_loop, daemon=True)
+        self.supervise_thread.start()
+        logging.info("Supervisore librespot avviato")
+
+    def stop(self):
+        """Ferma la supervisione e termina il processo figlio"""
+        self.is_supervising = False
+        self._stop_event.set()
+        self.ready_event.clear()
+
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        if self.supervise_thread:
+            self.supervise_thread.join(timeout=1)
+        logging.info("Supervisore librespot fermato")
+
+    def is_running(self) -> bool:
+        """Verifica se librespot è in esecuzione (processo figlio o esterno)"""
+        if self.process and self.process.poll() is None:
+            return True
+        return self._check_external()
+
+    def is_ready(self) -> bool:
+        """Verifica se il dispositivo librespot è pronto"""
+        return self.ready_event.is_set()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Attende che librespot sia pronto; restituisce False allo scadere del timeout"""
+        if timeout is None:
+            timeout = self.ready_timeout
+        return self.ready_event.wait(timeout)
+
+    def notify_event(self, event: str):
+        """Riceve un evento dall'hook --onevent: conferma che librespot è attivo"""
+        if event in ('session_disconnected', 'unavailable'):
+            return
+        if not self.ready_event.is_set():
+            self.ready_event.set()
+            logging.info(f"Librespot pronto (evento {event})")
+
+    def _check_external(self, force: bool = False) -> bool:
+        """Controlla (con cache) se librespot è stato avviato fuori dal supervisore"""
+        if self.is_supervising:
+            return False
+
+        now = time.time()
+        if force or now - self._external_checked_at > self.external_check_interval:
+            try:
+                with span('subprocess.pgrep'):
+                    result = subprocess.run(['pgrep', '-x', 'librespot'], capture_output=True, text=True)
+                self._external_running = result.returncode == 0
+            except Exception as e:
+                logging.warning(f"Impossibile verificare stato librespot: {e}")
+                self._external_running = False
+            self._external_checked_at = now
+
+            if self._external_running:
+                self.ready_event.set()
+            else:
+                self.ready_event.clear()
+        return self._external_running
+
+    def _supervise_loop(self):
+        """Avvia librespot e lo riavvia con backoff quando termina"""
+        backoff = self.min_backoff
+
+        while self.is_supervising:
+            started_at = time.time()
+            try:
+                self.process = subprocess.Popen(
+                    self.build_args(),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    bufsize=1
+                )
+                logging.info(f"Librespot avviato (PID: {self.process.pid})")
+                self._read_output(self.process)
+                exit_code = self.process.wait()
+                logging.warning(f"Librespot terminato con codice {exit_code}")
+            except Exception as e:
+                logging.error(f"Errore nell'avvio librespot: {e}")
+
+            self.ready_event.clear()
+            if not self.is_supervising:
+                break
+
+            if time.time() - started_at > self.stable_after:
+                backoff = self.min_backoff
+
+            self.restart_count += 1
+            LIBRESPOT_RESTARTS.inc()
+            logging.info(f"Riavvio librespot tra {backoff:.0f}s (tentativo {self.restart_count})")
+            if self._stop_event.wait(backoff):
+                break
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _read_output(self, process):
+        """Legge l'output di librespot e segnala quando il dispositivo è pronto"""
+        for line in process.stdout:
+            line = line.rstrip()
+            logging.debug(f"librespot: {line}")
+            if not self.ready_event.is_set() and any(marker in line for marker in READY_MARKERS):
+                self.ready_event.set()
+                logging.info("Librespot pronto")
@@ -12,20 +12,21 @@ import sys
 import logging
 import signal
 import time
-from threading import Thread
 from dotenv import load_dotenv
 
 # Importa i moduli personalizzati
-from spotify_manager import SpotifyManager
-from gpio_manager import GPIOManager
-from web_interface import app, init_managers
+from spotify_scheduler import PRIORITY_POLLING
+from service_registry import services, get_spotify_manager, get_gpio_manager, get_schedule_engine, get_prewarmer
+from web_interface import app, init_managers, status_events
+from web_server import WebServer
 from version import get_version_info
 
 class SpotifyPiController:
     def __init__(self):
         self.spotify_manager = None
         self.gpio_manager = None
-        self.web_thread = None
+        self.schedule_engine = None
+        self.web_server = None
         self.running = False
         
         # Configura logging
@@ -101,14 +102,18 @@ class SpotifyPiController:
         try:
             # Inizializza Spotify Manager
             self.logger.info("Inizializzazione Spotify Manager...")
-            self.spotify_manager = SpotifyManager()
+            self.spotify_manager = get_spotify_manager()
             self.logger.info("Spotify Manager inizializzato con successo")
             
-            # Inizializza GPIO Manager solo su Raspberry Pi
-            if self.is_raspberry_pi():
+            # Fasce orarie delle playlist: timer sui confini, nessun polling
+            self.schedule_engine = get_schedule_engine(self.spotify_manager)
+            # Dispositivo, token e playlist pronti prima di ogni cambio di fascia
+            get_prewarmer(self.spotify_manager)
+            
+            # Inizializza GPIO Manager su Raspberry Pi o con il driver GPIO simulato
+            if self.is_raspberry_pi() or os.getenv('GPIO_BACKEND', '').lower() == 'simulated':
                 self.logger.info("Inizializzazione GPIO Manager...")
-                self.gpio_manager = GPIOManager(self.spotify_manager)
-                self.gpio_manager.start_monitoring()
+                self.gpio_manager = get_gpio_manager(self.spotify_manager)
                 self.logger.info("GPIO Manager inizializzato con successo")
             else:
                 self.logger.warning("Non su Raspberry Pi - GPIO Manager disabilitato")
@@ -127,24 +132,15 @@ class SpotifyPiController:
             return False
             
     def start_web_interface(self):
-        """Avvia l'interfaccia web in un thread separato"""
+        """Avvia l'interfaccia web (waitress in produzione, Flask come fallback)"""
         try:
-            host = os.getenv('WEB_HOST', '0.0.0.0')
-            port = int(os.getenv('WEB_PORT', 5000))
-            
-            self.logger.info(f"Avvio interfaccia web su {host}:{port}")
-            
-            # Inizializza i manager nell'app Flask
+            # L'app Flask riusa i manager già creati dal registro condiviso
             init_managers()
             
-            # Avvia Flask in un thread separato
-            self.web_thread = Thread(
-                target=lambda: app.run(host=host, port=port, debug=False, use_reloader=False),
-                daemon=True
-            )
-            self.web_thread.start()
+            self.web_server = WebServer(app)
+            self.web_server.start()
             
-            self.logger.info(f"Interfaccia web disponibile su http://{host}:{port}")
+            self.logger.info(f"Interfaccia web disponibile su http://{self.web_server.host}:{self.web_server.port}")
             
         except Exception as e:
             self.logger.error(f"Errore nell'avvio interfaccia web: {e}")
@@ -193,7 +189,9 @@ class SpotifyPiController:
             # Verifica connessione Spotify
             if self.spotify_manager:
                 try:
-                    devices = self.spotify_manager.get_devices()
+                    # Traffico di background: non deve competere con i comandi utente
+                    with self.spotify_manager.scheduler.priority(PRIORITY_POLLING):
+                        devices = self.spotify_manager.get_devices()
                     self.logger.debug(f"Dispositivi Spotify disponibili: {len(devices)}")
                 except Exception as e:
                     self.logger.warning(f"Problema connessione Spotify: {e}")
@@ -214,12 +212,14 @@ class SpotifyPiController:
         self.running = False
         
         try:
-            # Ferma GPIO Manager
-            if self.gpio_manager:
-                self.logger.info("Shutdown GPIO Manager...")
-                self.gpio_manager.cleanup()
+            # Chiude i flussi SSE e attende le richieste web in corso
+            if self.web_server:
+                self.logger.info("Shutdown interfaccia web...")
+                status_events.close()
+                self.web_server.stop()
                 
-            # Nota: Flask si chiuderà automaticamente quando il processo termina
+            # Ferma i servizi condivisi (GPIO, poi Spotify) una sola volta
+            services.shutdown()
             
             self.logger.info("Shutdown completato")
             
@@ -0,0 +1,202 @@
+import time
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Bucket di default in secondi: dalle risposte in cache ai timeout di rete
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    """Base delle metriche: valori indicizzati per tupla di etichette"""
+
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Righe dei campioni nel formato di esposizione"""
+
+
+class Counter(_Metric):
+    """Contatore monotono"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        # Senza etichette il contatore è esposto subito (anche a zero)
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}' for key, value in values]
+
+
+class Histogram(_Metric):
+    """Istogramma cumulativo a bucket fissi"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # Per ogni etichetta: conteggi per bucket (non cumulativi), somma, totale
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Misura la durata del blocco"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def get_count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Insieme delle metriche esposte su /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metrica già registrata: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Metriche nel formato di esposizione testuale di Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Registro unico del processo e metriche dell'applicazione
+registry = MetricsRegistry()
+
+SPOTIFY_CALL_DURATION = registry.histogram(
+    'spotify_api_call_duration_seconds',
+    'Durata delle chiamate Spotify per metodo (attesa quota inclusa)',
+    ('method',)
+)
+SPOTIFY_CALL_ERRORS = registry.counter(
+    'spotify_api_call_errors_total',
+    'Chiamate Spotify fallite per metodo e tipo di eccezione',
+    ('method', 'error')
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds',
+    'Durata delle richieste web per route',
+    ('route', 'method')
+)
+HTTP_REQUESTS = registry.counter(
+    'http_requests_total',
+    'Richieste web per route e codice di stato',
+    ('route', 'method', 'status')
+)
+GPIO_ACTION_LATENCY = registry.histogram(
+    'gpio_press_to_action_seconds',
+    'Latenza tra la pressione del pulsante e il comando Spotify completato',
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+)
+GPIO_TRIGGERS = registry.counter(
+    'gpio_triggers_total',
+    'Pressioni del pulsante per esito',
+    ('outcome',)
+)
+LIBRESPOT_RESTARTS = registry.counter(
+    'librespot_restarts_total',
+    'Riavvii del processo librespot da parte del supervisore'
+)
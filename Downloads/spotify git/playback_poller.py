@@ -0,0 +1,187 @@
+import os
+import time
+import threading
+import logging
+from typing import Callable, Optional, Dict, Any
+
+from spotify_scheduler import RequestShed
+from device_registry import LOCAL_DEVICE_NAMES
+
+
+class PlaybackPoller:
+    """Poller in background che possiede lo snapshot della riproduzione corrente.
+
+    Un solo thread interroga Spotify con un intervallo adattivo; tutti i lettori
+    (API web, GPIO, health check) leggono lo snapshot in cache senza generare
+    ulteriori chiamate.
+    """
+
+    def __init__(self, fetch_playback: Callable[[], Optional[Dict[str, Any]]]):
+        self.fetch_playback = fetch_playback
+
+        # Intervalli di polling in secondi
+        self.playing_interval = float(os.getenv('PLAYBACK_POLL_PLAYING', 3))
+        self.idle_interval = float(os.getenv('PLAYBACK_POLL_IDLE', 15))
+        self.boost_interval = float(os.getenv('PLAYBACK_POLL_BOOST', 1))
+        self.boost_duration = float(os.getenv('PLAYBACK_POLL_BOOST_DURATION', 6))
+        # Con gli eventi librespot attivi il polling serve solo a riconciliare
+        self.reconcile_interval = float(os.getenv('PLAYBACK_POLL_RECONCILE', 60))
+
+        self.is_running = False
+        self.poll_thread = None
+        self.version = 0
+        self.updated_at = 0.0
+
+        self._playback = None
+        self._boost_until = 0.0
+        self.local_events_active = False
+        self.last_local_event_at = 0.0
+        self._condition = threading.Condition()
+        self._wake = threading.Event()
+
+    def start(self):
+        """Avvia il thread di polling"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self.poll_thread = threading.Thread(target=self._poll_loop, daemon=True)
+        self.poll_thread.start()
+        logging.info("Poller stato riproduzione avviato")
+
+    def stop(self):
+        """Ferma il thread di polling"""
+        self.is_running = False
+        self._wake.set()
+        if self.poll_thread:
+            self.poll_thread.join(timeout=1)
+        logging.info("Poller stato riproduzione fermato")
+
+    def get_playback(self) -> Optional[Dict[str, Any]]:
+        """Restituisce l'ultimo stato di riproduzione in cache"""
+        return self._playback
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """Restituisce lo snapshot versionato della riproduzione"""
+        with self._condition:
+            return {
+                'version': self.version,
+                'updated_at': self.updated_at,
+                'playback': self._playback
+            }
+
+    def wait_for_change(self, version: int, timeout: Optional[float] = None) -> int:
+        """Attende che la versione dello snapshot superi quella indicata"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version > version, timeout=timeout)
+            return self.version
+
+    def notify_command(self, **changes):
+        """Segnala un comando appena eseguito: accelera il polling e aggiorna subito
+
+        Gli eventuali campi passati (es. is_playing, volume) vengono applicati
+        subito allo snapshot, in attesa della conferma dal polling.
+        """
+        if changes and self._playback:
+            playback = dict(self._playback)
+            playback.update(changes)
+            self._publish(playback)
+
+        self._boost_until = time.time() + self.boost_duration
+        self._wake.set()
+
+    def apply_local_event(self, event: Dict[str, str]):
+        """Applica un evento del player librespot (hook --onevent) allo snapshot"""
+        event_type = event.get('event', '')
+        self.last_local_event_at = time.time()
+
+        if event_type in ('session_disconnected', 'unavailable'):
+            # Il dispositivo locale non è più in uso: torna al polling normale
+            self.local_events_active = False
+            self._wake.set()
+            return
+
+        self.local_events_active = True
+        changes = {}
+
+        if event_type in ('playing', 'started'):
+            changes['is_playing'] = True
+        elif event_type in ('paused', 'stopped'):
+            changes['is_playing'] = False
+
+        if event_type in ('volume_set', 'volume_changed') and event.get('volume'):
+            # librespot esprime il volume su 0-65535
+            changes['volume'] = round(int(event['volume']) * 100 / 65535)
+
+        if event.get('position_ms'):
+            changes['progress_ms'] = int(event['position_ms'])
+
+        if event_type in ('track_changed', 'changed'):
+            if event.get('name'):
+                covers = event.get('covers', '').split('\n')
+                changes.update({
+                    'name': event['name'],
+                    'artist': ', '.join(a for a in event.get('artists', '').split('\n') if a),
+                    'album': event.get('album'),
+                    'album_image': covers[0] or None,
+                    'progress_ms': 0
+                })
+                if event.get('duration_ms'):
+                    changes['duration_ms'] = int(event['duration_ms'])
+            else:
+                # Versioni di librespot senza metadati: serve un refresh via API
+                self._wake.set()
+
+        if changes:
+            playback = dict(self._playback or {})
+            playback.update(changes)
+            self._publish(playback)
+
+    def refresh(self) -> Optional[Dict[str, Any]]:
+        """Interroga Spotify e aggiorna lo snapshot"""
+        try:
+            playback = self.fetch_playback()
+        except RequestShed as e:
+            logging.debug(f"Polling stato riproduzione rimandato: {e}")
+            return self._playback
+        except Exception as e:
+            logging.error(f"Errore nel polling stato riproduzione: {e}")
+            return self._playback
+
+        # La riproduzione è passata a un altro dispositivo (es. il telefono) mentre
+        # librespot resta connesso: i suoi eventi non descrivono più lo stato
+        if self.local_events_active and (not playback or playback.get('device') not in LOCAL_DEVICE_NAMES):
+            logging.info("Riproduzione non più sul dispositivo locale: torno al polling normale")
+            self.local_events_active = False
+
+        self._publish(playback)
+        return playback
+
+    def _publish(self, playback: Optional[Dict[str, Any]]):
+        """Pubblica un nuovo snapshot incrementando la versione se è cambiato"""
+        with self._condition:
+            self.updated_at = time.time()
+            if playback != self._playback:
+                self._playback = playback
+                self.version += 1
+                self._condition.notify_all()
+
+    def _next_interval(self) -> float:
+        """Calcola l'intervallo di polling in base allo stato corrente"""
+        if time.time() < self._boost_until:
+            return self.boost_interval
+        if self.local_events_active and time.time() - self.last_local_event_at > self.reconcile_interval:
+            # Nessun evento locale da un intero ciclo di riconciliazione
+            self.local_events_active = False
+        if self.local_events_active:
+            return self.reconcile_interval
+        if self._playback and self._playback.get('is_playing'):
+            return self.playing_interval
+        return self.idle_interval
+
+    def _poll_loop(self):
+        """Loop principale del poller"""
+        while self.is_running:
+            self.refresh()
+            self._wake.wait(self._next_interval())
+            self._wake.clear()
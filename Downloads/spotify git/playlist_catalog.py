@@ -0,0 +1,338 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from spotify_scheduler import RequestShed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    owner TEXT,
+    image TEXT,
+    tracks_total INTEGER DEFAULT 0,
+    snapshot_id TEXT,
+    tracks_snapshot_id TEXT,
+    position INTEGER,
+    synced_at REAL
+);
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    playlist_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    track_id TEXT,
+    uri TEXT,
+    name TEXT,
+    artists TEXT,
+    duration_ms INTEGER,
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_playlists_position ON playlists (position);
+CREATE INDEX IF NOT EXISTS idx_playlists_uri ON playlists (uri);
+"""
+
+# Campi richiesti a Spotify per i brani (evita di scaricare gli oggetti completi)
+TRACK_FIELDS = 'items(track(id,uri,name,duration_ms,artists(name))),next,total'
+
+
+class PlaylistCatalog:
+    """Catalogo locale (SQLite) delle playlist dell'utente e dei loro brani
+
+    Un thread in background scorre le pagine di Spotify salvando ogni pagina
+    appena arriva; i brani vengono riscaricati solo per le playlist il cui
+    snapshot_id è cambiato. Le API web leggono solo dal database locale.
+    """
+
+    def __init__(self,
+                 fetch_playlists_page: Callable[[int, int], Dict[str, Any]],
+                 fetch_tracks_page: Callable[[str, int, int], Dict[str, Any]]):
+        self.fetch_playlists_page = fetch_playlists_page
+        self.fetch_tracks_page = fetch_tracks_page
+
+        self.db_path = os.getenv('PLAYLIST_CATALOG_PATH', 'playlist_catalog.db')
+        self.refresh_interval = float(os.getenv('PLAYLIST_CATALOG_REFRESH', 900))
+        self.sync_tracks = os.getenv('PLAYLIST_CATALOG_TRACKS', 'True').lower() == 'true'
+        self.page_size = 50
+        self.tracks_page_size = 100
+
+        self.is_running = False
+        self.sync_thread = None
+        self.is_syncing = False
+        self.last_sync = None
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def start(self):
+        """Avvia la sincronizzazione periodica in background"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self.sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self.sync_thread.start()
+        logging.info("Catalogo playlist avviato")
+
+    def stop(self):
+        """Ferma la sincronizzazione"""
+        self.is_running = False
+        self._wake.set()
+        if self.sync_thread:
+            self.sync_thread.join(timeout=1)
+        logging.info("Catalogo playlist fermato")
+
+    def request_sync(self):
+        """Richiede una sincronizzazione immediata"""
+        self._wake.set()
+
+    def _sync_loop(self):
+        """Loop principale: sincronizza e attende il prossimo intervallo"""
+        while self.is_running:
+            self.sync()
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def sync(self) -> bool:
+        """Sincronizza il catalogo con Spotify (incrementale tramite snapshot_id)"""
+        started_at = time.time()
+        self.is_syncing = True
+        seen_ids = []
+        changed = []
+        try:
+            offset = 0
+            complete = False
+            while True:
+                page = self.fetch_playlists_page(offset, self.page_size)
+                if not page:
+                    break
+                items = [item for item in page.get('items', []) if item]
+                changed += self._store_playlists(items, offset, started_at)
+                seen_ids += [item['id'] for item in items]
+
+                offset += len(page.get('items', []))
+                if not page.get('next'):
+                    # Ultima pagina: la scansione è completa se copre il totale dichiarato
+                    complete = offset >= page.get('total', offset)
+                    break
+                if not items:
+                    break
+
+            # Rimuove le playlist non più presenti solo dopo una scansione completa:
+            # una risposta mancante o parziale non deve svuotare il catalogo
+            if complete:
+                self._remove_missing(seen_ids)
+            else:
+                logging.warning(f"Scansione playlist incompleta ({offset} lette): nessuna rimozione")
+
+            if self.sync_tracks:
+                for playlist_id, snapshot_id in changed:
+                    self._sync_playlist_tracks(playlist_id, snapshot_id)
+
+            self.last_sync = time.time()
+            self.last_error = None
+            logging.info(f"Catalogo playlist sincronizzato: {len(seen_ids)} playlist, "
+                         f"{len(changed)} modificate ({self.last_sync - started_at:.1f}s)")
+            return True
+
+        except RequestShed as e:
+            self.last_error = str(e)
+            logging.debug(f"Sincronizzazione catalogo rimandata: {e}")
+            return False
+        except Exception as e:
+            self.last_error = str(e)
+            logging.error(f"Errore nella sincronizzazione catalogo playlist: {e}")
+            return False
+        finally:
+            self.is_syncing = False
+
+    def _store_playlists(self, items: List[Dict[str, Any]], offset: int, synced_at: float) -> List[Tuple[str, str]]:
+        """Salva una pagina di playlist; restituisce quelle con brani da aggiornare"""
+        changed = []
+        with self._lock:
+            for position, item in enumerate(items, start=offset):
+                row = self._conn.execute(
+                    "SELECT tracks_snapshot_id FROM playlists WHERE id = ?", (item['id'],)
+                ).fetchone()
+                if row is None or row['tracks_snapshot_id'] != item.get('snapshot_id'):
+                    changed.append((item['id'], item.get('snapshot_id')))
+
+                images = item.get('images') or []
+                self._conn.execute(
+                    """INSERT INTO playlists (id, name, name_lower, uri, owner, image, tracks_total,
+                                              snapshot_id, position, synced_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(id) DO UPDATE SET
+                           name = excluded.name, name_lower = excluded.name_lower, uri = excluded.uri,
+                           owner = excluded.owner, image = excluded.image,
+                           tracks_total = excluded.tracks_total, snapshot_id = excluded.snapshot_id,
+                           position = excluded.position, synced_at = excluded.synced_at""",
+                    (
+                        item['id'],
+                        item.get('name') or '',
+                        (item.get('name') or '').lower(),
+                        item.get('uri'),
+                        (item.get('owner') or {}).get('display_name'),
+                        images[0].get('url') if images else None,
+                        (item.get('tracks') or {}).get('total', 0),
+                        item.get('snapshot_id'),
+                        position,
+                        synced_at
+                    )
+                )
+            self._conn.commit()
+        return changed
+
+    def _remove_missing(self, seen_ids: List[str]):
+        """Elimina le playlist non più presenti nell'account"""
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_playlists (id TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM seen_playlists")
+            self._conn.executemany("INSERT OR IGNORE INTO seen_playlists (id) VALUES (?)",
+                                   [(playlist_id,) for playlist_id in seen_ids])
+            self._conn.execute("DELETE FROM playlist_tracks WHERE playlist_id NOT IN (SELECT id FROM seen_playlists)")
+            removed = self._conn.execute(
+                "DELETE FROM playlists WHERE id NOT IN (SELECT id FROM seen_playlists)"
+            ).rowcount
+            self._conn.commit()
+        if removed:
+            logging.info(f"Rimosse {removed} playlist dal catalogo")
+
+    def _sync_playlist_tracks(self, playlist_id: str, snapshot_id: Optional[str]):
+        """Riscarica i brani di una playlist modificata"""
+        tracks = []
+        offset = 0
+        while True:
+            page = self.fetch_tracks_page(playlist_id, offset, self.tracks_page_size)
+            items = (page or {}).get('items', [])
+            for item in items:
+                track = (item or {}).get('track')
+                if not track:
+                    # Brani non più disponibili o rimossi
+                    continue
+                tracks.append((
+                    playlist_id,
+                    len(tracks),
+                    track.get('id'),
+                    track.get('uri'),
+                    track.get('name'),
+                    ', '.join(artist['name'] for artist in track.get('artists') or [] if artist.get('name')),
+                    track.get('duration_ms')
+                ))
+            offset += len(items)
+            if not items or not page.get('next'):
+                break
+
+        with self._lock:
+            self._conn.execute("DELETE FROM playlist_tracks WHERE playlist_id = ?", (playlist_id,))
+            self._conn.executemany(
+                """INSERT INTO playlist_tracks (playlist_id, position, track_id, uri, name, artists, duration_ms)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                tracks
+            )
+            self._conn.execute(
+                "UPDATE playlists SET tracks_snapshot_id = ? WHERE id = ?",
+                (snapshot_id, playlist_id)
+            )
+            self._conn.commit()
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Converte una riga nel formato compatibile con le playlist Spotify"""
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'uri': row['uri'],
+            'owner': row['owner'],
+            'image': row['image'],
+            'snapshot_id': row['snapshot_id'],
+            'tracks': {'total': row['tracks_total']}
+        }
+
+    @staticmethod
+    def summarize(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Converte una playlist dell'API Spotify nello stesso formato del catalogo"""
+        images = item.get('images') or []
+        return {
+            'id': item['id'],
+            'name': item.get('name') or '',
+            'uri': item.get('uri'),
+            'owner': (item.get('owner') or {}).get('display_name'),
+            'image': images[0].get('url') if images else None,
+            'snapshot_id': item.get('snapshot_id'),
+            'tracks': {'total': (item.get('tracks') or {}).get('total', 0)}
+        }
+
+    def list_playlists(self, offset: int = 0, limit: int = 50, query: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Pagina di playlist dal catalogo, con filtro opzionale sul nome"""
+        where, params = '', []
+        if query:
+            where = "WHERE name_lower LIKE ? ESCAPE '\\'"
+            escaped = query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{escaped}%')
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM playlists {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT * FROM playlists {where} ORDER BY position LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [self._to_dict(row) for row in rows], total
+
+    def get_by_uri(self, uri: str) -> Optional[Dict[str, Any]]:
+        """Cerca una playlist del catalogo per URI"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM playlists WHERE uri = ?", (uri,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def get_tracks(self, playlist_id: str) -> List[Dict[str, Any]]:
+        """Brani di una playlist salvati nel catalogo"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM playlist_tracks WHERE playlist_id = ? ORDER BY position", (playlist_id,)
+            ).fetchall()
+        return [
+            {
+                'id': row['track_id'],
+                'uri': row['uri'],
+                'name': row['name'],
+                'artists': row['artists'],
+                'duration_ms': row['duration_ms']
+            }
+            for row in rows
+        ]
+
+    def is_empty(self) -> bool:
+        """Verifica se il catalogo non è ancora stato popolato"""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM playlists LIMIT 1").fetchone() is None
+
+    def clear(self):
+        """Svuota il catalogo (es. alla disconnessione dell'account)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM playlist_tracks")
+            self._conn.execute("DELETE FROM playlists")
+            self._conn.commit()
+        self.last_sync = None
+        logging.info("Catalogo playlist svuotato")
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato della sincronizzazione"""
+        return {
+            'syncing': self.is_syncing,
+            'last_sync': self.last_sync,
+            'last_error': self.last_error
+        }
+
+    def close(self):
+        """Chiude la connessione al database"""
+        with self._lock:
+            self._conn.close()
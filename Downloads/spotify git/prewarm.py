@@ -0,0 +1,166 @@
+import os
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from spotipy.exceptions import SpotifyException
+
+from device_registry import LOCAL_DEVICE_ID
+from spotify_scheduler import PRIORITY_CATALOG
+
+
+class Prewarmer:
+    """Pre-riscaldamento prima dei cambi di fascia oraria e all'avvio
+
+    Un anticipo configurabile prima di ogni confine delle fasce orarie (e una
+    volta all'avvio) rinnova il token se scade a breve, risolve e mette in
+    cache il dispositivo, tiene aperta la connessione HTTP verso Spotify e
+    verifica la playlist del periodo in arrivo: alla pressione del pulsante
+    resta solo il comando di riproduzione.
+    """
+
+    def __init__(self, spotify_manager, schedule_engine):
+        self.spotify_manager = spotify_manager
+        self.schedule_engine = schedule_engine
+        self.enabled = os.getenv('PREWARM_ENABLED', 'True').lower() == 'true'
+        # Anticipo rispetto al confine della fascia oraria
+        self.lead_time = float(os.getenv('PREWARM_LEAD_TIME', 120))
+        # Il token viene rinnovato se scadrebbe entro questa finestra
+        self.token_window = float(os.getenv('PREWARM_TOKEN_WINDOW', 900))
+
+        self.is_running = False
+        self.thread = None
+        self.next_run_at = None
+        self.last_run = None
+        self._wake = threading.Event()
+
+    def start(self):
+        """Avvia il pre-riscaldamento (subito e poi prima di ogni confine)"""
+        if not self.enabled or self.is_running:
+            return
+        self.is_running = True
+        self.schedule_engine.reload_listeners.append(self._wake.set)
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+        logging.info(f"Pre-warm avviato (anticipo {self.lead_time:.0f}s)")
+
+    def stop(self):
+        """Ferma il pre-riscaldamento"""
+        if not self.is_running:
+            return
+        self.is_running = False
+        self._wake.set()
+        if self._wake.set in self.schedule_engine.reload_listeners:
+            self.schedule_engine.reload_listeners.remove(self._wake.set)
+        if self.thread:
+            self.thread.join(timeout=2)
+        logging.info("Pre-warm fermato")
+
+    def _next_boundary(self, after: datetime) -> Optional[datetime]:
+        """Prossimo confine dopo 'after' in cui inizia un periodo diverso"""
+        boundary = after
+        # Al massimo una settimana di intervalli (i giorni possono differire)
+        limit = after + timedelta(days=8)
+        while boundary < limit:
+            boundary = self.schedule_engine.next_boundary(boundary)
+            index = self.schedule_engine.current_index(boundary)
+            if index is not None and index != self.schedule_engine.current_index(boundary - timedelta(minutes=1)):
+                return boundary
+        return None
+
+    def _run_loop(self):
+        self.warm(self.schedule_engine.current_playlist(), 'avvio')
+
+        warmed_boundary = None
+        while self.is_running:
+            now = datetime.now()
+            boundary = self._next_boundary(max(now, warmed_boundary) if warmed_boundary else now)
+            if boundary is None:
+                self.next_run_at = None
+                self._wake.wait()
+            else:
+                self.next_run_at = boundary - timedelta(seconds=self.lead_time)
+                delay = (self.next_run_at - now).total_seconds()
+                if delay <= 0 or not self._wake.wait(delay):
+                    period = self.schedule_engine.current_period(boundary)
+                    self.warm(period['playlist'] if period else None, f"fascia delle {boundary.strftime('%H:%M')}")
+                    warmed_boundary = boundary
+                    continue
+            # Configurazione ricaricata o arresto: ricalcola il prossimo confine
+            self._wake.clear()
+            warmed_boundary = None
+
+    def warm(self, playlist_uri: Optional[str] = None, reason: str = 'manuale') -> Dict[str, Any]:
+        """Esegue i passi di pre-riscaldamento e ne registra i tempi"""
+        manager = self.spotify_manager
+        result = {'reason': reason, 'at': time.time(), 'playlist': playlist_uri, 'steps': {}, 'errors': []}
+
+        if manager.demo_mode or not manager.sp:
+            result['errors'].append('Spotify non inizializzato')
+            self.last_run = result
+            return result
+
+        def step(name, func):
+            started_at = time.time()
+            try:
+                outcome = func()
+            except Exception as e:
+                outcome = None
+                result['errors'].append(f"{name}: {e}")
+                logging.warning(f"Pre-warm {name} fallito: {e}")
+            result['steps'][name] = round((time.time() - started_at) * 1000, 1)
+            return outcome
+
+        # Priorità bassa: il pre-warm non deve togliere quota ai comandi
+        with manager.scheduler.priority(PRIORITY_CATALOG):
+            step('token', self._warm_token)
+            # La lettura dei dispositivi apre anche la connessione HTTP verso l'API
+            step('device', self._warm_device)
+            if playlist_uri:
+                result['playlist_valid'] = step('playlist', lambda: self._validate_playlist(playlist_uri))
+
+        self.last_run = result
+        logging.info(f"Pre-warm ({reason}) completato: "
+                     + ', '.join(f"{name} {ms:.0f} ms" for name, ms in result['steps'].items()))
+        return result
+
+    def _warm_token(self) -> bool:
+        token_manager = self.spotify_manager.token_manager
+        if not token_manager:
+            return False
+        remaining = token_manager.seconds_until_refresh()
+        # Rinnova in anticipo se il token scadrebbe a ridosso del confine
+        return token_manager.refresh(force=remaining is not None and remaining < self.token_window)
+
+    def _warm_device(self) -> Optional[str]:
+        manager = self.spotify_manager
+        manager.device_registry.refresh()
+        if manager.current_device_id == LOCAL_DEVICE_ID:
+            manager._resolve_local_device('pre-warm')
+        elif not manager.current_device_id or not manager.device_registry.get_by_id(manager.current_device_id):
+            manager._find_device()
+        return manager.current_device_id
+
+    def _validate_playlist(self, playlist_uri: str) -> bool:
+        """Verifica che la playlist del periodo esista (catalogo locale o API)"""
+        if self.spotify_manager.playlist_catalog.get_by_uri(playlist_uri):
+            return True
+        try:
+            self.spotify_manager.sp.playlist(playlist_uri, fields='uri,name')
+            return True
+        except SpotifyException as e:
+            if e.http_status in (400, 404):
+                logging.warning(f"Playlist della fascia oraria non valida: {playlist_uri}")
+                return False
+            raise
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato del pre-riscaldamento"""
+        return {
+            'enabled': self.enabled,
+            'lead_time': self.lead_time,
+            'next_run': self.next_run_at.isoformat() if self.next_run_at else None,
+            'last_run': self.last_run
+        }
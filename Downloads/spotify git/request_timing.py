@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Soglia oltre la quale una richiesta finisce nel log delle richieste lente
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 500))
+
+slow_request_logger = logging.getLogger('slow_requests')
+if os.getenv('SLOW_REQUEST_LOG'):
+    _handler = logging.FileHandler(os.getenv('SLOW_REQUEST_LOG'))
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_request_logger.addHandler(_handler)
+    # Con il file dedicato gli alberi JSON non vanno duplicati nel log principale
+    slow_request_logger.propagate = False
+
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('request_trace', default=None)
+
+
+class Span:
+    """Fase misurata di una richiesta, con eventuali sotto-fasi"""
+
+    __slots__ = ('name', 'started_at', 'duration', 'children')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.children: List['Span'] = []
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started_at
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        data = {
+            'name': self.name,
+            'start_ms': round((self.started_at - origin) * 1000, 1),
+            'duration_ms': round((self.duration or 0) * 1000, 1)
+        }
+        if self.children:
+            data['children'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Trace:
+    """Albero delle fasi di una richiesta (o di un comando in background)"""
+
+    def __init__(self, name: str):
+        self.root = Span(name)
+        self._stack = [self.root]
+
+    @property
+    def duration_ms(self) -> float:
+        duration = self.root.duration
+        if duration is None:
+            duration = time.perf_counter() - self.root.started_at
+        return duration * 1000
+
+    @contextmanager
+    def span(self, name: str):
+        span = Span(name)
+        self._stack[-1].children.append(span)
+        self._stack.append(span)
+        try:
+            yield span
+        finally:
+            span.finish()
+            self._stack.pop()
+
+    def finish(self):
+        self.root.finish()
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        """Durata totale e numero di occorrenze per nome di fase"""
+        totals: Dict[str, Dict[str, float]] = {}
+
+        def visit(span: Span):
+            for child in span.children:
+                entry = totals.setdefault(child.name, {'ms': 0.0, 'count': 0})
+                entry['ms'] += (child.duration or 0) * 1000
+                entry['count'] += 1
+                visit(child)
+
+        visit(self.root)
+        return totals
+
+    def server_timing(self) -> str:
+        """Valore dell'header Server-Timing (fasi aggregate per nome e totale)"""
+        metrics = []
+        for name, entry in self.totals().items():
+            token = re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+            metric = f'{token};dur={entry["ms"]:.1f}'
+            if entry['count'] > 1:
+                metric += f';desc="{entry["count"]}x"'
+            metrics.append(metric)
+        metrics.append(f'total;dur={self.duration_ms:.1f}')
+        return ', '.join(metrics)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.root.to_dict(self.root.started_at)
+
+
+def start_trace(name: str) -> Trace:
+    """Avvia la traccia della richiesta corrente"""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace() -> Optional[Trace]:
+    """Chiude e restituisce la traccia corrente"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.finish()
+        _current_trace.set(None)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str):
+    """Misura una fase della richiesta corrente (nessun costo fuori da una richiesta)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name) as current:
+        yield current
+
+
+def sleep(seconds: float, name: str = 'sleep'):
+    """time.sleep registrato come fase della richiesta"""
+    with span(name):
+        time.sleep(seconds)
+
+
+def log_if_slow(trace: Trace, **details) -> bool:
+    """Scrive la richiesta nel log strutturato se supera la soglia"""
+    duration_ms = trace.duration_ms
+    if duration_ms < SLOW_REQUEST_THRESHOLD_MS:
+        return False
+    record = {'name': trace.root.name, 'duration_ms': round(duration_ms, 1), **details, 'spans': trace.to_dict()}
+    slow_request_logger.warning(json.dumps(record, ensure_ascii=False))
+    return True
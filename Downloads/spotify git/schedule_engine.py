@@ -0,0 +1,296 @@
+import os
+import re
+import threading
+import logging
+from bisect import bisect_right
+from datetime import datetime, date, timedelta
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+# Tipo di giorno usato per i festivi (0-6 sono i giorni della settimana)
+HOLIDAY = 7
+
+DAY_NAMES = {
+    'mon': 0, 'lun': 0,
+    'tue': 1, 'mar': 1,
+    'wed': 2, 'mer': 2,
+    'thu': 3, 'gio': 3,
+    'fri': 4, 'ven': 4,
+    'sat': 5, 'sab': 5,
+    'sun': 6, 'dom': 6,
+    'hol': HOLIDAY, 'fest': HOLIDAY
+}
+
+PERIOD_KEY = re.compile(r'^TIME_PERIOD_(\d+)_START$')
+
+
+def parse_time(value: str) -> int:
+    """Converte 'HH:MM' in minuti dalla mezzanotte"""
+    hours, minutes = value.strip().split(':')[:2]
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours <= 24 and 0 <= minutes < 60):
+        raise ValueError(f"Orario non valido: {value}")
+    return min(hours * 60 + minutes, MINUTES_PER_DAY)
+
+
+def parse_days(value: str) -> Set[int]:
+    """Converte 'mon-fri,sat' / 'lun-ven' / 'hol' nell'insieme dei tipi di giorno"""
+    # Senza giorni il periodo vale sempre, festivi inclusi
+    if not value or not value.strip():
+        return set(range(HOLIDAY + 1))
+
+    days = set()
+    for token in value.lower().replace(' ', '').split(','):
+        if not token:
+            continue
+        if '-' in token:
+            first, last = (DAY_NAMES[name] for name in token.split('-', 1))
+            if HOLIDAY in (first, last):
+                raise ValueError(f"Intervallo di giorni non valido: {token}")
+            day = first
+            while True:
+                days.add(day)
+                if day == last:
+                    break
+                day = (day + 1) % 7
+        else:
+            days.add(DAY_NAMES[token])
+    return days
+
+
+def parse_holidays(value: str) -> Tuple[Set[date], Set[Tuple[int, int]]]:
+    """Festivi: date 'YYYY-MM-DD' oppure ricorrenze annuali 'MM-DD'"""
+    dates, recurring = set(), set()
+    for token in (value or '').replace(' ', '').split(','):
+        if not token:
+            continue
+        try:
+            if token.count('-') == 2:
+                dates.add(datetime.strptime(token, '%Y-%m-%d').date())
+            else:
+                month, day = token.split('-')
+                recurring.add((int(month), int(day)))
+        except ValueError:
+            logging.warning(f"Festivo non valido ignorato: {token}")
+    return dates, recurring
+
+
+class ScheduleEngine:
+    """Motore delle fasce orarie delle playlist
+
+    I periodi TIME_PERIOD_{i}_* (senza limite di numero, con giorni e festivi)
+    vengono compilati una sola volta in un indice ordinato di intervalli al
+    minuto per ogni tipo di giorno: la ricerca del periodo corrente è una
+    bisezione e un timer scatta esattamente al prossimo confine.
+    """
+
+    def __init__(self, on_change: Optional[Callable[[Optional[Dict[str, Any]], Optional[Dict[str, Any]]], None]] = None):
+        self.on_change = on_change
+        # Notificati dopo ogni ricompilazione (es. per riprogrammare il pre-warm)
+        self.reload_listeners: List[Callable[[], None]] = []
+
+        self.is_running = False
+        self.timer = None
+        self.next_boundary_at = None
+
+        self._periods: List[Dict[str, Any]] = []
+        self._index: Dict[Tuple[int, int], Tuple[List[int], List[Optional[int]]]] = {}
+        self._holiday_dates: Set[date] = set()
+        self._holiday_recurring: Set[Tuple[int, int]] = set()
+        self._has_holiday_periods = False
+        self._current_index = None
+        self._lock = threading.Lock()
+
+        self.reload()
+
+    def _read_periods(self) -> List[Dict[str, Any]]:
+        """Legge i periodi configurati dalle variabili d'ambiente"""
+        indices = sorted(int(match.group(1)) for match in map(PERIOD_KEY.match, os.environ) if match)
+        periods = []
+        for i in indices:
+            start = os.getenv(f'TIME_PERIOD_{i}_START', '')
+            end = os.getenv(f'TIME_PERIOD_{i}_END', '')
+            if start and end:
+                periods.append({
+                    'start': start,
+                    'end': end,
+                    'playlist': os.getenv(f'TIME_PERIOD_{i}_PLAYLIST', ''),
+                    'days': os.getenv(f'TIME_PERIOD_{i}_DAYS', '')
+                })
+
+        # Se non ci sono periodi personalizzati, usa i valori di default
+        if not periods:
+            periods = [
+                {'start': '06:00', 'end': '12:00', 'playlist': os.getenv('PLAYLIST_MORNING', ''), 'days': ''},
+                {'start': '12:00', 'end': '18:00', 'playlist': os.getenv('PLAYLIST_AFTERNOON', ''), 'days': ''},
+                {'start': '18:00', 'end': '22:00', 'playlist': os.getenv('PLAYLIST_EVENING', ''), 'days': ''},
+                {'start': '22:00', 'end': '06:00', 'playlist': os.getenv('PLAYLIST_NIGHT', ''), 'days': ''}
+            ]
+        return periods
+
+    def reload(self):
+        """Ricompila l'indice dalla configurazione corrente e riprogramma il timer"""
+        periods = []
+        for period in self._read_periods():
+            try:
+                period['_start'] = parse_time(period['start'])
+                period['_end'] = parse_time(period['end'])
+                period['_days'] = parse_days(period['days'])
+                periods.append(period)
+            except (ValueError, KeyError) as e:
+                logging.warning(f"Periodo {period['start']}-{period['end']} ignorato: {e}")
+
+        # Un valore per minuto per ogni tipo di giorno; i primi periodi hanno la precedenza.
+        # I minuti dopo la mezzanotte di un periodo notturno appartengono al giorno
+        # successivo e sono tenuti a parte, indicizzati dal tipo del giorno di inizio
+        day_types = range(HOLIDAY + 1)
+        same_day = {day: [None] * MINUTES_PER_DAY for day in day_types}
+        overnight = {day: [None] * MINUTES_PER_DAY for day in day_types}
+        for index in reversed(range(len(periods))):
+            period = periods[index]
+            start, end = period['_start'], period['_end']
+            if start < end:
+                today, tomorrow = range(start, end), range(0)
+            elif start == end:
+                today, tomorrow = range(MINUTES_PER_DAY), range(0)
+            else:
+                # Periodo che attraversa la mezzanotte
+                today, tomorrow = range(start, MINUTES_PER_DAY), range(0, end)
+            for day in period['_days']:
+                for minute in today:
+                    same_day[day][minute] = index
+                for minute in tomorrow:
+                    overnight[day][minute] = index
+
+        # Compressione in intervalli ordinati (inizio, indice periodo) per ogni
+        # coppia (tipo del giorno precedente, tipo del giorno corrente)
+        index = {}
+        for previous_day in day_types:
+            for day in day_types:
+                starts, values = [], []
+                for minute, (carried, own) in enumerate(zip(overnight[previous_day], same_day[day])):
+                    value = own if carried is None or (own is not None and own < carried) else carried
+                    if not values or values[-1] != value:
+                        starts.append(minute)
+                        values.append(value)
+                index[(previous_day, day)] = (starts, values)
+
+        holiday_dates, holiday_recurring = parse_holidays(os.getenv('SCHEDULE_HOLIDAYS', ''))
+
+        with self._lock:
+            self._periods = periods
+            self._index = index
+            self._holiday_dates = holiday_dates
+            self._holiday_recurring = holiday_recurring
+            self._has_holiday_periods = any(HOLIDAY in period['_days'] for period in periods)
+            self._current_index = self.current_index()
+
+        logging.info(f"Fasce orarie compilate: {len(periods)} periodi")
+        if self.is_running:
+            self._schedule_next()
+        for listener in self.reload_listeners:
+            listener()
+
+    def is_holiday(self, day: date) -> bool:
+        """Verifica se la data è un festivo configurato"""
+        return day in self._holiday_dates or (day.month, day.day) in self._holiday_recurring
+
+    def _day_type(self, day: date) -> int:
+        # Nei festivi valgono i periodi marcati 'hol', se ce ne sono
+        if self._has_holiday_periods and self.is_holiday(day):
+            return HOLIDAY
+        return day.weekday()
+
+    def _locate(self, now: datetime) -> Tuple[List[int], List[Optional[int]], int]:
+        today = now.date()
+        starts, values = self._index[(self._day_type(today - timedelta(days=1)), self._day_type(today))]
+        position = bisect_right(starts, now.hour * 60 + now.minute) - 1
+        return starts, values, position
+
+    def current_index(self, now: Optional[datetime] = None) -> Optional[int]:
+        """Indice del periodo attivo (None se nessuno), ricerca O(log n)"""
+        _, values, position = self._locate(now or datetime.now())
+        return values[position]
+
+    def current_period(self, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Periodo attivo (senza i campi interni)"""
+        index = self.current_index(now)
+        if index is None:
+            return None
+        return self._public(self._periods[index])
+
+    def current_playlist(self) -> Optional[str]:
+        """Playlist del periodo attivo, se configurata"""
+        period = self.current_period()
+        return period['playlist'] if period and period['playlist'] else None
+
+    def next_boundary(self, now: Optional[datetime] = None) -> datetime:
+        """Istante del prossimo cambio di intervallo"""
+        now = now or datetime.now()
+        starts, _, position = self._locate(now)
+        midnight = datetime.combine(now.date(), datetime.min.time())
+        if position + 1 < len(starts):
+            return midnight + timedelta(minutes=starts[position + 1])
+        return midnight + timedelta(days=1)
+
+    def get_periods(self) -> List[Dict[str, Any]]:
+        """Periodi configurati, nel formato dell'API"""
+        return [self._public(period) for period in self._periods]
+
+    @staticmethod
+    def _public(period: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in period.items() if not key.startswith('_')}
+
+    def start(self):
+        """Avvia il timer dei confini delle fasce orarie"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self._schedule_next()
+        logging.info("Motore fasce orarie avviato")
+
+    def stop(self):
+        """Ferma il timer"""
+        self.is_running = False
+        if self.timer:
+            self.timer.cancel()
+        logging.info("Motore fasce orarie fermato")
+
+    def _schedule_next(self):
+        if self.timer:
+            self.timer.cancel()
+        now = datetime.now()
+        self.next_boundary_at = self.next_boundary(now)
+        delay = max(0.05, (self.next_boundary_at - now).total_seconds())
+        self.timer = threading.Timer(delay, self._on_boundary)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _on_boundary(self):
+        """Confine raggiunto: notifica il cambio di periodo e programma il successivo"""
+        if not self.is_running:
+            return
+
+        with self._lock:
+            previous, current = self._current_index, self.current_index()
+            self._current_index = current
+
+        if previous != current:
+            old_period = self._public(self._periods[previous]) if previous is not None else None
+            new_period = self.current_period()
+            logging.info(f"Cambio fascia oraria: {previous} -> {current}")
+            if self.on_change:
+                try:
+                    self.on_change(old_period, new_period)
+                except Exception as e:
+                    logging.error(f"Errore nel cambio fascia oraria: {e}")
+
+        self._schedule_next()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato del motore"""
+        return {
+            'periods': len(self._periods),
+            'current_period_index': self.current_index(),
+            'next_boundary': self.next_boundary_at.isoformat() if self.next_boundary_at else None
+        }
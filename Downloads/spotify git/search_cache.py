@@ -0,0 +1,146 @@
+import os
+import math
+import time
+import threading
+import logging
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+# Lunghezza minima di un prefisso riutilizzabile per il typeahead
+MIN_PREFIX_LENGTH = 2
+
+
+def normalize_query(query: str) -> str:
+    """Normalizza una query (minuscole, spazi compattati)"""
+    return ' '.join(query.lower().split())
+
+
+def _track_text(track: Dict[str, Any]) -> str:
+    """Testo ricercabile di una traccia (titolo, artisti, album)"""
+    artists = ' '.join(artist.get('name', '') for artist in track.get('artists') or [])
+    album = (track.get('album') or {}).get('name', '')
+    return f"{track.get('name', '')} {artists} {album}".lower()
+
+
+class SearchCache:
+    """Cache LRU con TTL dei risultati di ricerca Spotify
+
+    Le chiavi sono la query normalizzata e il limite. I risultati già in cache
+    per un prefisso della query vengono filtrati localmente per un typeahead
+    immediato; ricerche identiche concorrenti condividono una sola chiamata.
+    """
+
+    def __init__(self, fetch: Callable[[str, int], List[Dict[str, Any]]]):
+        self.fetch = fetch
+        self.max_entries = int(os.getenv('SEARCH_CACHE_SIZE', 256))
+        self.ttl = float(os.getenv('SEARCH_CACHE_TTL', 600))
+
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.fetch_latencies = deque(maxlen=100)
+
+        self._entries: 'OrderedDict[Tuple[str, int], Tuple[float, List[Dict[str, Any]]]]' = OrderedDict()
+        self._in_flight: Dict[Tuple[str, int], threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: Tuple[str, int]) -> Optional[List[Dict[str, Any]]]:
+        """Legge una voce valida aggiornandone la posizione LRU (con lock acquisito)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key: Tuple[str, int], tracks: List[Dict[str, Any]]):
+        self._entries[key] = (time.time(), tracks)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup_prefix(self, query: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Filtra localmente i risultati del prefisso più lungo già in cache"""
+        normalized = normalize_query(query)
+        tokens = normalized.split()
+        with self._lock:
+            for length in range(len(normalized) - 1, MIN_PREFIX_LENGTH - 1, -1):
+                tracks = self._get((normalized[:length], limit))
+                if tracks is None:
+                    continue
+                return [track for track in tracks if all(token in _track_text(track) for token in tokens)]
+        return None
+
+    def search(self, query: str, limit: int = 20, typeahead: bool = False) -> Tuple[List[Dict[str, Any]], str]:
+        """Restituisce (tracce, origine) con origine 'cache', 'prefix' o 'spotify'
+
+        In modalità typeahead non viene mai chiamato Spotify: si usano solo la
+        cache e i prefissi già in cache (origine None se non c'è nulla); il
+        client richiede la ricerca completa a digitazione ferma.
+        """
+        key = (normalize_query(query), limit)
+
+        if typeahead:
+            with self._lock:
+                tracks = self._get(key)
+                if tracks is not None:
+                    self.hits += 1
+                    return tracks, 'cache'
+            tracks = self.lookup_prefix(query, limit)
+            if tracks:
+                self.prefix_hits += 1
+                return tracks, 'prefix'
+            return [], None
+
+        while True:
+            with self._lock:
+                tracks = self._get(key)
+                if tracks is not None:
+                    self.hits += 1
+                    return tracks, 'cache'
+
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    self._in_flight[key] = threading.Event()
+                    break
+
+            # Stessa ricerca già in corso: attende il suo risultato
+            in_flight.wait(10)
+
+        started_at = time.time()
+        try:
+            tracks = self.fetch(key[0], limit)
+            self.fetch_latencies.append(time.time() - started_at)
+            with self._lock:
+                self.misses += 1
+                self._put(key, tracks)
+            return tracks, 'spotify'
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    def clear(self):
+        """Svuota la cache"""
+        with self._lock:
+            self._entries.clear()
+        logging.info("Cache ricerche svuotata")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche di hit rate e latenza delle ricerche"""
+        total = self.hits + self.prefix_hits + self.misses
+        latencies = sorted(self.fetch_latencies)
+        stats = {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'prefix_hits': self.prefix_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.prefix_hits) / total, 3) if total else 0.0
+        }
+        if latencies:
+            stats.update({
+                'spotify_avg_ms': round(sum(latencies) / len(latencies) * 1000, 1),
+                'spotify_p95_ms': round(latencies[math.ceil(len(latencies) * 0.95) - 1] * 1000, 1)
+            })
+        return stats
@@ -0,0 +1,91 @@
+import threading
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from spotify_manager import SpotifyManager
+from gpio_manager import GPIOManager
+from schedule_engine import ScheduleEngine
+from prewarm import Prewarmer
+
+
+class ServiceRegistry:
+    """Registro condiviso dei servizi dell'applicazione
+
+    main.py e l'interfaccia web ottengono da qui le stesse istanze dei
+    manager: ogni servizio viene creato una sola volta per processo e
+    fermato una sola volta allo shutdown.
+    """
+
+    def __init__(self):
+        self._services: Dict[str, Any] = {}
+        self._shutdown_order: List[Tuple[str, Optional[Callable[[Any], None]]]] = []
+        self._lock = threading.RLock()
+
+    def get_or_create(self, name: str, factory: Callable[[], Any],
+                      shutdown: Optional[Callable[[Any], None]] = None) -> Any:
+        """Restituisce il servizio registrato, creandolo al primo accesso"""
+        with self._lock:
+            if name not in self._services:
+                self._services[name] = factory()
+                self._shutdown_order.append((name, shutdown))
+                logging.info(f"Servizio '{name}' inizializzato")
+            return self._services[name]
+
+    def get(self, name: str) -> Optional[Any]:
+        """Restituisce il servizio se già creato"""
+        return self._services.get(name)
+
+    def shutdown(self):
+        """Ferma i servizi in ordine inverso di creazione"""
+        with self._lock:
+            for name, shutdown in reversed(self._shutdown_order):
+                service = self._services.pop(name, None)
+                if service is None or shutdown is None:
+                    continue
+                try:
+                    logging.info(f"Shutdown servizio '{name}'...")
+                    shutdown(service)
+                except Exception as e:
+                    logging.error(f"Errore nello shutdown del servizio '{name}': {e}")
+            self._shutdown_order.clear()
+
+
+# Registro unico del processo
+services = ServiceRegistry()
+
+
+def get_spotify_manager():
+    """SpotifyManager condiviso"""
+    return services.get_or_create('spotify_manager', SpotifyManager, lambda manager: manager.shutdown())
+
+
+def get_schedule_engine(spotify_manager):
+    """Motore delle fasce orarie condiviso, con il timer dei confini avviato"""
+    def create():
+        engine = ScheduleEngine(
+            on_change=lambda old, new: spotify_manager.apply_scheduled_playlist(new['playlist'] if new else None)
+        )
+        engine.start()
+        return engine
+
+    return services.get_or_create('schedule_engine', create, lambda engine: engine.stop())
+
+
+def get_prewarmer(spotify_manager):
+    """Pre-riscaldamento condiviso, agganciato al motore delle fasce orarie"""
+    def create():
+        prewarmer = Prewarmer(spotify_manager, get_schedule_engine(spotify_manager))
+        prewarmer.start()
+        return prewarmer
+
+    return services.get_or_create('prewarmer', create, lambda prewarmer: prewarmer.stop())
+
+
+def get_gpio_manager(spotify_manager):
+    """GPIOManager condiviso, con il monitoraggio avviato una sola volta"""
+    def create():
+        manager = GPIOManager(spotify_manager, get_schedule_engine(spotify_manager))
+        manager.start_monitoring()
+        return manager
+
+    return services.get_or_create('gpio_manager', create, lambda manager: manager.cleanup())
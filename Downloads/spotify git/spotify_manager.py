@@ -1,9 +1,22 @@
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
+from spotipy.exceptions import SpotifyException
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-import time
 import logging
 from typing import Optional, Dict, Any
+from playback_poller import PlaybackPoller
+from device_registry import DeviceRegistry, LOCAL_DEVICE_ID, LOCAL_DEVICE_NAMES
+from librespot_supervisor import LibrespotSupervisor
+from volume_coalescer import VolumeCoalescer
+from alsa_mixer import AlsaMixer
+from playlist_catalog import PlaylistCatalog, TRACK_FIELDS
+from search_cache import SearchCache
+from token_manager import TokenCacheHandler, TokenManager
+from spotify_scheduler import SpotifyRequestScheduler, ScheduledSpotify, RequestShed, PRIORITY_POLLING, PRIORITY_CATALOG
+from request_timing import span
 
 class SpotifyManager:
     def __init__(self):
@@ -14,31 +27,78 @@ class SpotifyManager:
         self.device_name = os.getenv('DEFAULT_DEVICE_NAME', 'raspberrypi')
         self.default_playlist = os.getenv('DEFAULT_PLAYLIST_URI')
         self.volume_level = int(os.getenv('VOLUME_LEVEL', 70))
+        self.api_base_url = os.getenv('SPOTIFY_API_BASE_URL', '').rstrip('/')
         
         self.scope = "user-read-playback-state,user-modify-playback-state,user-read-currently-playing,playlist-read-private,playlist-read-collaborative"
         
         self.sp = None
+        self.token_manager = None
         self.current_device_id = None
         self.is_playing = False
         
+        # Scheduler con priorità e rate limit per tutte le chiamate Spotify
+        self.scheduler = SpotifyRequestScheduler()
+        
+        # Poller condiviso dello stato di riproduzione
+        self.playback_poller = PlaybackPoller(self._fetch_current_playback)
+        
+        # Cache dei dispositivi condivisa da tutti i comandi
+        self.device_registry = DeviceRegistry(self._fetch_devices)
+        
+        # Invio coalescato delle variazioni di volume
+        self.volume_coalescer = VolumeCoalescer(
+            lambda device_id, volume: self.set_volume(volume, device_id=device_id)
+        )
+        
+        # Mixer ALSA per il volume del dispositivo locale
+        self.mixer = AlsaMixer()
+        
+        # Processo librespot locale (avviato su richiesta)
+        self.librespot = LibrespotSupervisor()
+        self.local_device_wait = float(os.getenv('LOCAL_DEVICE_WAIT', 3))
+        
+        # Catalogo locale delle playlist, sincronizzato in background
+        self.playlist_catalog = PlaylistCatalog(self._fetch_playlists_page, self._fetch_playlist_tracks_page)
+        
+        # Cache dei risultati di ricerca
+        self.search_cache = SearchCache(self._fetch_search)
+        
         # Inizializza Spotify solo se non in modalità demo
         if not self.demo_mode:
             self._setup_spotify()
+            self.playlist_catalog.start()
         else:
             logging.info("Spotify Manager in modalità demo")
+            
+        self.playback_poller.start()
         
     def _setup_spotify(self):
         """Inizializza la connessione Spotify"""
         try:
+            # Token in memoria, rinnovato in background prima della scadenza
+            self.token_cache = TokenCacheHandler(".spotify_cache")
             self.sp_oauth = SpotifyOAuth(
                 client_id=self.client_id,
                 client_secret=self.client_secret,
                 redirect_uri=self.redirect_uri,
                 scope=self.scope,
-                cache_path=".spotify_cache"
+                cache_handler=self.token_cache
             )
             
-            self.sp = spotipy.Spotify(auth_manager=self.sp_oauth)
+            if self.token_manager:
+                self.token_manager.stop()
+            self.token_manager = TokenManager(self.sp_oauth, self.token_cache)
+            self.token_manager.start()
+            
+            client = spotipy.Spotify(auth_manager=self.sp_oauth, requests_session=self._build_session())
+            
+            # API alternativa (es. fake_spotify_server.py per test offline e benchmark)
+            if self.api_base_url:
+                client.prefix = f"{self.api_base_url}/v1/"
+                self.sp_oauth.OAUTH_TOKEN_URL = f"{self.api_base_url}/api/token"
+                logging.info(f"Spotify API su {self.api_base_url}")
+                
+            self.sp = ScheduledSpotify(client, self.scheduler)
             logging.info("Spotify client inizializzato con successo")
             
             # Trova il dispositivo Raspberry Pi
@@ -47,25 +107,89 @@ class SpotifyManager:
         except Exception as e:
             logging.error(f"Errore nell'inizializzazione Spotify: {e}")
             
+    @staticmethod
+    def _build_session() -> requests.Session:
+        """Sessione HTTP per spotipy che non ritenta mai i 429
+
+        Con la configurazione predefinita urllib3 ritenta comunque i 429 con
+        Retry-After, dormendo nel thread chiamante e sollevando poi un errore
+        senza header: così il 429 arriva intatto allo scheduler, che rispetta
+        il Retry-After reale.
+        """
+        retry = Retry(
+            total=3,
+            connect=None,
+            read=False,
+            allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+            status=3,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            respect_retry_after_header=False
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+        
+    def _fetch_devices(self) -> list:
+        """Interroga Spotify per la lista dei dispositivi"""
+        devices = self.sp.devices()
+        return devices.get('devices', []) if devices else []
+        
     def _find_device(self):
         """Trova il dispositivo Raspberry Pi tra i dispositivi disponibili"""
-        try:
-            devices = self.sp.devices()
-            for device in devices['devices']:
-                if self.device_name.lower() in device['name'].lower():
+        with span('device_lookup'):
+            try:
+                device = self.device_registry.find_by_name(self.device_name)
+                if device:
                     self.current_device_id = device['id']
                     logging.info(f"Dispositivo trovato: {device['name']} (ID: {device['id']})")
                     return
-                    
-            # Se non trova il dispositivo specifico, usa il primo disponibile
-            if devices['devices']:
-                self.current_device_id = devices['devices'][0]['id']
-                logging.warning(f"Dispositivo {self.device_name} non trovato, uso: {devices['devices'][0]['name']}")
-            else:
-                logging.error("Nessun dispositivo Spotify disponibile")
                 
-        except Exception as e:
-            logging.error(f"Errore nella ricerca dispositivi: {e}")
+                # Se non trova il dispositivo specifico, usa il primo disponibile
+                devices = self.device_registry.get_devices()
+                if devices:
+                    self.current_device_id = devices[0]['id']
+                    logging.warning(f"Dispositivo {self.device_name} non trovato, uso: {devices[0]['name']}")
+                else:
+                    logging.error("Nessun dispositivo Spotify disponibile")
+                
+            except Exception as e:
+                logging.error(f"Errore nella ricerca dispositivi: {e}")
+            
+    def _resolve_local_device(self, action: str) -> bool:
+        """Sostituisce l'ID 'local_librespot' con quello reale del dispositivo Spotify
+
+        Restituisce False se il dispositivo locale non è visibile via API.
+        """
+        with span('device_lookup'):
+            raspberry_device = self.device_registry.find_local_device()
+        if raspberry_device:
+            # Aggiorna l'ID del dispositivo con quello reale
+            self.current_device_id = raspberry_device['id']
+            logging.info(f"Dispositivo SistemaPalestra trovato per {action}, aggiornato ID: {raspberry_device['id']}")
+            return True
+            
+        logging.info(f"Controllo diretto librespot locale - {action} non gestito via API")
+        return False
+        
+    def _run_device_command(self, command):
+        """Esegue un comando sul dispositivo corrente
+
+        Se Spotify risponde 404 (dispositivo non trovato) invalida la cache
+        dei dispositivi, risolve di nuovo il dispositivo e riprova una volta.
+        """
+        try:
+            return command(self.current_device_id)
+        except SpotifyException as e:
+            if e.http_status != 404:
+                raise
+            logging.warning(f"Dispositivo {self.current_device_id} non trovato, aggiorno la cache dispositivi")
+            self.device_registry.invalidate()
+            if not self.device_registry.get_by_id(self.current_device_id):
+                self._find_device()
+            return command(self.current_device_id)
             
     def get_devices(self) -> list:
         """Restituisce la lista dei dispositivi disponibili"""
@@ -96,27 +220,23 @@ class SpotifyManager:
             return []
             
         try:
-            devices = self.sp.devices()
-            device_list = devices.get('devices', []) if devices else []
+            device_list = self.device_registry.get_devices()
             
             # Aggiungi sempre il dispositivo locale librespot se non è già presente
-            local_device_names = ['RaspberryPi', 'SistemaPalestra']
             local_device_found = False
             
             for device in device_list:
-                if device['name'] in local_device_names:
+                if device['name'] in LOCAL_DEVICE_NAMES:
                     local_device_found = True
                     break
             
             # Se il dispositivo locale non è trovato, aggiungilo manualmente
             if not local_device_found:
-                # Controlla se librespot è in esecuzione
-                import subprocess
+                # Controlla se librespot è in esecuzione (stato del supervisore, senza pgrep)
                 try:
-                    result = subprocess.run(['pgrep', 'librespot'], capture_output=True, text=True)
-                    if result.returncode == 0:  # librespot è in esecuzione
+                    if self.librespot.is_running():
                         local_device = {
-                            'id': 'local_librespot',
+                            'id': LOCAL_DEVICE_ID,
                             'name': 'SistemaPalestra',
                             'type': 'Computer',
                             'is_active': False,
@@ -145,50 +265,20 @@ class SpotifyManager:
             
         try:
             # Gestione speciale per dispositivo locale librespot
-            if device_id == 'local_librespot':
-                # Verifica se librespot è in esecuzione
-                import subprocess
+            if device_id == LOCAL_DEVICE_ID:
                 try:
-                    result = subprocess.run(['pgrep', 'librespot'], capture_output=True, text=True)
-                    if result.returncode != 0:  # librespot non è in esecuzione
+                    # Avvia librespot tramite il supervisore se non è in esecuzione
+                    if not self.librespot.is_running():
                         logging.warning("Librespot non in esecuzione, tentativo di avvio...")
-                        # Prova ad avviare librespot
-                        subprocess.Popen([
-                            'librespot',
-                            '--name', 'RaspberryPi',
-                            '--bitrate', '320',
-                            '--device-type', 'speaker',
-                            '--backend', 'alsa',
-                            '--mixer', 'softvol',
-                            '--initial-volume', '70',
-                            '--volume-ctrl', 'linear',
-                            '--cache', '/tmp/librespot-cache',
-                            '--enable-volume-normalisation',
-                            '--normalisation-pregain', '-10'
-                        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                        self.librespot.start()
                         
-                        # Attendi che librespot si avvii
-                        time.sleep(3)
-                        
-                        # Verifica nuovamente
-                        result = subprocess.run(['pgrep', 'librespot'], capture_output=True, text=True)
-                        if result.returncode != 0:
-                            logging.error("Impossibile avviare librespot")
-                            return False
-                        else:
-                            logging.info("Librespot avviato con successo")
-                    
-                    # Attendi che il dispositivo sia disponibile in Spotify
-                    time.sleep(2)
+                    # Attende il segnale di dispositivo pronto invece di attese fisse
+                    if not self.librespot.wait_until_ready():
+                        logging.error("Impossibile avviare librespot")
+                        return False
                     
                     # Cerca il dispositivo SistemaPalestra nei dispositivi Spotify
-                    devices = self.sp.devices()
-                    raspberry_device = None
-                    for device in devices['devices']:
-                        device_name_lower = device['name'].lower()
-                        if 'sistemapalestra' in device_name_lower or device['name'] == 'SistemaPalestra':
-                            raspberry_device = device
-                            break
+                    raspberry_device = self.device_registry.wait_for_local_device(self.local_device_wait)
                     
                     if raspberry_device:
                         # Trasferisci la riproduzione al dispositivo SistemaPalestra
@@ -196,6 +286,7 @@ class SpotifyManager:
                         logging.info(f"Riproduzione trasferita al dispositivo SistemaPalestra: {raspberry_device['id']}")
                         # Salva l'ID del dispositivo reale per future operazioni
                         self.current_device_id = raspberry_device['id']
+                        self.playback_poller.notify_command()
                         return True
                     else:
                         logging.warning("Dispositivo SistemaPalestra non trovato nei dispositivi Spotify disponibili")
@@ -203,28 +294,24 @@ class SpotifyManager:
                         
                         # Prova a riprodurre musica direttamente se c'è una riproduzione attiva
                         try:
-                            current_playback = self.sp.current_playback()
+                            current_playback = self.playback_poller.get_playback()
                             if current_playback and current_playback['is_playing']:
                                 # Pausa la riproduzione corrente
                                 self.sp.pause_playback()
-                                time.sleep(1)
                                 
                                 # Riprendi su qualsiasi dispositivo disponibile per "forzare" l'aggiornamento
-                                devices = self.sp.devices()
-                                if devices['devices']:
-                                    available_device = devices['devices'][0]
+                                devices = self.device_registry.get_devices(force=True)
+                                if devices:
+                                    available_device = devices[0]
                                     self.sp.transfer_playback(device_id=available_device['id'], force_play=True)
-                                    time.sleep(2)
                                     
                                     # Ricontrolla se ora SistemaPalestra è disponibile
-                                    devices = self.sp.devices()
-                                    for device in devices['devices']:
-                                        device_name_lower = device['name'].lower()
-                                        if 'sistemapalestra' in device_name_lower or device['name'] == 'SistemaPalestra':
-                                            self.sp.transfer_playback(device_id=device['id'], force_play=True)
-                                            self.current_device_id = device['id']
-                                            logging.info(f"SistemaPalestra ora disponibile: {device['id']}")
-                                            return True
+                                    device = self.device_registry.wait_for_local_device(self.local_device_wait)
+                                    if device:
+                                        self.sp.transfer_playback(device_id=device['id'], force_play=True)
+                                        self.current_device_id = device['id']
+                                        logging.info(f"SistemaPalestra ora disponibile: {device['id']}")
+                                        return True
                         except Exception as e:
                             logging.error(f"Errore nel tentativo di attivazione: {e}")
                         
@@ -244,6 +331,7 @@ class SpotifyManager:
             # Per dispositivi Spotify normali, trasferisci la riproduzione
             self.sp.transfer_playback(device_id=device_id, force_play=False)
             self.current_device_id = device_id
+            self.playback_poller.notify_command()
             logging.info(f"Riproduzione trasferita al dispositivo: {device_id}")
             return True
             
@@ -259,23 +347,8 @@ class SpotifyManager:
             
         try:
             # Gestione speciale per dispositivo locale librespot
-            if self.current_device_id == 'local_librespot':
-                # Verifica se abbiamo trovato il dispositivo SistemaPalestra reale
-                devices = self.sp.devices()
-                raspberry_device = None
-                for device in devices['devices']:
-                    device_name_lower = device['name'].lower()
-                    if 'sistemapalestra' in device_name_lower or device['name'] == 'SistemaPalestra':
-                        raspberry_device = device
-                        break
-                
-                if raspberry_device:
-                    # Aggiorna l'ID del dispositivo con quello reale
-                    self.current_device_id = raspberry_device['id']
-                    logging.info(f"Dispositivo SistemaPalestra trovato, aggiornato ID: {raspberry_device['id']}")
-                else:
-                    logging.info("Controllo diretto librespot locale - riproduzione non gestita via API")
-                    return True
+            if self.current_device_id == LOCAL_DEVICE_ID and not self._resolve_local_device('riproduzione'):
+                return True
                 
             if not self.current_device_id:
                 self._find_device()
@@ -289,17 +362,22 @@ class SpotifyManager:
                 
             # Avvia la riproduzione
             if playlist_uri:
-                self.sp.start_playback(
-                    device_id=self.current_device_id,
+                self._run_device_command(lambda device_id: self.sp.start_playback(
+                    device_id=device_id,
                     context_uri=playlist_uri
-                )
+                ))
             else:
-                self.sp.start_playback(device_id=self.current_device_id)
+                self._run_device_command(lambda device_id: self.sp.start_playback(device_id=device_id))
                 
-            # Imposta il volume
-            self.sp.volume(self.volume_level, device_id=self.current_device_id)
+            # Imposta il volume solo se diverso da quello già noto
+            current_playback = self.playback_poller.get_playback()
+            if (not current_playback
+                    or current_playback.get('device_id') != self.current_device_id
+                    or current_playback.get('volume') != self.volume_level):
+                self.sp.volume(self.volume_level, device_id=self.current_device_id)
             
             self.is_playing = True
+            self.playback_poller.notify_command(is_playing=True)
             logging.info("Riproduzione avviata")
             return True
             
@@ -315,26 +393,12 @@ class SpotifyManager:
             
         try:
             # Gestione speciale per dispositivo locale librespot
-            if self.current_device_id == 'local_librespot':
-                # Verifica se abbiamo trovato il dispositivo SistemaPalestra reale
-                devices = self.sp.devices()
-                raspberry_device = None
-                for device in devices['devices']:
-                    device_name_lower = device['name'].lower()
-                    if 'sistemapalestra' in device_name_lower or device['name'] == 'SistemaPalestra':
-                        raspberry_device = device
-                        break
-                
-                if raspberry_device:
-                    # Aggiorna l'ID del dispositivo con quello reale
-                    self.current_device_id = raspberry_device['id']
-                    logging.info(f"Dispositivo SistemaPalestra trovato per pausa, aggiornato ID: {raspberry_device['id']}")
-                else:
-                    logging.info("Controllo diretto librespot locale - pausa non gestita via API")
-                    return True
+            if self.current_device_id == LOCAL_DEVICE_ID and not self._resolve_local_device('pausa'):
+                return True
                 
-            self.sp.pause_playback(device_id=self.current_device_id)
+            self._run_device_command(lambda device_id: self.sp.pause_playback(device_id=device_id))
             self.is_playing = False
+            self.playback_poller.notify_command(is_playing=False)
             logging.info("Riproduzione in pausa")
             return True
         except Exception as e:
@@ -349,32 +413,30 @@ class SpotifyManager:
             
         try:
             # Gestione speciale per dispositivo locale librespot
-            if self.current_device_id == 'local_librespot':
-                # Verifica se abbiamo trovato il dispositivo SistemaPalestra reale
-                devices = self.sp.devices()
-                raspberry_device = None
-                for device in devices['devices']:
-                    device_name_lower = device['name'].lower()
-                    if 'sistemapalestra' in device_name_lower or device['name'] == 'SistemaPalestra':
-                        raspberry_device = device
-                        break
-                
-                if raspberry_device:
-                    # Aggiorna l'ID del dispositivo con quello reale
-                    self.current_device_id = raspberry_device['id']
-                    logging.info(f"Dispositivo SistemaPalestra trovato per stop, aggiornato ID: {raspberry_device['id']}")
-                else:
-                    logging.info("Controllo diretto librespot locale - stop non gestito via API")
-                    return True
+            if self.current_device_id == LOCAL_DEVICE_ID and not self._resolve_local_device('stop'):
+                return True
                 
-            self.sp.pause_playback(device_id=self.current_device_id)
+            self._run_device_command(lambda device_id: self.sp.pause_playback(device_id=device_id))
             self.is_playing = False
+            self.playback_poller.notify_command(is_playing=False)
             logging.info("Riproduzione fermata")
             return True
         except Exception as e:
             logging.error(f"Errore nello stop: {e}")
             return False
             
+    def apply_scheduled_playlist(self, playlist_uri: Optional[str]):
+        """Cambio di fascia oraria: passa alla nuova playlist se la musica è in riproduzione"""
+        if not self.sp or not playlist_uri:
+            return False
+        current_playback = self.get_current_playback()
+        if not (current_playback and current_playback.get('is_playing')):
+            return False
+        if current_playback.get('context_uri') == playlist_uri:
+            return True
+        logging.info(f"Fascia oraria cambiata, avvio playlist {playlist_uri}")
+        return self.play_music(playlist_uri)
+        
     def toggle_playback(self):
         """Alterna tra play e pausa"""
         current_playback = self.get_current_playback()
@@ -391,25 +453,11 @@ class SpotifyManager:
             
         try:
             # Gestione speciale per dispositivo locale librespot
-            if self.current_device_id == 'local_librespot':
-                # Verifica se abbiamo trovato il dispositivo SistemaPalestra reale
-                devices = self.sp.devices()
-                raspberry_device = None
-                for device in devices['devices']:
-                    device_name_lower = device['name'].lower()
-                    if 'sistemapalestra' in device_name_lower or device['name'] == 'SistemaPalestra':
-                        raspberry_device = device
-                        break
-                
-                if raspberry_device:
-                    # Aggiorna l'ID del dispositivo con quello reale
-                    self.current_device_id = raspberry_device['id']
-                    logging.info(f"Dispositivo SistemaPalestra trovato per next, aggiornato ID: {raspberry_device['id']}")
-                else:
-                    logging.info("Controllo diretto librespot locale - next non gestito via API")
-                    return True
+            if self.current_device_id == LOCAL_DEVICE_ID and not self._resolve_local_device('next'):
+                return True
                 
-            self.sp.next_track(device_id=self.current_device_id)
+            self._run_device_command(lambda device_id: self.sp.next_track(device_id=device_id))
+            self.playback_poller.notify_command()
             logging.info("Traccia successiva")
             return True
         except Exception as e:
@@ -424,64 +472,79 @@ class SpotifyManager:
             
         try:
             # Gestione speciale per dispositivo locale librespot
-            if self.current_device_id == 'local_librespot':
-                # Verifica se abbiamo trovato il dispositivo SistemaPalestra reale
-                devices = self.sp.devices()
-                raspberry_device = None
-                for device in devices['devices']:
-                    device_name_lower = device['name'].lower()
-                    if 'sistemapalestra' in device_name_lower or device['name'] == 'SistemaPalestra':
-                        raspberry_device = device
-                        break
-                
-                if raspberry_device:
-                    # Aggiorna l'ID del dispositivo con quello reale
-                    self.current_device_id = raspberry_device['id']
-                    logging.info(f"Dispositivo SistemaPalestra trovato per previous, aggiornato ID: {raspberry_device['id']}")
-                else:
-                    logging.info("Controllo diretto librespot locale - previous non gestito via API")
-                    return True
+            if self.current_device_id == LOCAL_DEVICE_ID and not self._resolve_local_device('previous'):
+                return True
                 
-            self.sp.previous_track(device_id=self.current_device_id)
+            self._run_device_command(lambda device_id: self.sp.previous_track(device_id=device_id))
+            self.playback_poller.notify_command()
             logging.info("Traccia precedente")
             return True
         except Exception as e:
             logging.error(f"Errore nel passaggio alla traccia precedente: {e}")
             return False
             
-    def set_volume(self, volume: int):
-        """Imposta il volume (0-100)"""
+    def request_volume(self, volume: int) -> int:
+        """Richiede un cambio volume senza attendere Spotify (latest-wins per dispositivo)"""
+        volume = max(0, min(100, volume))  # Limita tra 0 e 100
+        return self.volume_coalescer.submit(self.current_device_id, volume)
+        
+    def set_volume(self, volume: int, device_id: Optional[str] = None):
+        """Imposta il volume (0-100) sul dispositivo indicato o su quello corrente"""
         if not self.sp:
             logging.error("Spotify client non inizializzato")
             return False
             
+        if device_id is None:
+            device_id = self.current_device_id
+            
         try:
             volume = max(0, min(100, volume))  # Limita tra 0 e 100
             
             # Gestione speciale per dispositivo locale librespot
-            if self.current_device_id == 'local_librespot':
-                # Usa amixer per controllare il volume locale
-                import subprocess
-                try:
-                    subprocess.run(['amixer', 'set', 'Master', f'{volume}%'], 
-                                 capture_output=True, check=True)
-                    self.volume_level = volume
-                    logging.info(f"Volume locale impostato a: {volume}%")
-                    return True
-                except subprocess.CalledProcessError as e:
-                    logging.error(f"Errore nel controllo volume locale: {e}")
+            if device_id == LOCAL_DEVICE_ID:
+                # Usa il mixer ALSA locale (handle persistente, amixer come fallback)
+                if not self.mixer.set_volume(volume):
                     return False
+                self.volume_level = volume
+                self.playback_poller.notify_command(volume=volume)
+                logging.info(f"Volume locale impostato a: {volume}%")
+                return True
                     
-            self.sp.volume(volume, device_id=self.current_device_id)
+            if device_id == self.current_device_id:
+                self._run_device_command(lambda device_id: self.sp.volume(volume, device_id=device_id))
+            else:
+                self.sp.volume(volume, device_id=device_id)
             self.volume_level = volume
+            self.playback_poller.notify_command(volume=volume)
             logging.info(f"Volume impostato a: {volume}")
             return True
         except Exception as e:
             logging.error(f"Errore nell'impostazione volume: {e}")
             return False
             
+    def fade_volume(self, volume: int, duration_ms: int) -> bool:
+        """Porta il volume al valore indicato con una rampa (solo dispositivo locale)"""
+        volume = max(0, min(100, volume))
+        if self.current_device_id != LOCAL_DEVICE_ID:
+            # Sui dispositivi remoti una rampa costerebbe decine di chiamate API
+            logging.info("Rampa volume non supportata sul dispositivo remoto, imposto direttamente")
+            self.request_volume(volume)
+            return True
+            
+        if not self.mixer.ramp(volume, duration_ms):
+            return False
+        self.volume_level = volume
+        self.playback_poller.notify_command(volume=volume)
+        return True
+        
     def get_current_playback(self) -> Optional[Dict[str, Any]]:
-        """Restituisce informazioni sulla riproduzione corrente"""
+        """Restituisce informazioni sulla riproduzione corrente (dallo snapshot del poller)"""
+        if self.playback_poller.is_running:
+            return self.playback_poller.get_playback()
+        return self._fetch_current_playback()
+        
+    def _fetch_current_playback(self) -> Optional[Dict[str, Any]]:
+        """Interroga Spotify per lo stato della riproduzione corrente"""
         if self.demo_mode:
             return {
                 'name': 'Demo Track',
@@ -498,7 +561,8 @@ class SpotifyManager:
             if not self.sp:
                 return None
                 
-            current = self.sp.current_playback()
+            with self.scheduler.priority(PRIORITY_POLLING):
+                current = self.sp.current_playback()
             if current and current.get('item'):
                 track = current['item']
                 album_images = track['album'].get('images', [])
@@ -512,23 +576,67 @@ class SpotifyManager:
                     'duration_ms': track['duration_ms'],
                     'progress_ms': current.get('progress_ms', 0),
                     'is_playing': current.get('is_playing', False),
-                    'volume': current.get('device', {}).get('volume_percent', 0)
+                    'volume': current.get('device', {}).get('volume_percent', 0),
+                    'device': current.get('device', {}).get('name'),
+                    'device_id': current.get('device', {}).get('id'),
+                    'context_uri': (current.get('context') or {}).get('uri')
                 }
+        except RequestShed:
+            # Il poller mantiene lo snapshot precedente
+            raise
         except Exception as e:
             logging.error(f"Errore nel recupero stato riproduzione: {e}")
         return None
             
-    def get_user_playlists(self) -> list:
-        """Restituisce le playlist dell'utente"""
+    def handle_librespot_event(self, event: Dict[str, str]):
+        """Gestisce un evento ricevuto dall'hook --onevent di librespot"""
+        event_type = event.get('event', '')
+        logging.debug(f"Evento librespot: {event_type}")
+        
+        self.librespot.notify_event(event_type)
+        self.playback_poller.apply_local_event(event)
+        
+        if event_type in ('playing', 'started'):
+            self.is_playing = True
+        elif event_type in ('paused', 'stopped'):
+            self.is_playing = False
+            
+    def _fetch_playlists_page(self, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+        """Scarica una pagina di playlist per il catalogo (priorità bassa)"""
+        if not self.sp:
+            return None
+        with self.scheduler.priority(PRIORITY_CATALOG):
+            return self.sp.current_user_playlists(limit=limit, offset=offset)
+            
+    def _fetch_playlist_tracks_page(self, playlist_id: str, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+        """Scarica una pagina di brani di una playlist per il catalogo"""
+        if not self.sp:
+            return None
+        with self.scheduler.priority(PRIORITY_CATALOG):
+            return self.sp.playlist_items(playlist_id, fields=TRACK_FIELDS, limit=limit, offset=offset,
+                                          additional_types=('track',))
+            
+    def get_user_playlists(self, offset: int = 0, limit: int = 50, query: Optional[str] = None) -> tuple:
+        """Restituisce una pagina delle playlist dell'utente dal catalogo locale"""
         try:
-            playlists = self.sp.current_user_playlists(limit=50)
-            return playlists['items']
+            if self.playlist_catalog.is_empty() and self.sp and not query:
+                # Catalogo non ancora popolato: prima pagina direttamente da Spotify
+                playlists = self.sp.current_user_playlists(limit=min(limit, 50), offset=offset)
+                self.playlist_catalog.request_sync()
+                items = [PlaylistCatalog.summarize(item) for item in playlists['items'] if item]
+                return items, playlists.get('total', len(items))
+            return self.playlist_catalog.list_playlists(offset, limit, query)
         except Exception as e:
             logging.error(f"Errore nel recupero playlist: {e}")
-            return []
+            return [], 0
             
-    def search_tracks(self, query: str, limit: int = 20) -> list:
-        """Cerca tracce su Spotify"""
+    def _fetch_search(self, query: str, limit: int) -> list:
+        """Esegue la ricerca su Spotify (usato dalla cache ricerche)"""
+        results = self.sp.search(q=query, type='track', limit=limit)
+        return results['tracks']['items']
+        
+    def search_tracks(self, query: str, limit: int = 20, typeahead: bool = False) -> tuple:
+        """Cerca tracce su Spotify passando dalla cache; restituisce (tracce, origine)"""
         if self.demo_mode:
             # Restituisce risultati demo per la ricerca
             demo_tracks = [
@@ -557,18 +665,17 @@ class SpotifyManager:
                     'uri': 'spotify:track:demo3'
                 }
             ]
-            return demo_tracks[:limit]
+            return demo_tracks[:limit], 'demo'
             
         if not self.sp:
             logging.error("Spotify client non inizializzato")
-            return []
+            return [], None
             
         try:
-            results = self.sp.search(q=query, type='track', limit=limit)
-            return results['tracks']['items']
+            return self.search_cache.search(query, limit, typeahead)
         except Exception as e:
             logging.error(f"Errore nella ricerca: {e}")
-            return []
+            return [], None
             
     def is_connected(self):
         """Verifica se Spotify è connesso"""
@@ -581,6 +688,8 @@ class SpotifyManager:
         try:
             if not self.demo_mode:
                 self._setup_spotify()
+                self.playlist_catalog.start()
+                self.playlist_catalog.request_sync()
                 logging.info("Connessione Spotify reinizializzata con successo")
                 return True
             return False
@@ -588,6 +697,15 @@ class SpotifyManager:
             logging.error(f"Errore nella reinizializzazione Spotify: {e}")
             return False
     
+    def shutdown(self):
+        """Ferma i thread in background del manager"""
+        self.playback_poller.stop()
+        self.playlist_catalog.stop()
+        if self.token_manager:
+            self.token_manager.stop()
+        self.librespot.stop()
+        self.mixer.close()
+    
     def disconnect_spotify(self):
         """Disconnette Spotify e rimuove l'autorizzazione"""
         try:
@@ -595,10 +713,14 @@ class SpotifyManager:
                 logging.info("Modalità demo: disconnessione simulata")
                 return True
                 
-            # Rimuovi il file di cache del token
-            cache_path = ".spotify_cache"
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
+            # Ferma il rinnovo e rimuove il token (memoria e file di cache)
+            if self.token_manager:
+                self.token_manager.stop()
+                self.token_manager = None
+            if getattr(self, 'token_cache', None):
+                self.token_cache.clear()
+            elif os.path.exists(".spotify_cache"):
+                os.remove(".spotify_cache")
                 logging.info("File cache Spotify rimosso")
             
             # Backup del file cache se esiste
@@ -612,6 +734,9 @@ class SpotifyManager:
             self.sp_oauth = None
             self.current_device_id = None
             self.is_playing = False
+            self.device_registry.invalidate()
+            self.playlist_catalog.clear()
+            self.search_cache.clear()
             
             logging.info("Spotify disconnesso con successo")
             return True
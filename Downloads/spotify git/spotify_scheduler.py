@@ -0,0 +1,185 @@
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable
+
+from spotipy.exceptions import SpotifyException
+
+from metrics import SPOTIFY_CALL_DURATION, SPOTIFY_CALL_ERRORS
+from request_timing import span
+
+# Classi di priorità (valore più basso = più importante)
+PRIORITY_USER = 0       # Comandi dall'interfaccia web
+PRIORITY_GPIO = 1       # Pulsante fisico
+PRIORITY_POLLING = 2    # Polling stato e health check
+PRIORITY_CATALOG = 3    # Aggiornamento catalogo playlist
+
+PRIORITY_NAMES = {
+    PRIORITY_USER: 'user',
+    PRIORITY_GPIO: 'gpio',
+    PRIORITY_POLLING: 'polling',
+    PRIORITY_CATALOG: 'catalog'
+}
+
+
+class RequestShed(Exception):
+    """Richiesta a bassa priorità scartata perché la quota è sotto pressione"""
+
+
+class SpotifyRequestScheduler:
+    """Scheduler centrale delle chiamate alle API Spotify
+
+    Un token bucket limita il ritmo delle richieste; quando i token scarseggiano
+    o Spotify ha risposto 429 le richieste vengono servite per priorità, il
+    polling viene scartato e si rispetta l'header Retry-After.
+    """
+
+    def __init__(self):
+        self.rate = float(os.getenv('SPOTIFY_RATE_LIMIT', 5))  # richieste al secondo
+        self.burst = float(os.getenv('SPOTIFY_RATE_BURST', 10))
+        # Sotto questa soglia di token il polling viene scartato
+        self.shed_threshold = self.burst * 0.3
+        # Attesa massima per un token, per classe di priorità
+        self.max_wait = {
+            PRIORITY_USER: float(os.getenv('SPOTIFY_MAX_WAIT_USER', 10)),
+            PRIORITY_GPIO: float(os.getenv('SPOTIFY_MAX_WAIT_GPIO', 10)),
+            PRIORITY_POLLING: 0.0,
+            PRIORITY_CATALOG: 60.0
+        }
+        # Un comando utente rallentato da un 429 viene ritentato se l'attesa è breve
+        self.max_retry_after = 5.0
+
+        self.blocked_until = 0.0
+        self.shed_count = 0
+        self.throttled_count = 0
+
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._waiting = {priority: 0 for priority in PRIORITY_NAMES}
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    @contextmanager
+    def priority(self, level: int):
+        """Imposta la priorità delle chiamate Spotify eseguite dal thread corrente"""
+        previous = getattr(self._local, 'priority', None)
+        self._local.priority = level
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def current_priority(self) -> int:
+        """Priorità del thread corrente (comandi utente se non specificata)"""
+        priority = getattr(self._local, 'priority', None)
+        return PRIORITY_USER if priority is None else priority
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, priority: int):
+        """Attende un token rispettando le priorità; solleva RequestShed se scartata"""
+        deadline = time.monotonic() + self.max_wait.get(priority, 0.0)
+
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                blocked = now < self.blocked_until
+                higher_waiting = any(self._waiting[p] for p in self._waiting if p < priority)
+
+                if priority == PRIORITY_POLLING and (blocked or higher_waiting or self._tokens < self.shed_threshold):
+                    self.shed_count += 1
+                    raise RequestShed("Polling Spotify scartato: quota sotto pressione")
+
+                if not blocked and not higher_waiting and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_time = self.blocked_until - now if blocked else max((1 - self._tokens) / self.rate, 0.01)
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.shed_count += 1
+                    raise RequestShed(f"Timeout in attesa della quota Spotify ({PRIORITY_NAMES[priority]})")
+
+                self._waiting[priority] += 1
+                try:
+                    self._condition.wait(min(wait_time, remaining))
+                finally:
+                    self._waiting[priority] -= 1
+                    self._condition.notify_all()
+
+    def execute(self, func: Callable, *args, **kwargs) -> Any:
+        """Esegue una chiamata Spotify passando dallo scheduler"""
+        priority = self.current_priority()
+        with span('spotify.quota'):
+            self.acquire(priority)
+        try:
+            return func(*args, **kwargs)
+        except SpotifyException as e:
+            if e.http_status != 429:
+                raise
+            retry_after = self._handle_rate_limit(e)
+            if priority > PRIORITY_GPIO or retry_after > self.max_retry_after:
+                raise
+
+        # Comando utente o GPIO: ritenta una volta dopo il Retry-After
+        with span('spotify.quota'):
+            self.acquire(priority)
+        return func(*args, **kwargs)
+
+    def _handle_rate_limit(self, error: SpotifyException) -> float:
+        """Registra un 429 e blocca le richieste per la durata di Retry-After"""
+        headers = getattr(error, 'headers', None) or {}
+        try:
+            retry_after = float(headers.get('Retry-After', 1))
+        except (TypeError, ValueError):
+            retry_after = 1.0
+
+        with self._condition:
+            self.throttled_count += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            self._tokens = 0
+            self._condition.notify_all()
+
+        logging.warning(f"Rate limit Spotify (429): richieste sospese per {retry_after:.0f}s")
+        return retry_after
+
+    def get_stats(self) -> dict:
+        """Stato corrente dello scheduler"""
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                'tokens': round(self._tokens, 2),
+                'blocked_for': round(max(0.0, self.blocked_until - time.monotonic()), 1),
+                'shed': self.shed_count,
+                'throttled': self.throttled_count
+            }
+
+
+class ScheduledSpotify:
+    """Proxy del client spotipy: ogni metodo pubblico passa dallo scheduler"""
+
+    def __init__(self, client, scheduler: SpotifyRequestScheduler):
+        self._client = client
+        self._scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        def scheduled(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                with span(f'spotify.{name}'):
+                    return self._scheduler.execute(attr, *args, **kwargs)
+            except Exception as e:
+                SPOTIFY_CALL_ERRORS.inc(method=name, error=type(e).__name__)
+                raise
+            finally:
+                SPOTIFY_CALL_DURATION.observe(time.perf_counter() - started_at, method=name)
+        return scheduled
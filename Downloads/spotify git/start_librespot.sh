@@ -15,6 +15,7 @@ DEVICE_NAME="${LIBRESPOT_NAME:-RaspberryPi}"
 BITRATE="${LIBRESPOT_BITRATE:-320}"
 DEVICE_TYPE="${LIBRESPOT_DEVICE_TYPE:-speaker}"
 BACKEND="${LIBRESPOT_BACKEND:-alsa}"
+ONEVENT_HOOK="${LIBRESPOT_ONEVENT:-$(cd "$(dirname "$0")" && pwd)/librespot_event_hook.sh}"
 
 # Colori per output
 RED='\033[0;31m'
@@ -65,7 +66,8 @@ librespot \
     --volume-ctrl linear \
     --cache /tmp/librespot-cache \
     --enable-volume-normalisation \
-    --normalisation-pregain -10 &
+    --normalisation-pregain -10 \
+    --onevent "$ONEVENT_HOOK" &
 
 LIBRESPOT_PID=$!
 
@@ -0,0 +1,69 @@
+import time
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+
+def freeze(value: Any) -> Any:
+    """Rende immutabile un valore (dict -> mappingproxy, list -> tuple)"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Copia modificabile e serializzabile di un valore congelato"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+class StateStore:
+    """Stato del sistema come snapshot immutabili versionati
+
+    I writer pubblicano un nuovo snapshot congelato con versione crescente;
+    i lettori ottengono lo snapshot corrente senza lock (un solo riferimento
+    sostituito atomicamente) e possono attendere una versione successiva.
+    """
+
+    def __init__(self, initial: Dict[str, Any]):
+        self.updated_at = time.time()
+        self._current: Tuple[int, Mapping[str, Any]] = (0, freeze(initial))
+        self._condition = threading.Condition()
+
+    @property
+    def version(self) -> int:
+        return self._current[0]
+
+    def get(self) -> Mapping[str, Any]:
+        """Snapshot corrente (immutabile)"""
+        return self._current[1]
+
+    def snapshot(self) -> Tuple[int, Mapping[str, Any]]:
+        """Versione e snapshot corrente, letti insieme in modo coerente"""
+        return self._current
+
+    def update(self, **changes) -> int:
+        """Pubblica un nuovo snapshot con le modifiche; la versione cresce solo se cambia qualcosa"""
+        with self._condition:
+            version, state = self._current
+            frozen = {key: freeze(value) for key, value in changes.items()}
+            if all(key in state and state[key] == value for key, value in frozen.items()):
+                return version
+
+            new_state = dict(state)
+            new_state.update(frozen)
+            self.updated_at = time.time()
+            self._current = (version + 1, MappingProxyType(new_state))
+            self._condition.notify_all()
+            return version + 1
+
+    def wait_for_version(self, version: int, timeout: Optional[float] = None) -> Tuple[int, Mapping[str, Any]]:
+        """Attende uno snapshot con versione maggiore di quella indicata"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._current[0] > version, timeout=timeout)
+            return self._current
@@ -0,0 +1,89 @@
+import copy
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class StatusEventStream:
+    """Flusso di eventi per lo stato del sistema (Server-Sent Events)
+
+    Ogni pubblicazione calcola le differenze rispetto all'ultimo stato e le
+    conserva in un buffer circolare, così i client che si riconnettono con
+    Last-Event-ID ricevono solo gli eventi persi.
+    """
+
+    def __init__(self, buffer_size: int = 256, ignored_keys: Tuple[str, ...] = ()):
+        self.ignored_keys = set(ignored_keys)
+        self.last_event_id = 0
+        self.closed = False
+
+        self._state = {}
+        self._events = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+
+    def publish_state(self, state: Dict[str, Any]) -> Optional[int]:
+        """Pubblica un nuovo stato; restituisce l'ID dell'evento o None se invariato"""
+        with self._condition:
+            diff = {
+                key: value for key, value in state.items()
+                if key not in self.ignored_keys and self._state.get(key) != value
+            }
+            if not diff:
+                return None
+
+            self._state = copy.deepcopy(state)
+            return self._append('status', copy.deepcopy(diff))
+
+    def publish_event(self, event_type: str, data: Dict[str, Any]) -> int:
+        """Pubblica un evento arbitrario (non modifica lo stato)"""
+        with self._condition:
+            return self._append(event_type, copy.deepcopy(data))
+
+    def _append(self, event_type: str, data: Dict[str, Any]) -> int:
+        self.last_event_id += 1
+        self._events.append((self.last_event_id, event_type, data))
+        self._condition.notify_all()
+        return self.last_event_id
+
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        """Restituisce l'ID dell'ultimo evento e lo stato completo corrente"""
+        with self._condition:
+            return self.last_event_id, copy.deepcopy(self._state)
+
+    def events_since(self, event_id: int) -> Optional[List[Tuple[int, str, Dict[str, Any]]]]:
+        """Eventi successivi all'ID indicato, None se non più disponibili nel buffer"""
+        with self._condition:
+            return self._events_since(event_id)
+
+    def _events_since(self, event_id: int):
+        if event_id > self.last_event_id:
+            return None
+        if event_id == self.last_event_id:
+            return []
+        if not self._events or self._events[0][0] > event_id + 1:
+            return None
+        return [event for event in self._events if event[0] > event_id]
+
+    def wait_for_events(self, event_id: int, timeout: Optional[float] = None):
+        """Attende eventi successivi all'ID indicato (lista vuota in caso di timeout)"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.closed or self.last_event_id != event_id, timeout=timeout)
+            return self._events_since(event_id)
+
+    def close(self):
+        """Chiude il flusso: i client in attesa terminano (es. allo shutdown)"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+def format_sse(data: Dict[str, Any], event_type: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    """Serializza un evento nel formato text/event-stream"""
+    message = ''
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    if event_type:
+        message += f'event: {event_type}\n'
+    message += f'data: {json.dumps(data)}\n\n'
+    return message
@@ -0,0 +1,46 @@
+"""Test del mixer ALSA (rampe e annullamento)"""
+
+import time
+
+import pytest
+
+from alsa_mixer import AlsaMixer
+
+
+@pytest.fixture
+def mixer(monkeypatch):
+    """Mixer senza ALSA: registra i volumi scritti invece di chiamare amixer"""
+    mixer = AlsaMixer()
+    mixer.alsa_available = False
+    mixer.ramp_step_ms = 10
+    mixer.written = []
+    monkeypatch.setattr(mixer, '_set_volume_subprocess', lambda volume: mixer.written.append(volume) or True)
+    return mixer
+
+
+def test_set_volume_clamps(mixer):
+    assert mixer.set_volume(120)
+    assert mixer.set_volume(-5)
+    assert mixer.written == [100, 0]
+
+
+def test_blocking_ramp_reaches_target(mixer):
+    assert mixer.ramp(80, 50, start=40, blocking=True)
+    assert mixer.written[-1] == 80
+    assert mixer.written == sorted(mixer.written)
+
+
+def test_stale_ramp_step_does_not_overwrite_newer_volume(mixer):
+    stale_generation = mixer._next_generation()
+    mixer.set_volume(30)
+    # Passo di una rampa già superata che arriva dopo l'impostazione dell'utente
+    assert not mixer._apply(90, stale_generation)
+    assert mixer.written == [30]
+
+
+def test_set_volume_cancels_running_ramp(mixer):
+    mixer.ramp(100, 1000, start=0)
+    time.sleep(0.05)
+    mixer.set_volume(10)
+    time.sleep(0.05)
+    assert mixer.written[-1] == 10
@@ -0,0 +1,100 @@
+"""Test della coda dei comandi di riproduzione"""
+
+import threading
+import time
+
+import pytest
+
+from command_queue import CommandQueue, STATUS_QUEUED, STATUS_SUCCEEDED, STATUS_FAILED
+
+
+def wait_for_status(queue, command_id, statuses=(STATUS_SUCCEEDED, STATUS_FAILED), timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(command_id)
+        if job and job['status'] in statuses:
+            return job
+        time.sleep(0.005)
+    return queue.get(command_id)
+
+
+@pytest.fixture
+def updates():
+    return []
+
+
+@pytest.fixture
+def queue(updates):
+    queue = CommandQueue(on_update=updates.append)
+    yield queue
+    queue.shutdown(wait=True)
+
+
+def test_submit_returns_queued_record(queue):
+    gate = threading.Event()
+    job = queue.submit('play', gate.wait, 5)
+    assert job['status'] == STATUS_QUEUED
+    assert job['success'] is None
+    gate.set()
+
+
+def test_successful_command_lifecycle(queue, updates):
+    job = queue.submit('play', lambda: None, success_message='Avviata')
+    done = wait_for_status(queue, job['id'])
+    assert done['status'] == STATUS_SUCCEEDED
+    assert done['success'] is True
+    assert done['message'] == 'Avviata'
+    assert done['started_at'] >= done['created_at']
+    assert done['finished_at'] >= done['started_at']
+    assert isinstance(done['timing'], dict)
+    time.sleep(0.02)
+    assert [update['status'] for update in updates if update['id'] == job['id']] == \
+        ['queued', 'running', 'succeeded']
+
+
+@pytest.mark.parametrize('func', [lambda: False, lambda: 1 / 0])
+def test_failed_command(queue, func):
+    job = queue.submit('pause', func, error_message='Errore')
+    done = wait_for_status(queue, job['id'])
+    assert done['status'] == STATUS_FAILED
+    assert done['success'] is False
+    assert done['message'] == 'Errore'
+
+
+def test_commands_run_in_submission_order(queue):
+    order = []
+    jobs = [queue.submit('cmd', order.append, i) for i in range(5)]
+    wait_for_status(queue, jobs[-1]['id'])
+    assert order == list(range(5))
+
+
+def test_history_is_pruned_oldest_first(updates):
+    queue = CommandQueue(on_update=updates.append)
+    queue.history_size = 3
+    try:
+        jobs = [queue.submit('cmd', lambda: None) for _ in range(5)]
+        wait_for_status(queue, jobs[-1]['id'])
+        assert queue.get(jobs[0]['id']) is None
+        assert queue.get(jobs[1]['id']) is None
+        assert all(queue.get(job['id']) for job in jobs[2:])
+    finally:
+        queue.shutdown(wait=True)
+
+
+def test_get_returns_a_copy(queue):
+    job = queue.submit('cmd', lambda: None)
+    wait_for_status(queue, job['id'])
+    queue.get(job['id'])['status'] = 'modificato'
+    assert queue.get(job['id'])['status'] == STATUS_SUCCEEDED
+
+
+def test_notification_errors_do_not_break_commands():
+    def broken(job):
+        raise RuntimeError('listener rotto')
+
+    queue = CommandQueue(on_update=broken)
+    try:
+        job = queue.submit('cmd', lambda: None)
+        assert wait_for_status(queue, job['id'])['status'] == STATUS_SUCCEEDED
+    finally:
+        queue.shutdown(wait=True)
@@ -0,0 +1,133 @@
+"""Test del poller dello stato di riproduzione"""
+
+import threading
+
+import pytest
+
+pytest.importorskip('spotipy')
+
+import playback_poller
+from playback_poller import PlaybackPoller
+from spotify_scheduler import RequestShed
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Orologio controllato per intervalli, boost e riconciliazione"""
+    now = [1000.0]
+    monkeypatch.setattr(playback_poller.time, 'time', lambda: now[0])
+    return now
+
+
+class FakeFetch:
+    """Fetch registrato: restituisce lo stato impostato o solleva l'errore indicato"""
+
+    def __init__(self, playback=None):
+        self.playback = playback
+        self.error = None
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.playback
+
+
+@pytest.fixture
+def poller(clock):
+    poller = PlaybackPoller(FakeFetch())
+    poller.playing_interval = 3
+    poller.idle_interval = 15
+    poller.boost_interval = 1
+    poller.boost_duration = 6
+    poller.reconcile_interval = 60
+    return poller
+
+
+def test_interval_idle_and_playing(poller):
+    assert poller._next_interval() == 15
+    poller.fetch_playback.playback = {'is_playing': True}
+    poller.refresh()
+    assert poller._next_interval() == 3
+
+
+def test_command_boosts_polling_for_a_while(poller, clock):
+    poller.notify_command()
+    assert poller._next_interval() == 1
+    clock[0] += 7
+    assert poller._next_interval() == 15
+
+
+def test_notify_command_applies_changes_immediately(poller):
+    poller.fetch_playback.playback = {'is_playing': True, 'volume': 40}
+    poller.refresh()
+    version = poller.version
+    poller.notify_command(is_playing=False)
+    assert poller.get_playback()['is_playing'] is False
+    assert poller.version == version + 1
+
+
+def test_version_changes_only_when_playback_changes(poller):
+    poller.fetch_playback.playback = {'is_playing': True}
+    poller.refresh()
+    poller.refresh()
+    assert poller.version == 1
+
+
+def test_shed_or_failed_poll_keeps_snapshot(poller):
+    poller.fetch_playback.playback = {'is_playing': True}
+    poller.refresh()
+    poller.fetch_playback.error = RequestShed('quota')
+    assert poller.refresh() == {'is_playing': True}
+    poller.fetch_playback.error = RuntimeError('rete')
+    assert poller.refresh() == {'is_playing': True}
+    assert poller.version == 1
+
+
+def test_wait_for_change_wakes_on_publish(poller):
+    timer = threading.Timer(0.05, lambda: poller._publish({'is_playing': True}))
+    timer.start()
+    assert poller.wait_for_change(0, timeout=5) == 1
+
+
+def test_wait_for_change_times_out(poller):
+    assert poller.wait_for_change(0, timeout=0.01) == 0
+
+
+def test_local_events_update_snapshot_and_slow_polling(poller):
+    poller.apply_local_event({'event': 'volume_set', 'volume': '65535'})
+    assert poller.get_playback()['volume'] == 100
+    assert poller._next_interval() == 60
+    poller.apply_local_event({'event': 'paused', 'position_ms': '1200'})
+    assert poller.get_playback()['is_playing'] is False
+    assert poller.get_playback()['progress_ms'] == 1200
+
+
+def test_session_disconnected_returns_to_normal_polling(poller):
+    poller.apply_local_event({'event': 'playing'})
+    poller.apply_local_event({'event': 'session_disconnected'})
+    assert not poller.local_events_active
+    assert poller._next_interval() == 3
+
+
+def test_playback_on_other_device_leaves_reconcile_mode(poller):
+    poller.apply_local_event({'event': 'playing'})
+    poller.fetch_playback.playback = {'is_playing': True, 'device': 'Telefono'}
+    poller.refresh()
+    assert not poller.local_events_active
+    assert poller._next_interval() == 3
+
+
+def test_local_playback_stays_in_reconcile_mode(poller):
+    poller.apply_local_event({'event': 'playing'})
+    poller.fetch_playback.playback = {'is_playing': True, 'device': 'SistemaPalestra'}
+    poller.refresh()
+    assert poller._next_interval() == 60
+
+
+def test_reconcile_mode_expires_without_local_events(poller, clock):
+    poller.apply_local_event({'event': 'playing'})
+    clock[0] += 61
+    assert poller._next_interval() == 3
+    assert not poller.local_events_active
@@ -0,0 +1,134 @@
+"""Test del catalogo locale delle playlist"""
+
+import pytest
+
+pytest.importorskip('spotipy')
+
+from playlist_catalog import PlaylistCatalog
+
+
+def make_playlist(i, snapshot='1'):
+    return {
+        'id': f'pl{i}',
+        'name': f'Playlist {i}',
+        'uri': f'spotify:playlist:pl{i}',
+        'owner': {'display_name': 'Utente'},
+        'images': [{'url': f'https://example.invalid/{i}.jpg'}],
+        'snapshot_id': f'snap-{i}-{snapshot}',
+        'tracks': {'total': 2}
+    }
+
+
+class FakeSpotify:
+    """Pagine di playlist e brani come le restituisce l'API"""
+
+    def __init__(self, playlists):
+        self.playlists = playlists
+        self.fail_at_offset = None
+        self.track_calls = []
+
+    def playlists_page(self, offset, limit):
+        if offset == self.fail_at_offset:
+            return None
+        items = self.playlists[offset:offset + limit]
+        more = offset + limit < len(self.playlists)
+        return {'items': items, 'next': 'next' if more else None, 'total': len(self.playlists)}
+
+    def tracks_page(self, playlist_id, offset, limit):
+        self.track_calls.append(playlist_id)
+        items = [
+            {'track': {'id': f'{playlist_id}-t{i}', 'uri': f'spotify:track:{i}', 'name': f'Brano {i}',
+                       'duration_ms': 1000, 'artists': [{'name': 'A'}, {'name': 'B'}]}}
+            for i in range(2)
+        ] + [{'track': None}]
+        return {'items': items[offset:offset + limit], 'next': None, 'total': len(items)}
+
+
+@pytest.fixture
+def spotify():
+    return FakeSpotify([make_playlist(i) for i in range(5)])
+
+
+@pytest.fixture
+def catalog(spotify, tmp_path, monkeypatch):
+    monkeypatch.setenv('PLAYLIST_CATALOG_PATH', str(tmp_path / 'catalog.db'))
+    catalog = PlaylistCatalog(spotify.playlists_page, spotify.tracks_page)
+    catalog.page_size = 2
+    yield catalog
+    catalog.close()
+
+
+def test_sync_stores_all_pages_in_order(catalog):
+    assert catalog.is_empty()
+    assert catalog.sync()
+    playlists, total = catalog.list_playlists(limit=10)
+    assert total == 5
+    assert [playlist['id'] for playlist in playlists] == [f'pl{i}' for i in range(5)]
+    assert playlists[0]['image'] == 'https://example.invalid/0.jpg'
+    assert playlists[0]['tracks'] == {'total': 2}
+
+
+def test_tracks_are_stored_and_unavailable_ones_skipped(catalog):
+    catalog.sync()
+    tracks = catalog.get_tracks('pl0')
+    assert [track['id'] for track in tracks] == ['pl0-t0', 'pl0-t1']
+    assert tracks[0]['artists'] == 'A, B'
+
+
+def test_tracks_refetched_only_when_snapshot_changes(catalog, spotify):
+    catalog.sync()
+    spotify.track_calls.clear()
+    catalog.sync()
+    assert spotify.track_calls == []
+
+    spotify.playlists[2] = make_playlist(2, snapshot='2')
+    catalog.sync()
+    assert spotify.track_calls == ['pl2']
+
+
+def test_removed_playlists_are_pruned_after_complete_sync(catalog, spotify):
+    catalog.sync()
+    del spotify.playlists[1]
+    catalog.sync()
+    playlists, total = catalog.list_playlists(limit=10)
+    assert total == 4
+    assert 'pl1' not in [playlist['id'] for playlist in playlists]
+    assert catalog.get_tracks('pl1') == []
+
+
+def test_partial_sync_does_not_prune(catalog, spotify):
+    catalog.sync()
+    spotify.fail_at_offset = 2
+    catalog.sync()
+    assert catalog.list_playlists(limit=10)[1] == 5
+
+
+def test_failed_sync_keeps_catalog(catalog, spotify):
+    catalog.sync()
+
+    def broken(offset, limit):
+        raise RuntimeError('API non disponibile')
+
+    catalog.fetch_playlists_page = broken
+    assert not catalog.sync()
+    assert catalog.last_error == 'API non disponibile'
+    assert catalog.list_playlists(limit=10)[1] == 5
+
+
+def test_query_filter_escapes_wildcards(catalog, spotify):
+    spotify.playlists.append(dict(make_playlist(9), name='100% Rock_n'))
+    catalog.sync()
+    assert [p['id'] for p in catalog.list_playlists(query='100%')[0]] == ['pl9']
+    assert catalog.list_playlists(query='_')[1] == 1
+    assert catalog.list_playlists(query='playlist 3')[1] == 1
+
+
+def test_get_by_uri(catalog):
+    catalog.sync()
+    assert catalog.get_by_uri('spotify:playlist:pl3')['name'] == 'Playlist 3'
+    assert catalog.get_by_uri('spotify:playlist:missing') is None
+
+
+def test_summarize_matches_catalog_shape(catalog, spotify):
+    catalog.sync()
+    assert PlaylistCatalog.summarize(spotify.playlists[0]) == catalog.get_by_uri('spotify:playlist:pl0')
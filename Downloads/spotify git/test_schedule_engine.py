@@ -0,0 +1,87 @@
+"""Test del motore delle fasce orarie"""
+
+import os
+import re
+from datetime import datetime
+
+import pytest
+
+from schedule_engine import ScheduleEngine
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """Sostituisce i periodi configurati nell'ambiente e compila il motore"""
+    for key in list(os.environ):
+        if re.match(r'^TIME_PERIOD_\d+_', key) or key == 'SCHEDULE_HOLIDAYS':
+            monkeypatch.delenv(key)
+
+    def _configure(*periods, holidays=''):
+        for i, (start, end, playlist, days) in enumerate(periods, 1):
+            monkeypatch.setenv(f'TIME_PERIOD_{i}_START', start)
+            monkeypatch.setenv(f'TIME_PERIOD_{i}_END', end)
+            monkeypatch.setenv(f'TIME_PERIOD_{i}_PLAYLIST', playlist)
+            monkeypatch.setenv(f'TIME_PERIOD_{i}_DAYS', days)
+        monkeypatch.setenv('SCHEDULE_HOLIDAYS', holidays)
+        return ScheduleEngine()
+
+    return _configure
+
+
+def playlist_at(engine, when):
+    period = engine.current_period(when)
+    return period['playlist'] if period else None
+
+
+def test_same_day_period(configure):
+    engine = configure(('08:00', '12:00', 'morning', ''))
+    assert playlist_at(engine, datetime(2026, 10, 16, 8, 0)) == 'morning'
+    assert playlist_at(engine, datetime(2026, 10, 16, 11, 59)) == 'morning'
+    assert playlist_at(engine, datetime(2026, 10, 16, 12, 0)) is None
+    assert playlist_at(engine, datetime(2026, 10, 16, 7, 59)) is None
+
+
+def test_earlier_period_takes_precedence(configure):
+    engine = configure(('10:00', '11:00', 'first', ''), ('08:00', '12:00', 'second', ''))
+    assert playlist_at(engine, datetime(2026, 10, 16, 9, 0)) == 'second'
+    assert playlist_at(engine, datetime(2026, 10, 16, 10, 30)) == 'first'
+
+
+def test_overnight_friday_to_saturday(configure):
+    # 2026-10-16 è un venerdì
+    engine = configure(('22:00', '02:00', 'late', 'fri'))
+    assert playlist_at(engine, datetime(2026, 10, 16, 23, 0)) == 'late'
+    assert playlist_at(engine, datetime(2026, 10, 17, 1, 0)) == 'late'
+    assert playlist_at(engine, datetime(2026, 10, 17, 2, 0)) is None
+    assert playlist_at(engine, datetime(2026, 10, 16, 1, 0)) is None
+    assert playlist_at(engine, datetime(2026, 10, 17, 23, 0)) is None
+
+
+def test_overnight_sunday_to_monday(configure):
+    # 2026-10-18 è una domenica
+    engine = configure(('23:00', '01:30', 'sunday night', 'sun'))
+    assert playlist_at(engine, datetime(2026, 10, 18, 23, 30)) == 'sunday night'
+    assert playlist_at(engine, datetime(2026, 10, 19, 1, 0)) == 'sunday night'
+    assert playlist_at(engine, datetime(2026, 10, 18, 1, 0)) is None
+
+
+def test_overnight_from_holiday(configure):
+    engine = configure(('22:00', '02:00', 'party', 'hol'), ('00:00', '12:00', 'weekday', 'mon-fri'),
+                       holidays='2026-10-16')
+    assert playlist_at(engine, datetime(2026, 10, 16, 23, 0)) == 'party'
+    assert playlist_at(engine, datetime(2026, 10, 17, 1, 0)) == 'party'
+    assert playlist_at(engine, datetime(2026, 10, 16, 1, 0)) is None
+
+
+def test_next_boundary(configure):
+    engine = configure(('08:00', '12:00', 'morning', ''))
+    assert engine.next_boundary(datetime(2026, 10, 16, 7, 0)) == datetime(2026, 10, 16, 8, 0)
+    assert engine.next_boundary(datetime(2026, 10, 16, 9, 0)) == datetime(2026, 10, 16, 12, 0)
+    assert engine.next_boundary(datetime(2026, 10, 16, 13, 0)) == datetime(2026, 10, 17, 0, 0)
+
+
+def test_reload_picks_up_new_configuration(configure, monkeypatch):
+    engine = configure(('08:00', '12:00', 'morning', ''))
+    monkeypatch.setenv('TIME_PERIOD_1_PLAYLIST', 'changed')
+    engine.reload()
+    assert playlist_at(engine, datetime(2026, 10, 16, 9, 0)) == 'changed'
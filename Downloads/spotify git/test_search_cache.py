@@ -0,0 +1,116 @@
+"""Test della cache delle ricerche (LRU, TTL, typeahead)"""
+
+import threading
+
+import pytest
+
+import search_cache
+from search_cache import SearchCache, normalize_query
+
+
+def make_track(name, artist='Artista', album='Album'):
+    return {'name': name, 'artists': [{'name': artist}], 'album': {'name': album}}
+
+
+class FakeFetch:
+    """Fetch registrato: restituisce una traccia per query"""
+
+    def __init__(self, results=None):
+        self.calls = []
+        self.results = results or {}
+
+    def __call__(self, query, limit):
+        self.calls.append((query, limit))
+        return self.results.get(query, [make_track(query)])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Orologio controllato per il TTL"""
+    now = [1000.0]
+    monkeypatch.setattr(search_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_normalize_query():
+    assert normalize_query('  Daft   PUNK ') == 'daft punk'
+
+
+def test_repeated_search_hits_cache():
+    fetch = FakeFetch()
+    cache = SearchCache(fetch)
+    assert cache.search('Daft Punk')[1] == 'spotify'
+    assert cache.search('daft  punk')[1] == 'cache'
+    assert fetch.calls == [('daft punk', 20)]
+    assert cache.get_stats()['hits'] == 1
+
+
+def test_limit_is_part_of_the_key():
+    fetch = FakeFetch()
+    cache = SearchCache(fetch)
+    cache.search('daft', limit=10)
+    cache.search('daft', limit=20)
+    assert len(fetch.calls) == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    fetch = FakeFetch()
+    cache = SearchCache(fetch)
+    cache.ttl = 60
+    cache.search('daft')
+    clock[0] += 59
+    assert cache.search('daft')[1] == 'cache'
+    clock[0] += 2
+    assert cache.search('daft')[1] == 'spotify'
+    assert len(fetch.calls) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    fetch = FakeFetch()
+    cache = SearchCache(fetch)
+    cache.max_entries = 2
+    cache.search('aa')
+    cache.search('bb')
+    cache.search('aa')  # 'aa' diventa la più recente
+    cache.search('cc')  # rimuove 'bb'
+    assert cache.search('aa')[1] == 'cache'
+    assert cache.search('bb')[1] == 'spotify'
+    assert cache.get_stats()['entries'] == 2
+
+
+def test_typeahead_filters_cached_prefix_without_fetching():
+    fetch = FakeFetch({'da': [make_track('Da Funk', 'Daft Punk'), make_track('Dancing Queen', 'ABBA')]})
+    cache = SearchCache(fetch)
+    cache.search('da')
+    tracks, source = cache.search('daft', typeahead=True)
+    assert source == 'prefix'
+    assert [track['name'] for track in tracks] == ['Da Funk']
+    assert fetch.calls == [('da', 20)]
+
+
+def test_typeahead_never_fetches():
+    fetch = FakeFetch()
+    cache = SearchCache(fetch)
+    assert cache.search('daft', typeahead=True) == ([], None)
+    assert fetch.calls == []
+
+
+def test_concurrent_identical_searches_share_one_fetch():
+    release = threading.Event()
+    fetch = FakeFetch()
+
+    def slow_fetch(query, limit):
+        release.wait(5)
+        return fetch(query, limit)
+
+    cache = SearchCache(slow_fetch)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.search('daft'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(fetch.calls) == 1
+    assert sorted(source for _, source in results) == ['cache', 'cache', 'cache', 'spotify']
@@ -0,0 +1,119 @@
+"""Test dello scheduler delle chiamate Spotify (priorità e 429)"""
+
+import time
+
+import pytest
+
+pytest.importorskip('spotipy')
+
+from spotipy.exceptions import SpotifyException
+
+from spotify_scheduler import (
+    SpotifyRequestScheduler, RequestShed,
+    PRIORITY_USER, PRIORITY_GPIO, PRIORITY_POLLING, PRIORITY_CATALOG
+)
+
+
+def rate_limited(retry_after):
+    return SpotifyException(429, -1, 'API rate limit exceeded', headers={'Retry-After': str(retry_after)})
+
+
+class Flaky:
+    """Funzione che fallisce con gli errori indicati, poi restituisce 'ok'"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = SpotifyRequestScheduler()
+    scheduler.rate = 100.0
+    scheduler.burst = 10.0
+    scheduler.shed_threshold = 3.0
+    scheduler._tokens = scheduler.burst
+    return scheduler
+
+
+def test_default_priority_is_user(scheduler):
+    assert scheduler.current_priority() == PRIORITY_USER
+    with scheduler.priority(PRIORITY_POLLING):
+        assert scheduler.current_priority() == PRIORITY_POLLING
+    assert scheduler.current_priority() == PRIORITY_USER
+
+
+def test_polling_is_shed_when_tokens_are_low(scheduler):
+    scheduler._tokens = 1.0
+    scheduler._last_refill = time.monotonic()
+    scheduler.rate = 0.001
+    with pytest.raises(RequestShed):
+        scheduler.acquire(PRIORITY_POLLING)
+    # Un comando utente usa comunque il token rimasto
+    scheduler.acquire(PRIORITY_USER)
+    assert scheduler.shed_count == 1
+
+
+def test_polling_is_shed_while_higher_priority_waits(scheduler):
+    scheduler._waiting[PRIORITY_GPIO] = 1
+    with pytest.raises(RequestShed):
+        scheduler.acquire(PRIORITY_POLLING)
+
+
+def test_catalog_yields_to_waiting_user_commands(scheduler):
+    scheduler._waiting[PRIORITY_USER] = 1
+    scheduler.max_wait[PRIORITY_CATALOG] = 0.05
+    with pytest.raises(RequestShed):
+        scheduler.acquire(PRIORITY_CATALOG)
+
+
+def test_user_command_waits_for_refill(scheduler):
+    scheduler._tokens = 0.0
+    scheduler._last_refill = time.monotonic()
+    started_at = time.monotonic()
+    scheduler.acquire(PRIORITY_USER)
+    assert time.monotonic() - started_at < 1.0
+
+
+def test_429_blocks_requests_for_retry_after(scheduler):
+    func = Flaky(rate_limited(30))
+    with scheduler.priority(PRIORITY_POLLING):
+        with pytest.raises(SpotifyException):
+            scheduler.execute(func)
+
+    stats = scheduler.get_stats()
+    assert stats['throttled'] == 1
+    assert 29 <= stats['blocked_for'] <= 30
+    with scheduler.priority(PRIORITY_POLLING):
+        with pytest.raises(RequestShed):
+            scheduler.execute(func)
+    assert func.calls == 1
+
+
+def test_user_command_is_retried_after_short_retry_after(scheduler):
+    func = Flaky(rate_limited(0.05))
+    assert scheduler.execute(func) == 'ok'
+    assert func.calls == 2
+    assert scheduler.throttled_count == 1
+
+
+def test_user_command_is_not_retried_after_long_retry_after(scheduler):
+    scheduler.max_retry_after = 1.0
+    func = Flaky(rate_limited(5))
+    with pytest.raises(SpotifyException):
+        scheduler.execute(func)
+    assert func.calls == 1
+
+
+def test_other_errors_are_not_treated_as_rate_limits(scheduler):
+    func = Flaky(SpotifyException(500, -1, 'Server error'))
+    with pytest.raises(SpotifyException):
+        scheduler.execute(func)
+    assert scheduler.throttled_count == 0
+    assert scheduler.blocked_until == 0.0
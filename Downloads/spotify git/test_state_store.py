@@ -0,0 +1,52 @@
+"""Test dello store dello stato versionato"""
+
+import threading
+
+import pytest
+
+from state_store import StateStore, freeze, thaw
+
+
+def test_update_bumps_version_only_on_change():
+    store = StateStore({'is_playing': False, 'volume': 50})
+    assert store.update(is_playing=False) == 0
+    assert store.update(is_playing=True) == 1
+    assert store.update(volume=50, is_playing=True) == 1
+    assert store.get()['is_playing'] is True
+
+
+def test_snapshots_are_immutable():
+    store = StateStore({'device': {'name': 'SistemaPalestra'}, 'queue': [1, 2]})
+    state = store.get()
+    with pytest.raises(TypeError):
+        state['volume'] = 10
+    with pytest.raises(TypeError):
+        state['device']['name'] = 'altro'
+    assert state['queue'] == (1, 2)
+
+
+def test_old_snapshot_is_unchanged_after_update():
+    store = StateStore({'volume': 50})
+    version, before = store.snapshot()
+    store.update(volume=80)
+    assert before['volume'] == 50
+    assert store.snapshot()[0] == version + 1
+
+
+def test_thaw_returns_plain_structures():
+    value = {'device': {'name': 'x'}, 'items': [{'id': 1}]}
+    assert thaw(freeze(value)) == value
+
+
+def test_wait_for_version_wakes_on_update():
+    store = StateStore({'volume': 50})
+    timer = threading.Timer(0.05, lambda: store.update(volume=60))
+    timer.start()
+    version, state = store.wait_for_version(0, timeout=5)
+    assert version == 1
+    assert state['volume'] == 60
+
+
+def test_wait_for_version_times_out():
+    store = StateStore({'volume': 50})
+    assert store.wait_for_version(0, timeout=0.01)[0] == 0
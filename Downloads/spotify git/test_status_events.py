@@ -0,0 +1,81 @@
+"""Test del flusso di eventi di stato (SSE)"""
+
+import json
+import threading
+
+from status_events import StatusEventStream, format_sse
+
+
+def test_publish_state_emits_only_the_diff():
+    stream = StatusEventStream()
+    assert stream.publish_state({'volume': 50, 'is_playing': False}) == 1
+    assert stream.publish_state({'volume': 60, 'is_playing': False}) == 2
+    assert stream.events_since(1) == [(2, 'status', {'volume': 60})]
+
+
+def test_unchanged_state_publishes_nothing():
+    stream = StatusEventStream()
+    stream.publish_state({'volume': 50})
+    assert stream.publish_state({'volume': 50}) is None
+    assert stream.last_event_id == 1
+
+
+def test_ignored_keys_do_not_generate_events():
+    stream = StatusEventStream(ignored_keys=('last_activity',))
+    stream.publish_state({'volume': 50, 'last_activity': 1})
+    assert stream.publish_state({'volume': 50, 'last_activity': 2}) is None
+
+
+def test_published_state_is_copied():
+    stream = StatusEventStream()
+    state = {'device': {'name': 'SistemaPalestra'}}
+    stream.publish_state(state)
+    state['device']['name'] = 'altro'
+    assert stream.snapshot() == (1, {'device': {'name': 'SistemaPalestra'}})
+
+
+def test_events_since_current_id_is_empty():
+    stream = StatusEventStream()
+    stream.publish_event('command', {'id': 'a'})
+    assert stream.events_since(1) == []
+
+
+def test_events_since_returns_none_after_buffer_overflow():
+    stream = StatusEventStream(buffer_size=3)
+    for i in range(5):
+        stream.publish_event('command', {'id': i})
+    # Gli eventi 1 e 2 sono usciti dal buffer: il client deve ripartire da uno snapshot
+    assert stream.events_since(0) is None
+    assert stream.events_since(1) is None
+    assert [event[0] for event in stream.events_since(2)] == [3, 4, 5]
+
+
+def test_events_since_unknown_future_id_is_none():
+    stream = StatusEventStream()
+    stream.publish_event('command', {})
+    assert stream.events_since(10) is None
+
+
+def test_wait_for_events_wakes_on_publish():
+    stream = StatusEventStream()
+    timer = threading.Timer(0.05, lambda: stream.publish_event('command', {'id': 'a'}))
+    timer.start()
+    assert stream.wait_for_events(0, timeout=5) == [(1, 'command', {'id': 'a'})]
+
+
+def test_wait_for_events_times_out_empty():
+    stream = StatusEventStream()
+    assert stream.wait_for_events(0, timeout=0.01) == []
+
+
+def test_close_wakes_waiting_clients():
+    stream = StatusEventStream()
+    threading.Timer(0.05, stream.close).start()
+    assert stream.wait_for_events(0, timeout=5) == []
+    assert stream.closed
+
+
+def test_format_sse():
+    message = format_sse({'volume': 50}, 'status', 7)
+    assert message == f'id: 7\nevent: status\ndata: {json.dumps({"volume": 50})}\n\n'
+    assert format_sse({}) == 'data: {}\n\n'
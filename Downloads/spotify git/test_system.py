@@ -114,20 +114,20 @@ class SystemTester:
             return True, "Non su Raspberry Pi - GPIO test saltato"
             
         try:
-            import RPi.GPIO as GPIO
+            from gpio_backends import create_backend
             
-            # Test configurazione GPIO
+            # Test configurazione GPIO con il driver scelto da GPIO_BACKEND
             pin = Config.GPIO_PIN
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+            backend = create_backend(Config.GPIO_BACKEND)
+            backend.setup_input(pin)
             
             # Test lettura pin
-            state = GPIO.input(pin)
-            self.logger.info(f"GPIO pin {pin} stato: {state}")
+            state = backend.read(pin)
+            self.logger.info(f"GPIO pin {pin} stato: {state} (driver {backend.name})")
             
-            GPIO.cleanup()
+            backend.cleanup()
             
-            return True, f"GPIO pin {pin} configurato correttamente"
+            return True, f"GPIO pin {pin} configurato correttamente (driver {backend.name})"
             
         except Exception as e:
             return False, f"Errore GPIO: {str(e)}"
@@ -0,0 +1,137 @@
+"""Test della cache del token e del rinnovo anticipato"""
+
+import json
+import os
+import stat
+
+import pytest
+
+pytest.importorskip('spotipy')
+
+import token_manager
+from token_manager import TokenCacheHandler, TokenManager
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(token_manager.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return TokenCacheHandler(str(tmp_path / '.spotify_cache'))
+
+
+class FakeOAuth:
+    """refresh_access_token che salva un nuovo token nella cache, come spotipy"""
+
+    def __init__(self, cache, clock):
+        self.cache = cache
+        self.clock = clock
+        self.calls = 0
+        self.error = None
+
+    def refresh_access_token(self, refresh_token):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        token = {'access_token': f'access-{self.calls}', 'refresh_token': refresh_token,
+                 'expires_at': self.clock[0] + 3600}
+        self.cache.save_token_to_cache(token)
+        return token
+
+
+@pytest.fixture
+def manager(cache, clock):
+    manager = TokenManager(FakeOAuth(cache, clock), cache)
+    manager.refresh_margin = 300
+    return manager
+
+
+def token(expires_at, refresh_token='refresh'):
+    return {'access_token': 'access', 'refresh_token': refresh_token, 'expires_at': expires_at}
+
+
+def test_save_writes_file_atomically_with_private_mode(cache):
+    cache.save_token_to_cache(token(123))
+    with open(cache.cache_path) as f:
+        assert json.load(f)['expires_at'] == 123
+    assert stat.S_IMODE(os.stat(cache.cache_path).st_mode) == 0o600
+    # Nessun file temporaneo rimasto accanto alla cache
+    files = set(os.listdir(os.path.dirname(cache.cache_path)))
+    assert files - {'.spotify_cache.lock'} == {'.spotify_cache'}
+
+
+def test_cached_token_is_read_from_file_once(cache):
+    with open(cache.cache_path, 'w') as f:
+        json.dump(token(100), f)
+    assert cache.get_cached_token()['expires_at'] == 100
+    with open(cache.cache_path, 'w') as f:
+        json.dump(token(200), f)
+    assert cache.get_cached_token()['expires_at'] == 100
+
+
+def test_reload_adopts_only_newer_tokens(cache):
+    cache.save_token_to_cache(token(200))
+    with open(cache.cache_path, 'w') as f:
+        json.dump(token(100), f)
+    assert cache.reload()['expires_at'] == 200
+    with open(cache.cache_path, 'w') as f:
+        json.dump(token(300), f)
+    assert cache.reload()['expires_at'] == 300
+
+
+def test_file_lock_is_reentrant(cache):
+    with cache.file_lock():
+        with cache.file_lock():
+            cache.save_token_to_cache(token(1))
+    assert cache._lock_depth == 0
+
+
+def test_clear_removes_file(cache):
+    cache.save_token_to_cache(token(1))
+    cache.clear()
+    assert cache.get_cached_token() is None
+    assert not os.path.exists(cache.cache_path)
+
+
+def test_seconds_until_refresh(manager, cache, clock):
+    assert manager.seconds_until_refresh() is None
+    cache.save_token_to_cache(token(clock[0] + 1000))
+    assert manager.seconds_until_refresh() == 700
+
+
+def test_refresh_skipped_while_token_is_fresh(manager, cache, clock):
+    cache.save_token_to_cache(token(clock[0] + 1000))
+    assert manager.refresh()
+    assert manager.oauth.calls == 0
+
+
+def test_refresh_inside_margin(manager, cache, clock):
+    cache.save_token_to_cache(token(clock[0] + 200))
+    assert manager.refresh()
+    assert manager.oauth.calls == 1
+    assert manager.refresh_count == 1
+    assert cache.get_cached_token()['expires_at'] == clock[0] + 3600
+
+
+def test_refresh_uses_token_renewed_by_another_process(manager, cache, clock):
+    cache.save_token_to_cache(token(clock[0] + 200))
+    with open(cache.cache_path, 'w') as f:
+        json.dump(token(clock[0] + 3600), f)
+    assert manager.refresh()
+    assert manager.oauth.calls == 0
+
+
+def test_refresh_error_is_recorded(manager, cache, clock):
+    cache.save_token_to_cache(token(clock[0] + 200))
+    manager.oauth.error = RuntimeError('invalid_grant')
+    assert not manager.refresh()
+    assert manager.last_error == 'invalid_grant'
+
+
+def test_refresh_without_refresh_token(manager, cache, clock):
+    cache.save_token_to_cache({'access_token': 'a', 'expires_at': clock[0]})
+    assert not manager.refresh(force=True)
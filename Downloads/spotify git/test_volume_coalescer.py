@@ -0,0 +1,92 @@
+"""Test della coalescenza delle variazioni di volume"""
+
+import threading
+import time
+
+import pytest
+
+from volume_coalescer import VolumeCoalescer
+
+
+class Recorder:
+    """send_volume registrato; può essere bloccato per accumulare richieste"""
+
+    def __init__(self):
+        self.sent = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.called = threading.Event()
+
+    def __call__(self, device_id, volume):
+        self.called.set()
+        self.gate.wait(5)
+        self.sent.append((device_id, volume, time.monotonic()))
+        return True
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+def test_latest_value_wins_while_a_send_is_in_progress(recorder):
+    coalescer = VolumeCoalescer(recorder)
+    coalescer.min_interval = 0.0
+    recorder.gate.clear()
+    coalescer.submit('dev', 10)
+    assert recorder.called.wait(2)
+    for volume in (20, 30, 40):
+        coalescer.submit('dev', volume)
+    assert coalescer.pending_volume('dev') == 40
+    recorder.gate.set()
+
+    assert wait_until(lambda: len(recorder.sent) == 2)
+    time.sleep(0.05)
+    assert [volume for _, volume, _ in recorder.sent] == [10, 40]
+    assert coalescer.submitted_count == 4
+    assert wait_until(lambda: coalescer.sent_count == 2)
+
+
+def test_min_interval_between_sends_per_device(recorder):
+    coalescer = VolumeCoalescer(recorder)
+    coalescer.min_interval = 0.1
+    coalescer.submit('dev', 10)
+    assert wait_until(lambda: len(recorder.sent) == 1)
+    coalescer.submit('dev', 20)
+    assert wait_until(lambda: len(recorder.sent) == 2)
+    assert recorder.sent[1][2] - recorder.sent[0][2] >= 0.09
+
+
+def test_devices_are_coalesced_independently(recorder):
+    coalescer = VolumeCoalescer(recorder)
+    coalescer.min_interval = 0.0
+    coalescer.submit('a', 10)
+    coalescer.submit('b', 20)
+    assert wait_until(lambda: len(recorder.sent) == 2)
+    assert sorted((device, volume) for device, volume, _ in recorder.sent) == [('a', 10), ('b', 20)]
+    assert coalescer.pending_volume('a') is None
+
+
+def test_send_errors_do_not_stop_the_worker():
+    sent = []
+
+    def flaky(device_id, volume):
+        if not sent and volume == 10:
+            sent.append(None)
+            raise RuntimeError('dispositivo non raggiungibile')
+        sent.append(volume)
+
+    coalescer = VolumeCoalescer(flaky)
+    coalescer.min_interval = 0.0
+    coalescer.submit('dev', 10)
+    assert wait_until(lambda: len(sent) == 1)
+    coalescer.submit('dev', 20)
+    assert wait_until(lambda: sent[-1] == 20)
+    assert wait_until(lambda: coalescer.sent_count == 1)
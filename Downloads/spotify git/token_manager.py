@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Optional, Dict, Any
+
+from spotipy.cache_handler import CacheHandler
+
+from metrics import SPOTIFY_CALL_DURATION, SPOTIFY_CALL_ERRORS
+
+# Lock tra processi disponibile solo su sistemi POSIX (Raspberry Pi / macOS)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+    fcntl = None
+
+
+class TokenCacheHandler(CacheHandler):
+    """Cache del token OAuth in memoria con persistenza atomica su file
+
+    Le chiamate API leggono il token dalla memoria invece di rileggere il
+    file ogni volta; le scritture avvengono su un file temporaneo sostituito
+    con os.replace, sotto un lock condiviso tra processi.
+    """
+
+    def __init__(self, cache_path: str = '.spotify_cache'):
+        self.cache_path = cache_path
+        self.lock_path = f'{cache_path}.lock'
+        self.updated = threading.Event()
+
+        self._token = None
+        self._loaded = False
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+
+    @contextmanager
+    def file_lock(self):
+        """Lock esclusivo (rientrante nel processo) sul file della cache"""
+        with self._thread_lock:
+            if self._lock_depth == 0 and FCNTL_AVAILABLE:
+                self._lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_file:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _read_file(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Impossibile leggere la cache del token: {e}")
+            return None
+
+    def get_cached_token(self) -> Optional[Dict[str, Any]]:
+        """Token corrente dalla memoria (letto dal file solo la prima volta)"""
+        if not self._loaded:
+            with self.file_lock():
+                self._token = self._read_file()
+                self._loaded = True
+        return self._token
+
+    def reload(self) -> Optional[Dict[str, Any]]:
+        """Rilegge il file e adotta il token se è più recente (es. rinnovato da un altro processo)"""
+        with self.file_lock():
+            token = self._read_file()
+            if token and (not self._token or token.get('expires_at', 0) > self._token.get('expires_at', 0)):
+                self._token = token
+            self._loaded = True
+            return self._token
+
+    def save_token_to_cache(self, token_info: Dict[str, Any]):
+        """Aggiorna il token in memoria e lo scrive atomicamente su file"""
+        self._token = token_info
+        self._loaded = True
+        self.updated.set()
+
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        temp_path = None
+        with self.file_lock():
+            try:
+                fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.spotify_cache.')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(token_info, f)
+                os.chmod(temp_path, 0o600)
+                os.replace(temp_path, self.cache_path)
+            except OSError as e:
+                logging.error(f"Errore nella scrittura della cache del token: {e}")
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def clear(self):
+        """Dimentica il token e rimuove il file della cache"""
+        with self.file_lock():
+            self._token = None
+            self._loaded = True
+            if os.path.exists(self.cache_path):
+                os.remove(self.cache_path)
+                logging.info("File cache Spotify rimosso")
+
+
+class TokenManager:
+    """Rinnovo anticipato del token OAuth in background
+
+    Il token viene rinnovato TOKEN_REFRESH_MARGIN secondi prima della
+    scadenza, così nessun comando paga il round trip del refresh.
+    """
+
+    def __init__(self, oauth, cache_handler: TokenCacheHandler):
+        self.oauth = oauth
+        self.cache_handler = cache_handler
+        self.refresh_margin = float(os.getenv('TOKEN_REFRESH_MARGIN', 300))
+        self.retry_interval = float(os.getenv('TOKEN_REFRESH_RETRY', 30))
+
+        self.is_running = False
+        self.refresh_thread = None
+        self.refresh_count = 0
+        self.last_refresh = None
+        self.last_error = None
+
+    def start(self):
+        """Avvia il thread di rinnovo"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self.refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self.refresh_thread.start()
+        logging.info("Gestore token Spotify avviato")
+
+    def stop(self):
+        """Ferma il thread di rinnovo"""
+        self.is_running = False
+        self.cache_handler.updated.set()
+        if self.refresh_thread:
+            self.refresh_thread.join(timeout=1)
+        logging.info("Gestore token Spotify fermato")
+
+    def seconds_until_refresh(self) -> Optional[float]:
+        """Secondi mancanti al prossimo rinnovo (None senza token)"""
+        token = self.cache_handler.get_cached_token()
+        if not token or 'expires_at' not in token:
+            return None
+        return token['expires_at'] - self.refresh_margin - time.time()
+
+    def refresh(self, force: bool = False) -> bool:
+        """Rinnova il token se in scadenza (o sempre con force)"""
+        with self.cache_handler.file_lock():
+            # Un altro processo potrebbe averlo già rinnovato
+            token = self.cache_handler.reload()
+            if not token or 'refresh_token' not in token:
+                return False
+            if not force and token.get('expires_at', 0) - self.refresh_margin > time.time():
+                return True
+
+            try:
+                started_at = time.time()
+                with SPOTIFY_CALL_DURATION.time(method='refresh_access_token'):
+                    self.oauth.refresh_access_token(token['refresh_token'])
+                self.refresh_count += 1
+                self.last_refresh = time.time()
+                self.last_error = None
+                logging.info(f"Token Spotify rinnovato in anticipo ({(time.time() - started_at) * 1000:.0f} ms)")
+                return True
+            except Exception as e:
+                self.last_error = str(e)
+                SPOTIFY_CALL_ERRORS.inc(method='refresh_access_token', error=type(e).__name__)
+                logging.error(f"Errore nel rinnovo del token Spotify: {e}")
+                return False
+
+    def _refresh_loop(self):
+        """Attende la scadenza anticipata del token e lo rinnova"""
+        while self.is_running:
+            wait = self.seconds_until_refresh()
+            if wait is None:
+                # Nessun token: attende una nuova autorizzazione
+                wait = 60
+            elif wait <= 0:
+                self.refresh()
+                # In caso di errore ritenta dopo retry_interval
+                wait = max(self.seconds_until_refresh() or 0, self.retry_interval)
+
+            self.cache_handler.updated.wait(wait)
+            self.cache_handler.updated.clear()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato del rinnovo token"""
+        return {
+            'refresh_in': round(self.seconds_until_refresh() or 0),
+            'refresh_count': self.refresh_count,
+            'last_refresh': self.last_refresh,
+            'last_error': self.last_error
+        }
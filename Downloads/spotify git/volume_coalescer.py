@@ -0,0 +1,78 @@
+import os
+import time
+import threading
+import logging
+from typing import Callable, Dict, Optional
+
+
+class VolumeCoalescer:
+    """Coalescenza "latest-wins" delle variazioni di volume
+
+    Per ogni dispositivo viene conservato solo l'ultimo valore richiesto; un
+    worker lo invia rispettando un intervallo minimo tra due invii, così un
+    trascinamento dello slider produce pochi comandi invece di decine.
+    """
+
+    def __init__(self, send_volume: Callable[[str, int], bool]):
+        self.send_volume = send_volume
+        self.min_interval = float(os.getenv('VOLUME_MIN_INTERVAL', 0.3))
+
+        self.submitted_count = 0
+        self.sent_count = 0
+        self.worker_thread = None
+
+        self._pending: Dict[Optional[str], int] = {}
+        self._last_sent: Dict[Optional[str], float] = {}
+        self._condition = threading.Condition()
+
+    def submit(self, device_id: Optional[str], volume: int) -> int:
+        """Accoda il volume per il dispositivo sostituendo quello in attesa"""
+        with self._condition:
+            self._pending[device_id] = volume
+            self.submitted_count += 1
+            self._ensure_worker()
+            self._condition.notify()
+        return volume
+
+    def pending_volume(self, device_id: Optional[str]) -> Optional[int]:
+        """Volume ancora da inviare per il dispositivo (None se nessuno)"""
+        with self._condition:
+            return self._pending.get(device_id)
+
+    def _ensure_worker(self):
+        if self.worker_thread and self.worker_thread.is_alive():
+            return
+        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
+        self.worker_thread.start()
+
+    def _next_ready(self):
+        """Dispositivo pronto per l'invio e attesa necessaria"""
+        now = time.monotonic()
+        best_device, best_wait = None, None
+        for device_id in self._pending:
+            wait = self._last_sent.get(device_id, 0.0) + self.min_interval - now
+            if best_wait is None or wait < best_wait:
+                best_device, best_wait = device_id, wait
+        return best_device, best_wait
+
+    def _worker(self):
+        """Invia i valori in attesa rispettando l'intervallo minimo"""
+        while True:
+            with self._condition:
+                while True:
+                    if not self._pending:
+                        self._condition.wait()
+                        continue
+                    device_id, wait = self._next_ready()
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+
+                volume = self._pending.pop(device_id)
+                self._last_sent[device_id] = time.monotonic()
+
+            try:
+                self.send_volume(device_id, volume)
+                self.sent_count += 1
+            except Exception as e:
+                logging.error(f"Errore nell'invio volume coalescato: {e}")
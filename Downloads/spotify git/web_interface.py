@@ -1,12 +1,21 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_from_directory
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, session, flash, send_from_directory
 import os
 import logging
 import json
+import threading
+import time
+import hashlib
+import re
+import tempfile
 from datetime import datetime
 from functools import wraps
 from dotenv import load_dotenv
-from spotify_manager import SpotifyManager
-from gpio_manager import GPIOManager
+from service_registry import services, get_spotify_manager, get_gpio_manager, get_schedule_engine, get_prewarmer
+from command_queue import CommandQueue
+from status_events import StatusEventStream, format_sse
+from state_store import StateStore, freeze, thaw
+import metrics
+import request_timing
 from werkzeug.utils import secure_filename
 from version import get_version_info
 
@@ -17,6 +26,28 @@ app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'default-secret-key-change-this')
 app.logger.setLevel(logging.INFO)
 
+@app.before_request
+def start_request_timer():
+    """Registra l'inizio della richiesta per le metriche e la traccia delle fasi"""
+    g.request_started_at = time.perf_counter()
+    request_timing.start_trace(f"{request.method} {request.path}")
+
+@app.after_request
+def record_request_metrics(response):
+    """Durata e codice di stato della richiesta, per route"""
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started_at, route=route, method=request.method)
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+        
+    # Fasi della richiesta visibili nei devtools del browser
+    trace = request_timing.end_trace()
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        request_timing.log_if_slow(trace, method=request.method, path=request.path, status=response.status_code)
+    return response
+
 @app.context_processor
 def inject_version():
     """Rende le informazioni sulla versione disponibili in tutti i template"""
@@ -41,47 +72,209 @@ def login_required(f):
     """Decoratore per richiedere l'autenticazione"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not session.get('authenticated'):
+        with request_timing.span('auth'):
+            authenticated = session.get('authenticated')
+        if not authenticated:
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
+# Identifica il processo negli ETag basati su versione (le versioni ripartono da 0 al riavvio)
+ETAG_BOOT_ID = format(int(time.time()), 'x')
+
+def conditional_json(payload, etag=None, cache_control='private, no-cache'):
+    """Risposta JSON con ETag forte e gestione di If-None-Match (304)
+
+    Con un ETag derivato da una versione il corpo non viene nemmeno
+    serializzato se il client ha già la copia corrente; altrimenti l'ETag è
+    l'hash del contenuto. payload può essere una funzione che costruisce i dati.
+    """
+    if etag and etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(payload() if callable(payload) else payload)
+        if etag is None:
+            etag = hashlib.sha1(response.get_data()).hexdigest()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response.make_conditional(request)
+
+ENV_FILE = '.env'
+
+# Chiavi che l'interfaccia web può scrivere nel .env (mai password o SECRET_KEY)
+ENV_WRITABLE_KEYS = re.compile(
+    r'^(SPOTIFY_CLIENT_ID|SPOTIFY_CLIENT_SECRET|SPOTIFY_REDIRECT_URI'
+    r'|TIME_PERIOD_\d+_(START|END|PLAYLIST|DAYS))$'
+)
+
+def validate_env_updates(updates):
+    """Rifiuta chiavi fuori whitelist e valori che potrebbero iniettare altre righe"""
+    for key, value in updates.items():
+        if not ENV_WRITABLE_KEYS.fullmatch(key):
+            raise ValueError(f"Chiave non modificabile: {key}")
+        if any(char in str(value) for char in '\r\n='):
+            raise ValueError(f"Valore non valido per {key}")
+
+def read_env_file_keys():
+    """Chiavi definite nel file .env (anche se assenti dall'ambiente del processo)"""
+    if not os.path.exists(ENV_FILE):
+        return set()
+    with open(ENV_FILE, 'r') as f:
+        return {
+            line.split('=', 1)[0].strip()
+            for line in f.read().splitlines()
+            if '=' in line and not line.lstrip().startswith('#')
+        }
+
+def update_env_file(updates):
+    """Aggiorna il file .env e le variabili d'ambiente (un valore vuoto rimuove la chiave)"""
+    validate_env_updates(updates)
+    
+    lines = []
+    if os.path.exists(ENV_FILE):
+        with open(ENV_FILE, 'r') as f:
+            lines = f.read().splitlines()
+            
+    remaining = dict(updates)
+    new_lines = []
+    for line in lines:
+        key = line.split('=', 1)[0].strip()
+        if '=' in line and not line.lstrip().startswith('#') and key in updates:
+            value = remaining.pop(key, None)
+            if value:
+                new_lines.append(f"{key}={value}")
+        else:
+            new_lines.append(line)
+    new_lines.extend(f"{key}={value}" for key, value in remaining.items() if value)
+    
+    # Scrittura atomica: un crash non lascia mai un .env troncato
+    directory = os.path.dirname(os.path.abspath(ENV_FILE))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.env.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(new_lines) + '\n')
+        if os.path.exists(ENV_FILE):
+            os.chmod(temp_path, os.stat(ENV_FILE).st_mode & 0o777)
+        os.replace(temp_path, ENV_FILE)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+        
+    for key, value in updates.items():
+        if value:
+            os.environ[key] = value
+        else:
+            os.environ.pop(key, None)
+
 # Variabili globali per i manager
 spotify_manager = None
 gpio_manager = None
-system_status = {
+schedule_engine = None
+command_queue = None
+# Stato del sistema: snapshot immutabili versionati, letti senza lock
+state_store = StateStore({
     'spotify_connected': False,
     'gpio_monitoring': False,
     'gpio_status': False,
     'gpio_pin': 'N/A',
     'last_activity': None,
-    'current_track': None
-}
+    'current_track': None,
+    'is_playing': False,
+    'volume': None,
+    'device': None,
+    'playback_version': 0
+})
+
+# Flusso SSE delle variazioni di stato (last_activity non genera eventi da sola)
+status_events = StatusEventStream(ignored_keys=('last_activity',))
+status_publisher_thread = None
+SSE_KEEPALIVE_INTERVAL = float(os.getenv('SSE_KEEPALIVE_INTERVAL', 15))
+STATUS_PUBLISH_INTERVAL = float(os.getenv('STATUS_PUBLISH_INTERVAL', 1))
+# Ogni flusso SSE occupa un thread del server web finché resta aperto: oltre
+# questo limite /api/events risponde 503 e il browser passa al polling, così
+# restano sempre thread liberi per comandi, stato e login (vedi WEB_THREADS)
+SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', max(1, int(os.getenv('WEB_THREADS', 8)) - 4)))
+sse_clients = 0
+sse_clients_lock = threading.Lock()
 
 def init_managers():
     """Inizializza i manager Spotify e GPIO"""
-    global spotify_manager, gpio_manager
+    global spotify_manager, gpio_manager, schedule_engine, command_queue
     
+    # Istanze condivise con main.py: create una sola volta per processo
     try:
-        spotify_manager = SpotifyManager()
-        system_status['spotify_connected'] = True
+        spotify_manager = get_spotify_manager()
+        state_store.update(spotify_connected=True)
         logging.info("Spotify Manager inizializzato")
     except Exception as e:
         logging.error(f"Errore inizializzazione Spotify: {e}")
-        system_status['spotify_connected'] = False
+        state_store.update(spotify_connected=False)
         
     try:
-        gpio_manager = GPIOManager(spotify_manager)
-        gpio_manager.start_monitoring()
-        system_status['gpio_monitoring'] = True
-        system_status['gpio_status'] = gpio_manager.get_pin_state()
-        system_status['gpio_pin'] = gpio_manager.gpio_pin
+        schedule_engine = get_schedule_engine(spotify_manager)
+        get_prewarmer(spotify_manager)
+    except Exception as e:
+        logging.error(f"Errore inizializzazione fasce orarie: {e}")
+        
+    try:
+        gpio_manager = get_gpio_manager(spotify_manager)
         logging.info("GPIO Manager inizializzato")
     except Exception as e:
         logging.error(f"Errore inizializzazione GPIO: {e}")
-        system_status['gpio_monitoring'] = False
-        system_status['gpio_status'] = False
-        system_status['gpio_pin'] = 'N/A'
+        
+    update_system_status()
+        
+    # Comandi di riproduzione eseguiti in background, esito notificato via SSE
+    command_queue = services.get_or_create(
+        'command_queue',
+        lambda: CommandQueue(on_update=lambda job: status_events.publish_event('command', job)),
+        lambda queue: queue.shutdown()
+    )
+        
+    start_status_publisher()
+
+def enqueue_command(command, func, *args, success_message='', error_message=''):
+    """Accoda un comando e risponde subito con 202 e l'ID del comando"""
+    job = command_queue.submit(command, func, *args,
+                               success_message=success_message, error_message=error_message)
+    response = jsonify({
+        'success': True,
+        'pending': True,
+        'command_id': job['id'],
+        'status': job['status'],
+        'message': 'Comando in esecuzione'
+    })
+    response.status_code = 202
+    response.headers['Location'] = url_for('api_command_status', command_id=job['id'])
+    return response
+
+def start_status_publisher():
+    """Avvia il thread che pubblica le variazioni di stato sul flusso SSE"""
+    global status_publisher_thread
+    
+    if status_publisher_thread and status_publisher_thread.is_alive():
+        return
+        
+    status_publisher_thread = threading.Thread(target=_status_publisher_loop, daemon=True)
+    status_publisher_thread.start()
+    logging.info("Publisher eventi di stato avviato")
+
+def _status_publisher_loop():
+    """Pubblica lo stato quando cambia lo snapshot di riproduzione o il GPIO"""
+    version = -1
+    while True:
+        try:
+            if spotify_manager:
+                # Si sveglia subito ad ogni nuova versione dello snapshot,
+                # altrimenti ricontrolla periodicamente lo stato del GPIO
+                version = spotify_manager.playback_poller.wait_for_change(version, timeout=STATUS_PUBLISH_INTERVAL)
+            else:
+                time.sleep(STATUS_PUBLISH_INTERVAL)
+            update_system_status()
+            status_events.publish_state(thaw(state_store.get()))
+        except Exception as e:
+            logging.error(f"Errore nella pubblicazione stato: {e}")
+            time.sleep(STATUS_PUBLISH_INTERVAL)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -130,15 +323,91 @@ def spotify_callback():
 @login_required
 def index():
     """Pagina principale"""
-    update_system_status()
-    return render_template('index.html', status=system_status)
+    return render_template('index.html', status=state_store.get())
 
 @app.route('/api/status')
 @login_required
 def api_status():
     """API per ottenere lo stato del sistema"""
-    update_system_status()
-    return jsonify(system_status)
+    version, state = state_store.snapshot()
+    return conditional_json(lambda: thaw(state), etag=f'status-{ETAG_BOOT_ID}-{version}')
+
+@app.route('/api/events')
+@login_required
+def api_events():
+    """Flusso Server-Sent Events con le variazioni dello stato del sistema"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+        
+    # Primo client prima della prima pubblicazione: pubblica lo stato corrente
+    if not status_events.last_event_id:
+        update_system_status()
+        status_events.publish_state(thaw(state_store.get()))
+        
+    global sse_clients
+    with sse_clients_lock:
+        if sse_clients >= SSE_MAX_CLIENTS:
+            return Response('Troppi flussi aperti, usare il polling di /api/status\n', status=503,
+                            mimetype='text/plain', headers={'Retry-After': '30'})
+        sse_clients += 1
+        
+    def release():
+        global sse_clients
+        with sse_clients_lock:
+            sse_clients -= 1
+        
+    def stream():
+        yield 'retry: 3000\n\n'
+        
+        # Ripresa dopo riconnessione: invia solo gli eventi persi se ancora nel buffer
+        missed = status_events.events_since(last_event_id) if last_event_id is not None else None
+        if missed is None:
+            cursor, state = status_events.snapshot()
+            yield format_sse(state, 'snapshot', cursor)
+        else:
+            cursor = last_event_id
+            for event_id, event_type, data in missed:
+                yield format_sse(data, event_type, event_id)
+                cursor = event_id
+                
+        while not status_events.closed:
+            events = status_events.wait_for_events(cursor, timeout=SSE_KEEPALIVE_INTERVAL)
+            if events is None:
+                cursor, state = status_events.snapshot()
+                yield format_sse(state, 'snapshot', cursor)
+            elif not events:
+                yield ': keep-alive\n\n'
+            else:
+                for event_id, event_type, data in events:
+                    yield format_sse(data, event_type, event_id)
+                    cursor = event_id
+                    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Il posto viene liberato alla chiusura della risposta, anche se lo stream non è mai partito
+    response.call_on_close(release)
+    return response
+
+@app.route('/api/librespot/event', methods=['POST'])
+def api_librespot_event():
+    """Riceve gli eventi del player dall'hook --onevent di librespot (solo locale)"""
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({'success': False, 'error': 'Accesso consentito solo in locale'}), 403
+        
+    if not spotify_manager:
+        return jsonify({'success': False, 'error': 'Spotify non connesso'})
+        
+    event = {key: value for key, value in request.form.items() if value}
+    if not event.get('event'):
+        return jsonify({'success': False, 'error': 'Evento mancante'}), 400
+        
+    spotify_manager.handle_librespot_event(event)
+    return jsonify({'success': True})
 
 @app.route('/api/play', methods=['POST'])
 @login_required
@@ -148,12 +417,9 @@ def api_play():
         return jsonify({'success': False, 'error': 'Spotify non connesso'})
         
     playlist_uri = request.json.get('playlist_uri') if request.json else None
-    success = spotify_manager.play_music(playlist_uri)
-    
-    return jsonify({
-        'success': success,
-        'message': 'Riproduzione avviata' if success else 'Errore nell\'avvio'
-    })
+    return enqueue_command('play', spotify_manager.play_music, playlist_uri,
+                           success_message='Riproduzione avviata',
+                           error_message='Errore nell\'avvio')
 
 @app.route('/api/pause', methods=['POST'])
 @login_required
@@ -162,11 +428,9 @@ def api_pause():
     if not spotify_manager:
         return jsonify({'success': False, 'error': 'Spotify non connesso'})
         
-    success = spotify_manager.pause_music()
-    return jsonify({
-        'success': success,
-        'message': 'Riproduzione in pausa' if success else 'Errore nella pausa'
-    })
+    return enqueue_command('pause', spotify_manager.pause_music,
+                           success_message='Riproduzione in pausa',
+                           error_message='Errore nella pausa')
 
 @app.route('/api/stop', methods=['POST'])
 @login_required
@@ -175,11 +439,9 @@ def api_stop():
     if not spotify_manager:
         return jsonify({'success': False, 'error': 'Spotify non connesso'})
         
-    success = spotify_manager.stop_music()
-    return jsonify({
-        'success': success,
-        'message': 'Riproduzione fermata' if success else 'Errore nello stop'
-    })
+    return enqueue_command('stop', spotify_manager.stop_music,
+                           success_message='Riproduzione fermata',
+                           error_message='Errore nello stop')
 
 @app.route('/api/toggle', methods=['POST'])
 @login_required
@@ -188,11 +450,9 @@ def api_toggle():
     if not spotify_manager:
         return jsonify({'success': False, 'error': 'Spotify non connesso'})
         
-    success = spotify_manager.toggle_playback()
-    return jsonify({
-        'success': success,
-        'message': 'Stato riproduzione cambiato' if success else 'Errore nel cambio stato'
-    })
+    return enqueue_command('toggle', spotify_manager.toggle_playback,
+                           success_message='Stato riproduzione cambiato',
+                           error_message='Errore nel cambio stato')
 
 @app.route('/api/next', methods=['POST'])
 @login_required
@@ -201,11 +461,9 @@ def api_next():
     if not spotify_manager:
         return jsonify({'success': False, 'error': 'Spotify non connesso'})
         
-    success = spotify_manager.next_track()
-    return jsonify({
-        'success': success,
-        'message': 'Traccia successiva' if success else 'Errore nel passaggio'
-    })
+    return enqueue_command('next', spotify_manager.next_track,
+                           success_message='Traccia successiva',
+                           error_message='Errore nel passaggio')
 
 @app.route('/api/previous', methods=['POST'])
 @login_required
@@ -214,11 +472,9 @@ def api_previous():
     if not spotify_manager:
         return jsonify({'success': False, 'error': 'Spotify non connesso'})
         
-    success = spotify_manager.previous_track()
-    return jsonify({
-        'success': success,
-        'message': 'Traccia precedente' if success else 'Errore nel passaggio'
-    })
+    return enqueue_command('previous', spotify_manager.previous_track,
+                           success_message='Traccia precedente',
+                           error_message='Errore nel passaggio')
 
 @app.route('/api/volume', methods=['POST'])
 @login_required
@@ -229,14 +485,36 @@ def api_volume():
         
     try:
         volume = int(request.json.get('volume', 50))
-        success = spotify_manager.set_volume(volume)
+        # Risponde subito: l'invio a Spotify è coalescato (vince l'ultimo valore)
+        target = spotify_manager.request_volume(volume)
         return jsonify({
-            'success': success,
-            'message': f'Volume impostato a {volume}%' if success else 'Errore nell\'impostazione volume'
+            'success': True,
+            'volume': target,
+            'pending': True,
+            'message': f'Volume impostato a {target}%'
         })
     except (ValueError, TypeError):
         return jsonify({'success': False, 'error': 'Volume non valido'})
 
+@app.route('/api/volume/fade', methods=['POST'])
+@login_required
+def api_volume_fade():
+    """API per una rampa di volume (fade-in/fade-out)"""
+    if not spotify_manager:
+        return jsonify({'success': False, 'error': 'Spotify non connesso'})
+        
+    try:
+        volume = int(request.json.get('volume', 0))
+        duration_ms = int(request.json.get('duration_ms', 1000))
+        success = spotify_manager.fade_volume(volume, duration_ms)
+        return jsonify({
+            'success': success,
+            'volume': volume,
+            'message': f'Rampa volume verso {volume}%' if success else 'Errore nella rampa volume'
+        })
+    except (ValueError, TypeError, AttributeError):
+        return jsonify({'success': False, 'error': 'Parametri non validi'})
+
 @app.route('/api/devices')
 @login_required
 def api_devices():
@@ -245,7 +523,7 @@ def api_devices():
         return jsonify({'devices': [], 'error': 'Spotify non connesso'})
         
     devices = spotify_manager.get_devices()
-    return jsonify({'devices': devices})
+    return conditional_json({'devices': devices})
 
 @app.route('/api/set_device', methods=['POST'])
 @login_required
@@ -258,18 +536,39 @@ def api_set_device():
     if not device_id:
         return jsonify({'success': False, 'error': 'ID dispositivo mancante'})
         
-    spotify_manager.set_device(device_id)
-    return jsonify({'success': True, 'message': 'Dispositivo impostato'})
+    return enqueue_command('set_device', spotify_manager.set_device, device_id,
+                           success_message='Dispositivo impostato',
+                           error_message='Errore nell\'impostazione dispositivo')
+
+@app.route('/api/commands/<command_id>')
+@login_required
+def api_command_status(command_id):
+    """API per lo stato di un comando accodato"""
+    job = command_queue.get(command_id) if command_queue else None
+    if not job:
+        return jsonify({'success': False, 'error': 'Comando non trovato'}), 404
+        
+    return jsonify(job)
 
 @app.route('/api/playlists')
 @login_required
 def api_playlists():
     """API per ottenere le playlist dell'utente"""
     if not spotify_manager:
-        return jsonify({'playlists': [], 'error': 'Spotify non connesso'})
+        return jsonify({'playlists': [], 'total': 0, 'error': 'Spotify non connesso'})
         
-    playlists = spotify_manager.get_user_playlists()
-    return jsonify({'playlists': playlists})
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = min(max(1, request.args.get('limit', 50, type=int)), 500)
+    query = request.args.get('q', '').strip() or None
+    
+    playlists, total = spotify_manager.get_user_playlists(offset, limit, query)
+    return conditional_json({
+        'playlists': playlists,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'catalog': spotify_manager.playlist_catalog.get_status()
+    })
 
 @app.route('/api/search')
 @login_required
@@ -282,8 +581,37 @@ def api_search():
     if not query:
         return jsonify({'tracks': [], 'error': 'Query di ricerca mancante'})
         
-    tracks = spotify_manager.search_tracks(query)
-    return jsonify({'tracks': tracks})
+    typeahead = request.args.get('typeahead', 'false').lower() == 'true'
+    started_at = time.time()
+    tracks, source = spotify_manager.search_tracks(query, typeahead=typeahead)
+    return jsonify({
+        'tracks': tracks,
+        'source': source,
+        'elapsed_ms': round((time.time() - started_at) * 1000, 1)
+    })
+
+@app.route('/api/search/stats')
+@login_required
+def api_search_stats():
+    """API per le statistiche della cache ricerche"""
+    if not spotify_manager:
+        return jsonify({'error': 'Spotify non connesso'})
+        
+    return jsonify(spotify_manager.search_cache.get_stats())
+
+# Token per lo scraping di /metrics (senza token serve una sessione autenticata)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metriche nel formato di esposizione di Prometheus"""
+    if METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Non autorizzato\n', status=401, mimetype='text/plain')
+    elif not session.get('authenticated'):
+        # Mai pubblico: senza token e senza login l'endpoint non esiste
+        return Response('Not Found\n', status=404, mimetype='text/plain')
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/gpio/status')
 @login_required
@@ -292,11 +620,12 @@ def api_gpio_status():
     if not gpio_manager:
         return jsonify({'error': 'GPIO non inizializzato'})
         
-    return jsonify({
+    return conditional_json({
         'pin': gpio_manager.gpio_pin,
         'state': gpio_manager.get_pin_state(),
         'monitoring': gpio_manager.is_monitoring,
-        'debounce_time': gpio_manager.debounce_time
+        'debounce_time': gpio_manager.debounce_time,
+        'actions': gpio_manager.get_action_stats()
     })
 
 @app.route('/api/gpio/set_pin', methods=['POST'])
@@ -334,52 +663,14 @@ def api_gpio_toggle_monitoring():
 def api_get_time_playlists():
     """API per ottenere le playlist configurate per le fasce orarie"""
     try:
-        # Leggi la configurazione dal file .env o usa valori di default
-        periods = []
-        
-        # Prova a leggere i periodi personalizzati
-        for i in range(1, 5):
-            start = os.getenv(f'TIME_PERIOD_{i}_START', '')
-            end = os.getenv(f'TIME_PERIOD_{i}_END', '')
-            playlist = os.getenv(f'TIME_PERIOD_{i}_PLAYLIST', '')
+        if not schedule_engine:
+            return jsonify({'error': 'Fasce orarie non inizializzate'}), 503
             
-            if start and end:
-                periods.append({
-                    'start': start,
-                    'end': end,
-                    'playlist': playlist
-                })
-        
-        # Se non ci sono periodi personalizzati, usa i valori di default
-        if not periods:
-            periods = [
-                {'start': '06:00', 'end': '12:00', 'playlist': os.getenv('PLAYLIST_MORNING', '')},
-                {'start': '12:00', 'end': '18:00', 'playlist': os.getenv('PLAYLIST_AFTERNOON', '')},
-                {'start': '18:00', 'end': '22:00', 'playlist': os.getenv('PLAYLIST_EVENING', '')},
-                {'start': '22:00', 'end': '06:00', 'playlist': os.getenv('PLAYLIST_NIGHT', '')}
-            ]
-        
-        # Determina il periodo corrente
-        current_period_index = 0
-        if gpio_manager:
-            current_period_index = gpio_manager._get_current_time_period_index()
-        else:
-            from datetime import datetime
-            current_hour = datetime.now().hour
-            for i, period in enumerate(periods):
-                start_hour = int(period['start'].split(':')[0])
-                end_hour = int(period['end'].split(':')[0])
-                
-                if start_hour <= end_hour:
-                    if start_hour <= current_hour < end_hour:
-                        current_period_index = i
-                        break
-                else:  # Periodo che attraversa la mezzanotte
-                    if current_hour >= start_hour or current_hour < end_hour:
-                        current_period_index = i
-                        break
+        # Periodi compilati dal motore (configurazione .env o valori di default)
+        periods = schedule_engine.get_periods()
+        current_period_index = schedule_engine.current_index()
         
-        return jsonify({
+        return conditional_json({
             'periods': periods,
             'current_period_index': current_period_index
         })
@@ -398,25 +689,29 @@ def api_set_time_playlists():
         # Aggiorna le variabili d'ambiente
         env_updates = {}
         
-        # Rimuovi le vecchie configurazioni
-        for i in range(1, 5):
-            env_updates[f'TIME_PERIOD_{i}_START'] = ''
-            env_updates[f'TIME_PERIOD_{i}_END'] = ''
-            env_updates[f'TIME_PERIOD_{i}_PLAYLIST'] = ''
+        # Rimuovi le vecchie configurazioni, comprese le righe del .env non caricate
+        # nell'ambiente (es. file modificato dopo l'avvio o chiavi vuote)
+        for key in set(os.environ) | read_env_file_keys():
+            if re.match(r'^TIME_PERIOD_\d+_(START|END|PLAYLIST|DAYS)$', key):
+                env_updates[key] = ''
         
-        # Aggiungi le nuove configurazioni
-        for i, period in enumerate(periods[:4], 1):  # Massimo 4 periodi
-            if period.get('start') and period.get('end'):
-                env_updates[f'TIME_PERIOD_{i}_START'] = period['start']
-                env_updates[f'TIME_PERIOD_{i}_END'] = period['end']
-                env_updates[f'TIME_PERIOD_{i}_PLAYLIST'] = period.get('playlist', '')
+        # Aggiungi le nuove configurazioni (nessun limite al numero di periodi)
+        valid_periods = [period for period in periods if period.get('start') and period.get('end')]
+        for i, period in enumerate(valid_periods, 1):
+            env_updates[f'TIME_PERIOD_{i}_START'] = period['start']
+            env_updates[f'TIME_PERIOD_{i}_END'] = period['end']
+            env_updates[f'TIME_PERIOD_{i}_PLAYLIST'] = period.get('playlist', '')
+            env_updates[f'TIME_PERIOD_{i}_DAYS'] = period.get('days', '')
         
         # Aggiorna il file .env
-        update_env_file(env_updates)
+        try:
+            update_env_file(env_updates)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Ricarica la configurazione nel GPIO manager se disponibile
-        if gpio_manager:
-            gpio_manager._load_time_periods()
+        # Ricompila le fasce orarie e riprogramma il timer dei confini
+        if schedule_engine:
+            schedule_engine.reload()
         
         return jsonify({'success': True, 'message': 'Playlist temporali aggiornate'})
         
@@ -432,8 +727,8 @@ def api_test_gpio_trigger():
         return jsonify({'success': False, 'error': 'GPIO non inizializzato'})
     
     try:
-        # Simula un trigger GPIO
-        gpio_manager._handle_gpio_trigger()
+        # Simula un trigger GPIO (passa dalla coda azioni come una pressione reale)
+        gpio_manager.enqueue_trigger()
         return jsonify({'success': True, 'message': 'Trigger GPIO simulato con successo'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -478,6 +773,7 @@ def get_spotify_config():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/spotify_config', methods=['POST'])
+@login_required
 def set_spotify_config():
     """Imposta la configurazione Spotify"""
     try:
@@ -501,7 +797,10 @@ def set_spotify_config():
             env_updates['SPOTIFY_CLIENT_SECRET'] = client_secret
         
         # Aggiorna il file .env
-        update_env_file(env_updates)
+        try:
+            update_env_file(env_updates)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
         message = 'Configurazione Spotify aggiornata.'
         if not client_secret:
@@ -513,7 +812,7 @@ def set_spotify_config():
             'message': message
         })
     except Exception as e:
-        logger.error(f"Errore nell'aggiornamento configurazione Spotify: {e}")
+        app.logger.error(f"Errore nell'aggiornamento configurazione Spotify: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/api/spotify/auth_url', methods=['GET'])
@@ -581,7 +880,7 @@ def reinitialize_spotify():
             success = spotify_manager.reinitialize_connection()
             if success:
                 # Aggiorna lo stato del sistema
-                system_status['spotify_connected'] = True
+                state_store.update(spotify_connected=True)
                 return jsonify({
                     'success': True,
                     'message': 'Connessione Spotify reinizializzata con successo'
@@ -612,7 +911,7 @@ def disconnect_spotify():
             success = spotify_manager.disconnect_spotify()
             if success:
                 # Aggiorna lo stato del sistema
-                system_status['spotify_connected'] = False
+                state_store.update(spotify_connected=False)
                 return jsonify({
                     'success': True,
                     'message': 'Spotify disconnesso con successo. Ricarica la pagina per riautorizzare.'
@@ -690,49 +989,65 @@ def logo_status():
     try:
         for filename in os.listdir(app.config['UPLOAD_FOLDER']):
             if filename.startswith('custom_logo.'):
-                return jsonify({
+                return conditional_json({
                     'has_logo': True,
                     'logo_url': f'/static/uploads/{filename}'
                 })
         
-        return jsonify({'has_logo': False})
+        return conditional_json({'has_logo': False})
     
     except Exception as e:
         app.logger.error(f"Errore verifica logo: {e}")
         return jsonify({'has_logo': False, 'error': str(e)})
 
 def update_system_status():
-    """Aggiorna lo stato del sistema"""
-    global system_status
-    
-    system_status['last_activity'] = datetime.now().strftime('%H:%M:%S')
+    """Ricalcola lo stato e pubblica un nuovo snapshot se è cambiato"""
+    changes = {
+        'current_track': None,
+        'is_playing': False
+    }
     
     if spotify_manager:
         try:
-            current_playback = spotify_manager.get_current_playback()
+            # Legge lo snapshot condiviso del poller, senza chiamate a Spotify
+            snapshot = spotify_manager.playback_poller.get_snapshot()
+            current_playback = snapshot['playback']
+            changes['playback_version'] = snapshot['version']
             if current_playback:
-                system_status['current_track'] = {
-                    'name': current_playback.get('name'),
-                    'artist': current_playback.get('artist'),
-                    'album_image': current_playback.get('album_image'),
+                changes.update({
+                    'current_track': {
+                        'name': current_playback.get('name'),
+                        'artist': current_playback.get('artist'),
+                        'album_image': current_playback.get('album_image'),
+                        'is_playing': current_playback.get('is_playing', False),
+                        'progress_ms': current_playback.get('progress_ms', 0),
+                        'duration_ms': current_playback.get('duration_ms', 0)
+                    },
                     'is_playing': current_playback.get('is_playing', False),
-                    'progress_ms': current_playback.get('progress_ms', 0),
-                    'duration_ms': current_playback.get('duration_ms', 0)
-                }
-            else:
-                system_status['current_track'] = None
+                    'volume': current_playback.get('volume'),
+                    'device': current_playback.get('device')
+                })
         except Exception as e:
             logging.error(f"Errore nell'aggiornamento stato: {e}")
-            system_status['current_track'] = None
     
     if gpio_manager:
-        system_status['gpio_monitoring'] = gpio_manager.is_monitoring
-        system_status['gpio_status'] = gpio_manager.get_pin_state()
-        system_status['gpio_pin'] = gpio_manager.gpio_pin
+        changes.update({
+            'gpio_monitoring': gpio_manager.is_monitoring,
+            'gpio_status': gpio_manager.get_pin_state(),
+            'gpio_pin': gpio_manager.gpio_pin
+        })
     else:
-        system_status['gpio_monitoring'] = False
-        system_status['gpio_status'] = False
-        system_status['gpio_pin'] = 'N/A'
+        changes.update({
+            'gpio_monitoring': False,
+            'gpio_status': False,
+            'gpio_pin': 'N/A'
+        })
+        
+    # last_activity indica l'ultima variazione effettiva dello stato
+    current = state_store.get()
+    if any(current.get(key) != freeze(value) for key, value in changes.items()):
+        changes['last_activity'] = datetime.now().strftime('%H:%M:%S')
+        state_store.update(**changes)
 
 if __name__ == '__main__':
     # Configura logging
@@ -744,8 +1059,15 @@ if __name__ == '__main__':
     # Inizializza i manager
     init_managers()
     
-    # Avvia l'app Flask
-    host = os.getenv('WEB_HOST', '0.0.0.0')
-    port = int(os.getenv('WEB_PORT', 5000))
+    # Avvia il server web (waitress in produzione, Flask come fallback)
+    from web_server import WebServer
+    from service_registry import services
     
-    app.run(host=host, port=port, debug=False)
\ No newline at end of file
+    web_server = WebServer(app)
+    web_server.start()
+    try:
+        web_server.server_thread.join()
+    except KeyboardInterrupt:
+        status_events.close()
+        web_server.stop()
+        services.shutdown()
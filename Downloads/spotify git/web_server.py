@@ -0,0 +1,137 @@
+import os
+import threading
+import logging
+from typing import Callable, Optional
+
+# Server WSGI di produzione (opzionale): senza waitress si usa il server di sviluppo Flask
+try:
+    from waitress import wasyncore
+    from waitress.server import create_server, BaseWSGIServer
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
+    create_server = None
+
+
+class _ClosingIterator:
+    """Risposta WSGI che segnala la fine della richiesta alla chiusura"""
+
+    def __init__(self, iterable, on_close: Callable[[], None]):
+        self._iterable = iterable
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._on_close()
+
+
+class WebServer:
+    """Server dell'interfaccia web
+
+    In modalità produzione (WEB_SERVER=waitress) l'app gira su waitress con un
+    pool di thread, timeout e limite di connessioni configurabili; allo
+    shutdown smette di accettare connessioni e attende le richieste in corso.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.host = os.getenv('WEB_HOST', '0.0.0.0')
+        self.port = int(os.getenv('WEB_PORT', 5000))
+        self.mode = os.getenv('WEB_SERVER', 'waitress').lower()
+        # Ogni flusso /api/events occupa un thread: SSE_MAX_CLIENTS (default
+        # WEB_THREADS - 4) lascia thread liberi per le altre richieste
+        self.threads = int(os.getenv('WEB_THREADS', 8))
+        # Chiusura delle connessioni keep-alive inattive
+        self.channel_timeout = int(os.getenv('WEB_CHANNEL_TIMEOUT', 60))
+        self.connection_limit = int(os.getenv('WEB_CONNECTION_LIMIT', 100))
+        self.drain_timeout = float(os.getenv('WEB_DRAIN_TIMEOUT', 10))
+
+        self.server = None
+        self.server_thread = None
+        self.in_flight = 0
+        self.draining = False
+        self._condition = threading.Condition()
+
+    def _wsgi_app(self, environ, start_response):
+        """Conta le richieste in corso e rifiuta quelle nuove durante il drain"""
+        if self.draining:
+            start_response('503 Service Unavailable', [('Content-Type', 'text/plain'), ('Connection', 'close')])
+            return [b'Server in arresto']
+
+        with self._condition:
+            self.in_flight += 1
+        try:
+            return _ClosingIterator(self.app(environ, start_response), self._request_done)
+        except Exception:
+            self._request_done()
+            raise
+
+    def _request_done(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def start(self):
+        """Avvia il server in un thread separato"""
+        if self.mode == 'waitress' and not WAITRESS_AVAILABLE:
+            logging.warning("waitress non installato: uso il server di sviluppo Flask")
+            self.mode = 'flask'
+
+        if self.mode == 'waitress':
+            self.server = create_server(
+                self._wsgi_app,
+                host=self.host,
+                port=self.port,
+                threads=self.threads,
+                channel_timeout=self.channel_timeout,
+                connection_limit=self.connection_limit,
+                ident='SpotifyPi'
+            )
+            target = self.server.run
+            logging.info(f"Server waitress su {self.host}:{self.port} ({self.threads} thread)")
+        else:
+            target = lambda: self.app.run(host=self.host, port=self.port, debug=False,
+                                          use_reloader=False, threaded=True)
+            logging.info(f"Server di sviluppo Flask su {self.host}:{self.port}")
+
+        self.server_thread = threading.Thread(target=target, daemon=True)
+        self.server_thread.start()
+
+    def _server_map(self) -> dict:
+        return getattr(self.server, 'map', None) or getattr(self.server, '_map', {})
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Arresto controllato: attende la fine delle richieste in corso"""
+        if self.server is None:
+            # Il server di sviluppo termina con il processo
+            return True
+
+        if timeout is None:
+            timeout = self.drain_timeout
+
+        # Smette di accettare nuove connessioni
+        self.draining = True
+        for dispatcher in list(self._server_map().values()):
+            if isinstance(dispatcher, BaseWSGIServer):
+                dispatcher.accepting = False
+
+        with self._condition:
+            drained = self._condition.wait_for(lambda: self.in_flight == 0, timeout=timeout)
+        if drained:
+            logging.info("Richieste web in corso completate")
+        else:
+            logging.warning(f"Timeout drain: {self.in_flight} richieste web ancora in corso")
+
+        self.server.task_dispatcher.shutdown(cancel_pending=True, timeout=1)
+        wasyncore.close_all(self._server_map())
+        if self.server_thread:
+            self.server_thread.join(timeout=1)
+        self.server = None
+        logging.info("Server web fermato")
+        return drained